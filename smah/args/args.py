@@ -1,6 +1,7 @@
 import argparse
 import sys
 import logging
+from typing import Optional
 
 def merge_args(args: argparse.Namespace, config: dict) -> argparse.Namespace:
     """
@@ -18,10 +19,13 @@ def merge_args(args: argparse.Namespace, config: dict) -> argparse.Namespace:
             setattr(args, key, value)
     return args
 
-def extract_args() -> tuple[argparse.Namespace, str | None]:
+def extract_args(argv: Optional[list[str]] = None) -> tuple[argparse.Namespace, str | None]:
     """
     Parses and extracts command-line arguments for the SMAH CLI tool.
 
+    Args:
+        argv (Optional[list[str]]): Arguments to parse, defaults to sys.argv.
+
     Returns:
         parser (ArgumentParser): The argument parser with configured options.
         args (Namespace): Parsed arguments and options.
@@ -31,7 +35,8 @@ def extract_args() -> tuple[argparse.Namespace, str | None]:
     __add_general_arguments(parser)
     __add_ai_arguments(parser)
     __add_gui_arguments(parser)
-    a = parser.parse_args()
+    __add_daemon_arguments(parser)
+    a = parser.parse_args(argv)
     return a, __get_pipe()
 
 def __initialize_argument_parser():
@@ -62,7 +67,13 @@ def __add_general_arguments(parser: argparse.ArgumentParser) -> None:
     parser.add_argument('--configure', action=argparse.BooleanOptionalAction, help='Enter Config Setup', default=False)
     parser.add_argument('--continue', dest="resume", action=argparse.BooleanOptionalAction, help='Continue Last Conversation', default=False)
     parser.add_argument('--session', type=int, help='Resume Session')
+    parser.add_argument('--fork', type=int, help='Branch a session and continue the new branch')
     parser.add_argument('--history', action=argparse.BooleanOptionalAction, help='Resume Recent Session', default=False)
+    parser.add_argument('--resume-turns', type=int, help='Number of recent turns shown when resuming a session')
+    parser.add_argument('--page', type=int, help='Number of sessions per --history page')
+    parser.add_argument('--before', type=int, help='Start --history at sessions older than this session id')
+    parser.add_argument('--after', type=int, help='Start --history at sessions newer than this session id')
+    parser.add_argument('--search', type=str, help='Search conversation history and resume a matching session')
     parser.add_argument('-v', '--verbose', action='count', default=0, help="Set Verbosity Level, such as -vv")
 
 def __add_ai_arguments(parser: argparse.ArgumentParser) -> None:
@@ -84,6 +95,10 @@ def __add_ai_arguments(parser: argparse.ArgumentParser) -> None:
     parser.add_argument('--openai-api-key', type=str, help='OpenAI Api Key')
     parser.add_argument('--openai-api-org', type=str, help='OpenAI Api Org')
 
+    parser.add_argument('--transport', type=str, choices=['passthrough', 'record', 'replay'], help='Provider transport: passthrough, record to or replay from --cassette', default='passthrough')
+    parser.add_argument('--cassette', type=str, help='Path to record/replay cassette file')
+    parser.add_argument('--replay-speed', type=float, help='Replay speed multiplier, 0 replays instantly', default=1.0)
+
 def __add_gui_arguments(parser: argparse.ArgumentParser) -> None:
     """
     Add GUI-related command-line arguments to the parser.
@@ -92,7 +107,18 @@ def __add_gui_arguments(parser: argparse.ArgumentParser) -> None:
         parser (ArgumentParser): The argument parser to which GUI-related arguments are added.
     """
     parser.add_argument('--gui', action=argparse.BooleanOptionalAction, help='Run in GUI mode', default=False)
-    parser.add_argument('--rich', action=argparse.BooleanOptionalAction, help='Rich Format Output', default=True)
+    parser.add_argument('--rich', action=argparse.BooleanOptionalAction, help='Rich Format Output (default: when stdout is a terminal)', default=None)
+    parser.add_argument('--pager', action=argparse.BooleanOptionalAction, help='Stream interactive session responses into a pager instead of the terminal', default=None)
+
+def __add_daemon_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add daemon-related command-line arguments to the parser.
+
+    Args:
+        parser (ArgumentParser): The argument parser to which daemon arguments are added.
+    """
+    parser.add_argument('--daemon', action=argparse.BooleanOptionalAction, help='Run as a background server accepting requests over a unix socket', default=False)
+    parser.add_argument('--daemon-socket', type=str, help='Path to smah daemon unix socket')
 
 def __get_pipe():
     """
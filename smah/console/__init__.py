@@ -1,4 +1,19 @@
 # smah/console/__init__.py
-from .console import std_console, err_console, prompt_choice, prompt_string
+from .output import LazyConsole, RawOutput
 
-__all__ = ['std_console', 'err_console', 'prompt_choice', 'prompt_string']
\ No newline at end of file
+# Rich is imported when a console or prompt is first used, see LazyConsole.
+std_console = LazyConsole("std_console")
+err_console = LazyConsole("err_console")
+
+
+def prompt_string(*args, **kwargs) -> str:
+    from .console import prompt_string
+    return prompt_string(*args, **kwargs)
+
+
+def prompt_choice(*args, **kwargs) -> str:
+    from .console import prompt_choice
+    return prompt_choice(*args, **kwargs)
+
+
+__all__ = ['std_console', 'err_console', 'prompt_choice', 'prompt_string', 'LazyConsole', 'RawOutput']
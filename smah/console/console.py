@@ -6,16 +6,26 @@ import textwrap
 from rich.markdown import Markdown
 from rich.markdown import MarkdownElement
 from rich.prompt import Prompt, Confirm
-from typing import Optional, Union
+from typing import Mapping, Optional, Union
 
 from rich.segment import Segment
 from rich.style import Style
 
+def create_console(name: str, environ: Optional[Mapping[str, str]] = None) -> Console:
+    """
+    Creates the standard ("std_console") or error ("err_console") console.
+
+    Args:
+        environ (Optional[Mapping[str, str]]): Environment to size and color the console from
+            (COLUMNS, TERM, NO_COLOR, ...), defaults to the process environment.
+    """
+    return Console(legacy_windows=False, stderr=name == "err_console", _environ=environ)
+
 # Initialize standard console for general output
-std_console: Console = Console(legacy_windows=False)
+std_console: Console = create_console("std_console")
 
 # Initialize error console for error output
-err_console: Console = Console(legacy_windows=False, stderr=True)
+err_console: Console = create_console("err_console")
 
 def prompt_string(
         field: str,
@@ -0,0 +1,86 @@
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Optional, TextIO
+
+
+class LazyConsole:
+    """
+    Stand-in for one of the rich consoles in `smah.console.console`.
+
+    The console (and rich) is imported on first use, so invocations that only write raw output,
+    such as smah in the middle of a shell pipeline, never load rich at all.
+
+    Inside `scoped` the calling thread gets consoles of its own instead, so each daemon request
+    renders for its client's terminal (width, color support, NO_COLOR).
+    """
+    local = threading.local()
+
+    @staticmethod
+    @contextmanager
+    def scoped():
+        """
+        Gives the calling thread its own consoles for the duration of the block, created on first use
+        from the thread's streams and environment.
+        """
+        previous = getattr(LazyConsole.local, "consoles", None)
+        LazyConsole.local.consoles = {}
+        try:
+            yield
+        finally:
+            LazyConsole.local.consoles = previous
+
+    def __init__(self, console: str):
+        self.console = console
+
+    def resolve(self):
+        from smah.console import console
+        consoles = getattr(LazyConsole.local, "consoles", None)
+        if consoles is None:
+            return getattr(console, self.console)
+        if self.console not in consoles:
+            consoles[self.console] = console.create_console(self.console, environ=os.environ.copy())
+        return consoles[self.console]
+
+    def __getattr__(self, name: str):
+        return getattr(self.resolve(), name)
+
+
+class RawOutput:
+    """
+    Unformatted output for non-interactive stdout.
+
+    When stdout is not a terminal the text is the product, so it is written unchanged as UTF-8
+    through stdout's buffered binary writer: no markup, wrapping or escape codes for downstream
+    tools to trip over.
+    """
+
+    @staticmethod
+    def interactive(stream: Optional[TextIO] = None) -> bool:
+        """
+        Checks if a stream (stdout by default) is a terminal.
+        """
+        stream = stream or sys.stdout
+        try:
+            return stream.isatty()
+        except (AttributeError, ValueError):
+            return False
+
+    @staticmethod
+    def write(text: str, stream: Optional[TextIO] = None) -> None:
+        stream = stream or sys.stdout
+        buffer = getattr(stream, "buffer", None)
+        if buffer is None:
+            # Daemon client streams and test captures are text only.
+            stream.write(text)
+            return
+        # Text already written through the text layer goes first.
+        stream.flush()
+        buffer.write(text.encode("utf-8", "surrogateescape"))
+
+    @staticmethod
+    def flush(stream: Optional[TextIO] = None) -> None:
+        stream = stream or sys.stdout
+        buffer = getattr(stream, "buffer", None)
+        (buffer or stream).flush()
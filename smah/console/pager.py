@@ -0,0 +1,357 @@
+import io
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from smah.runner.response_parser import StreamingParser
+
+
+class Pager:
+    """
+    Full screen pager for long responses, rendered lazily a viewport at a time.
+
+    The response is split into markdown blocks (paragraphs, code fences and rendered exec blocks)
+    as it streams in. A block is rendered with rich only when it scrolls into view, and rendered
+    lines are kept for the last CACHE_BLOCKS blocks at the current width: memory holds the response
+    text plus what is on screen and a small cache, however long the response is.
+
+    `feed` can be called from another thread while the pager runs, so the response can be read,
+    searched and scrolled while it is still streaming in.
+
+    Keys:
+        j/k, arrows: scroll a line; space/b, page down/up: scroll a page; g/G: top/end (G follows
+        the stream); /: search, n/N: next/previous match; e/E: next/previous exec block; q, ctrl-c: quit.
+    """
+    CACHE_BLOCKS = 64
+    ANSI_PATTERN = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+    # Paragraph breaks and code fence markers, scanned once each as text arrives.
+    SCAN_PATTERN = re.compile(r"\n\s*\n|" + re.escape(StreamingParser.FENCE))
+
+    def __init__(self, title: str = "", strip_cot: bool = True, color_system: Optional[str] = "256"):
+        self.title = title
+        self.color_system = color_system
+        # Commands are confirmed once the pager closes, not evaluated while it draws.
+        self.parser = StreamingParser(strip_cot=strip_cot, evaluate=False)
+        self.lock = threading.RLock()
+        self.blocks: list = []
+        self.tail = ""
+        # Scan state of the tail: offset scanned up to, whether that offset is inside a code fence,
+        # and the paragraph breaks found outside fences.
+        self.scanned = 0
+        self.fenced = False
+        self.breaks: list = []
+        # Offsets in the tail where rendered exec blocks start.
+        self.exec_marks: list = []
+        self.cache: OrderedDict = OrderedDict()
+        self.done = False
+        self.width = 80
+        self.height = 24
+        self.top: Tuple[int, int] = (0, 0)
+        self.follow = False
+        self.term: Optional[str] = None
+        self.searching: Optional[str] = None
+        self.message = ""
+        self.app = None
+
+    @property
+    def response(self) -> str:
+        return self.parser.response
+
+    def feed(self, delta: Optional[str]) -> None:
+        """
+        Adds a streamed text delta.
+        """
+        with self.lock:
+            for event in self.parser.feed(delta):
+                if event['type'] == 'markdown':
+                    self.add(event['content'], event.get('exec', False))
+        self.refresh()
+
+    def close(self) -> None:
+        """
+        Ends the stream, the remaining text becomes the last blocks.
+        """
+        with self.lock:
+            for event in self.parser.close():
+                if event['type'] == 'markdown':
+                    self.add(event['content'], event.get('exec', False))
+            self.split(len(self.tail))
+            self.done = True
+        self.refresh()
+
+    def refresh(self) -> None:
+        if self.app is not None:
+            self.app.invalidate()
+
+    def add(self, markdown: str, exec: bool = False) -> None:
+        if exec:
+            self.exec_marks.append(len(self.tail))
+        self.tail += markdown
+        # Only the new text is scanned, except for trailing whitespace or backticks that may still
+        # become part of a break or fence.
+        last = self.scanned
+        for match in self.SCAN_PATTERN.finditer(self.tail, self.scanned):
+            if match.group(0) == StreamingParser.FENCE:
+                self.fenced = not self.fenced
+            elif not self.fenced:
+                self.breaks.append(match.end())
+            last = match.end()
+        end = len(self.tail)
+        while end > last and self.tail[end - 1] in " \t\r\n`":
+            end -= 1
+        self.scanned = end
+        if self.breaks:
+            self.split(self.breaks[-1])
+
+    def split(self, cut: int) -> None:
+        """
+        Moves complete paragraphs, up to `cut`, from the tail into blocks.
+        """
+        text, self.tail = self.tail[:cut], self.tail[cut:]
+        start = 0
+        for end in [b for b in self.breaks if b < cut] + [cut]:
+            if text[start:end].strip():
+                exec = any(start <= mark < end for mark in self.exec_marks)
+                self.blocks.append({'markdown': text[start:end], 'exec': exec})
+            start = end
+        self.breaks = [b - cut for b in self.breaks if b > cut]
+        self.exec_marks = [mark - cut for mark in self.exec_marks if mark >= cut]
+        self.scanned = max(self.scanned - cut, 0)
+
+    def render(self, markdown: str) -> list:
+        from rich.console import Console
+        from rich.markdown import Markdown
+        console = Console(
+            file=io.StringIO(),
+            width=self.width,
+            force_terminal=True,
+            color_system=self.color_system,
+            legacy_windows=False
+        )
+        console.print(Markdown(markdown, style="white"))
+        return console.file.getvalue().rstrip("\n").split("\n") + [""]
+
+    def lines(self, index: int) -> list:
+        """
+        Rendered lines of a block, the block after the last is the unfinished tail.
+        """
+        if index >= len(self.blocks):
+            lines = self.render(self.tail) if self.tail.strip() else []
+            # The stream's unparsed remainder (e.g. an unfinished exec block) is shown as is.
+            return lines + self.parser.buffer.split("\n") if self.parser.buffer else lines
+        key = (index, self.width)
+        lines = self.cache.get(key)
+        if lines is None:
+            lines = self.render(self.blocks[index]['markdown'])
+            self.cache[key] = lines
+            while len(self.cache) > self.CACHE_BLOCKS:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(key)
+        return lines
+
+    def resize(self, width: int, height: int) -> None:
+        with self.lock:
+            if width != self.width:
+                self.cache.clear()
+            self.width, self.height = width, max(1, height)
+
+    def end(self) -> Tuple[int, int]:
+        """
+        Position showing the last page.
+        """
+        remaining = self.height
+        index = len(self.blocks)
+        while index >= 0:
+            count = len(self.lines(index))
+            if count >= remaining:
+                return index, count - remaining
+            remaining -= count
+            index -= 1
+        return 0, 0
+
+    def overflows(self, screens: int = 1) -> bool:
+        """
+        Checks if the response is longer than a number of screens, rendering no more than that.
+        """
+        with self.lock:
+            remaining = screens * self.height
+            for index in range(len(self.blocks) + 1):
+                remaining -= len(self.lines(index))
+                if remaining < 0:
+                    return True
+            return False
+
+    def view(self) -> list:
+        """
+        Rendered lines on screen.
+        """
+        with self.lock:
+            if self.follow:
+                self.top = self.end()
+            index, offset = self.top
+            lines: list = []
+            while len(lines) < self.height and index <= len(self.blocks):
+                lines.extend(self.lines(index)[offset:])
+                index, offset = index + 1, 0
+            return lines[:self.height]
+
+    def scroll(self, count: int) -> None:
+        with self.lock:
+            self.follow = False
+            index, offset = self.top
+            offset += count
+            while offset < 0 and index > 0:
+                index -= 1
+                offset += len(self.lines(index))
+            offset = max(offset, 0)
+            while index < len(self.blocks) and offset >= len(self.lines(index)):
+                offset -= len(self.lines(index))
+                index += 1
+            self.top = min((index, offset), self.end())
+
+    def jump(self, end: bool) -> None:
+        with self.lock:
+            self.follow = end
+            self.top = self.end() if end else (0, 0)
+
+    def jump_exec(self, forward: bool = True) -> bool:
+        """
+        Moves to the next (or previous) exec block.
+        """
+        with self.lock:
+            index, offset = self.top
+            order = range(index + 1, len(self.blocks)) if forward else range(index - (offset == 0), -1, -1)
+            for i in order:
+                if self.blocks[i]['exec']:
+                    self.follow = False
+                    self.top = min((i, 0), self.end())
+                    return True
+            self.message = "No more exec blocks" + ("" if self.done else " yet")
+            return False
+
+    def plain(self, line: str) -> str:
+        return self.ANSI_PATTERN.sub("", line)
+
+    def search(self, term: Optional[str] = None, forward: bool = True) -> bool:
+        """
+        Moves to the next (or previous) line matching a term, case insensitive. Blocks are matched
+        on their markdown source and only matching blocks are rendered.
+        """
+        with self.lock:
+            self.term = term or self.term
+            if not self.term:
+                return False
+            needle = self.term.lower()
+            index, offset = self.top
+            order = range(index, len(self.blocks) + 1) if forward else range(index, -1, -1)
+            for i in order:
+                source = self.blocks[i]['markdown'] if i < len(self.blocks) else self.tail + self.parser.buffer
+                if needle not in source.lower():
+                    continue
+                lines = [self.plain(line).lower() for line in self.lines(i)]
+                if forward:
+                    rows = range(offset + 1 if i == index else 0, len(lines))
+                else:
+                    rows = range((offset if i == index else len(lines)) - 1, -1, -1)
+                row = next((r for r in rows if needle in lines[r]), None)
+                if row is None and i != index:
+                    # Matched in markup the rendering does not show verbatim.
+                    row = 0
+                if row is not None:
+                    self.follow = False
+                    self.top = min((i, row), self.end())
+                    return True
+            self.message = f"Pattern not found: {self.term}"
+            return False
+
+    def status(self) -> str:
+        if self.searching is not None:
+            return f"/{self.searching}"
+        if self.message:
+            return f" {self.message}"
+        state = "following" if self.follow else ("end" if self.done else "streaming")
+        index, _ = self.top
+        return f" {self.title}  block {min(index + 1, len(self.blocks) or 1)}/{len(self.blocks) or 1} ({state})  q:quit /:search n/N e/E:exec"
+
+    def application(self, input=None, output=None):
+        from prompt_toolkit import Application
+        from prompt_toolkit.filters import Condition
+        from prompt_toolkit.formatted_text import ANSI
+        from prompt_toolkit.key_binding import KeyBindings
+        from prompt_toolkit.layout import HSplit, Layout, Window
+        from prompt_toolkit.layout.controls import FormattedTextControl
+
+        bindings = KeyBindings()
+        searching = Condition(lambda: self.searching is not None)
+        browsing = ~searching
+
+        def viewport():
+            size = self.app.output.get_size()
+            self.resize(size.columns, size.rows - 1)
+            return ANSI("\n".join(self.view()))
+
+        def key(*keys, filter=browsing):
+            def register(action):
+                @bindings.add(*keys, filter=filter)
+                def _(event):
+                    self.message = ""
+                    action(event)
+                return action
+            return register
+
+        @key("q")
+        @key("c-c")
+        def quit(event):
+            event.app.exit()
+
+        for keys, count in ((("j",), 1), (("down",), 1), (("enter",), 1), (("k",), -1), (("up",), -1)):
+            key(*keys)(lambda event, count=count: self.scroll(count))
+        for keys, pages in ((("space",), 1), (("pagedown",), 1), (("f",), 1), (("b",), -1), (("pageup",), -1)):
+            key(*keys)(lambda event, pages=pages: self.scroll(pages * self.height))
+        key("g")(lambda event: self.jump(False))
+        key("home")(lambda event: self.jump(False))
+        key("G")(lambda event: self.jump(True))
+        key("end")(lambda event: self.jump(True))
+        key("n")(lambda event: self.search(forward=True))
+        key("N")(lambda event: self.search(forward=False))
+        key("e")(lambda event: self.jump_exec(forward=True))
+        key("E")(lambda event: self.jump_exec(forward=False))
+
+        @key("/")
+        def start_search(event):
+            self.searching = ""
+
+        @key("<any>", filter=searching)
+        def type_search(event):
+            self.searching += event.data
+
+        @key("backspace", filter=searching)
+        def erase_search(event):
+            self.searching = self.searching[:-1]
+
+        @key("enter", filter=searching)
+        def commit_search(event):
+            term, self.searching = self.searching, None
+            self.search(term or None, forward=True)
+
+        @key("escape", filter=searching)
+        def cancel_search(event):
+            self.searching = None
+
+        layout = Layout(HSplit([
+            Window(FormattedTextControl(viewport), wrap_lines=False),
+            Window(FormattedTextControl(lambda: [("reverse", self.status())]), height=1, style="reverse"),
+        ]))
+        self.app = Application(layout=layout, key_bindings=bindings, full_screen=True, input=input, output=output)
+        return self.app
+
+    def run(self, input=None, output=None) -> None:
+        """
+        Shows the pager until the user quits, `feed` may keep adding to it meanwhile.
+        """
+        try:
+            self.application(input=input, output=output).run()
+        finally:
+            self.app = None
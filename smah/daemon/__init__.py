@@ -0,0 +1,5 @@
+# smah/daemon/__init__.py
+from .daemon import Daemon
+from .client import forward, connect
+
+__all__ = ['Daemon', 'forward', 'connect']
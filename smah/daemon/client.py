@@ -0,0 +1,144 @@
+"""
+Thin `smah` entry point.
+
+Forwards the invocation to a running `smah --daemon` over its unix socket and streams the output
+back. Only standard library modules are imported on this path so a forwarded call costs a few
+milliseconds. When no daemon is running the invocation is executed in-process as before.
+"""
+import os
+import socket
+import subprocess
+import sys
+from typing import Optional
+
+from smah.daemon.daemon import Daemon
+from smah.daemon.protocol import send, receive
+
+
+def socket_path(argv: list[str]) -> str:
+    """
+    Extracts the daemon socket path from raw arguments without a full parse.
+
+    Args:
+        argv (list[str]): The raw command line arguments.
+
+    Returns:
+        str: The socket path.
+    """
+    for i, arg in enumerate(argv):
+        if arg == "--daemon-socket" and i + 1 < len(argv):
+            return argv[i + 1]
+        if arg.startswith("--daemon-socket="):
+            return arg.split("=", 1)[1]
+    return Daemon.default_socket()
+
+
+def connect(path: str) -> Optional[socket.socket]:
+    """
+    Connects to the daemon socket.
+
+    Args:
+        path (str): The socket path.
+
+    Returns:
+        Optional[socket.socket]: The connection, or None if no daemon is listening.
+    """
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return None
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+        return connection
+    except OSError:
+        connection.close()
+        return None
+
+
+def environment() -> dict:
+    """
+    The client's environment, forwarded with each request.
+
+    Includes the terminal size when stdout is a terminal: shells rarely export COLUMNS and LINES,
+    and the daemon cannot measure the client's terminal.
+
+    Returns:
+        dict: The environment variables.
+    """
+    environ = dict(os.environ)
+    if sys.stdout.isatty():
+        try:
+            size = os.get_terminal_size(sys.stdout.fileno())
+            environ.setdefault("COLUMNS", str(size.columns))
+            environ.setdefault("LINES", str(size.lines))
+        except OSError:
+            pass
+    return environ
+
+
+def forward(connection: socket.socket, argv: list[str]) -> int:
+    """
+    Forwards an invocation to the daemon and relays its frames until it exits.
+
+    Args:
+        connection (socket.socket): Connection to the daemon.
+        argv (list[str]): The raw command line arguments.
+
+    Returns:
+        int: The invocation's exit code.
+    """
+    rfile = connection.makefile("rb")
+    wfile = connection.makefile("wb")
+    stdin_tty = sys.stdin.isatty()
+    send(wfile, {
+        "type": "request",
+        "argv": argv,
+        "cwd": os.getcwd(),
+        "env": environment(),
+        "stdin": None if stdin_tty else sys.stdin.read(),
+        "tty": {
+            "stdin": stdin_tty,
+            "stdout": sys.stdout.isatty(),
+            "stderr": sys.stderr.isatty(),
+        }
+    })
+    try:
+        while True:
+            frame = receive(rfile)
+            if frame is None:
+                sys.stderr.write("smah: daemon closed connection\n")
+                return 1
+            kind = frame.get("type")
+            if kind == "stdout":
+                sys.stdout.write(frame["data"])
+                sys.stdout.flush()
+            elif kind == "stderr":
+                sys.stderr.write(frame["data"])
+                sys.stderr.flush()
+            elif kind == "readline":
+                send(wfile, {"type": "line", "data": sys.stdin.readline()})
+            elif kind == "exec":
+                # This is dangerous, the command was confirmed by the user on the daemon's prompt.
+                outcome = subprocess.run(frame["command"], shell=True, cwd=frame.get("cwd"))
+                send(wfile, {"type": "exec-result", "returncode": outcome.returncode})
+            elif kind == "exit":
+                return frame.get("code") or 0
+    finally:
+        rfile.close()
+        wfile.close()
+        connection.close()
+
+
+def main():
+    argv = sys.argv[1:]
+    connection = None
+    if "--daemon" not in argv:
+        connection = connect(socket_path(argv))
+    if connection is None:
+        from smah.smah import main as run
+        run()
+        return
+    exit(forward(connection, argv))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import logging
+import os
+import signal
+import socket
+import socketserver
+import traceback
+from typing import Optional
+
+from smah.console.output import LazyConsole
+from smah.daemon.environ import RoutedEnviron
+from smah.daemon.protocol import send, receive
+from smah.daemon.streams import RoutedStream, ClientOutput, ClientInput
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, daemon: "Daemon"):
+        self.smah_daemon = daemon
+        super().__init__(path, DaemonRequestHandler)
+
+
+class DaemonRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.smah_daemon.handle(self.rfile, self.wfile)
+
+
+class Daemon:
+    """
+    Long running smah server.
+
+    Keeps the interpreter, imported modules, loaded settings (and their warm stats), migrated
+    databases and pooled provider clients alive between invocations. Each client connection is
+    one smah invocation; its argv, environment and stdin are forwarded by the thin client and all
+    output is streamed back as it is written.
+    """
+    DEFAULT_SOCKET = os.path.expanduser("~/.smah/smahd.sock")
+
+    # Path arguments resolved against the client's working directory.
+    PATH_ARGUMENTS = ["instructions", "config", "database", "cassette"]
+
+    @staticmethod
+    def default_socket() -> str:
+        return os.environ.get("SMAH_DAEMON_SOCKET") or Daemon.DEFAULT_SOCKET
+
+    @staticmethod
+    def running(path: str) -> bool:
+        """
+        Checks if a daemon is accepting connections on the given socket.
+        """
+        if not os.path.exists(path):
+            return False
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            return True
+        except OSError:
+            return False
+        finally:
+            probe.close()
+
+    def __init__(self, args):
+        self.args = args
+        self.socket: str = args.daemon_socket or self.default_socket()
+        self.environ: Optional[RoutedEnviron] = None
+        self.stdin: Optional[RoutedStream] = None
+        self.stdout: Optional[RoutedStream] = None
+        self.stderr: Optional[RoutedStream] = None
+
+    def serve(self) -> None:
+        """
+        Binds the unix socket and serves requests until interrupted.
+        """
+        # Imported here rather than at module level: the cli module depends on this one,
+        # and importing it once up front is what keeps later requests warm.
+        import smah.smah
+        from smah.database import Database
+
+        # Many clients write through one connection, commit their history in groups.
+        Database.group_commit(True)
+
+        if self.running(self.socket):
+            logging.error(f"[DAEMON] already running on {self.socket}")
+            exit(1)
+        if os.path.exists(self.socket):
+            os.unlink(self.socket)
+        os.makedirs(os.path.dirname(self.socket) or ".", mode=0o700, exist_ok=True)
+
+        self.environ = RoutedEnviron.install()
+        self.stdin = RoutedStream.install("stdin")
+        self.stdout = RoutedStream.install("stdout")
+        self.stderr = RoutedStream.install("stderr")
+
+        def terminate(signum, frame):
+            raise KeyboardInterrupt()
+        signal.signal(signal.SIGTERM, terminate)
+
+        # The socket runs commands as this user: it is created owner only, a chmod after binding
+        # would leave a window where other local users could connect.
+        umask = os.umask(0o077)
+        try:
+            server = DaemonServer(self.socket, self)
+        finally:
+            os.umask(umask)
+        logging.warning(f"[DAEMON] listening on {self.socket}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if os.path.exists(self.socket):
+                os.unlink(self.socket)
+
+    def resolve_paths(self, args, cwd: Optional[str]) -> None:
+        """
+        Resolves relative path arguments against the client's working directory.
+        """
+        if not cwd:
+            return
+        for key in self.PATH_ARGUMENTS:
+            value = getattr(args, key, None)
+            if value and not os.path.isabs(os.path.expanduser(value)):
+                setattr(args, key, os.path.join(cwd, value))
+
+    def handle(self, rfile, wfile) -> None:
+        """
+        Runs a single forwarded invocation.
+
+        Args:
+            rfile: Socket file to read client frames from.
+            wfile: Socket file to write daemon frames to.
+        """
+        import smah.args
+        import smah.smah
+
+        request = receive(rfile)
+        if request is None or request.get("type") != "request":
+            return
+        tty = request.get("tty") or {}
+        cwd = request.get("cwd")
+        stdout = ClientOutput(wfile, "stdout", tty=tty.get("stdout", False))
+        stderr = ClientOutput(wfile, "stderr", tty=tty.get("stderr", False))
+        stdin = ClientInput(rfile, wfile, data=request.get("stdin"), tty=tty.get("stdin", False))
+
+        def executor(command: dict) -> None:
+            send(wfile, {"type": "exec", "command": command['command'], "cwd": cwd})
+            receive(rfile)
+
+        code = 0
+        try:
+            with self.environ.route(request.get("env")), self.stdin.route(stdin), self.stdout.route(stdout), \
+                    self.stderr.route(stderr), LazyConsole.scoped():
+                try:
+                    args, pipe = smah.args.extract_args(request.get("argv") or [])
+                    self.resolve_paths(args, cwd)
+                    if args.daemon:
+                        stderr.write("smah daemon is already running\n")
+                        code = 1
+                    else:
+                        smah.smah.dispatch(args, pipe, executor=executor)
+                except SystemExit as e:
+                    if isinstance(e.code, int):
+                        code = e.code
+                    elif e.code is not None:
+                        stderr.write(f"{e.code}\n")
+                        code = 1
+                except Exception as e:
+                    logging.error(f"[DAEMON] request failed: {str(e)}\n---------- trace -------------\n{traceback.format_exc()}\n")
+                    stderr.write(f"smah: {str(e)}\n")
+                    code = 1
+            send(wfile, {"type": "exit", "code": code})
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away mid request.
+            logging.info("[DAEMON] client disconnected")
@@ -0,0 +1,66 @@
+import os
+import threading
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from typing import Optional
+
+
+class RoutedEnviron(MutableMapping):
+    """
+    Stand-in for os.environ that resolves to a per-thread environment.
+
+    The daemon serves each client on its own thread; routing gives every invocation the client's
+    environment (API keys, COLUMNS, TERM, NO_COLOR, ...) instead of the one the daemon was started
+    with, without changing any of the code that reads it. Threads without a route fall through to
+    the original os.environ.
+    """
+
+    @staticmethod
+    def install() -> "RoutedEnviron":
+        """
+        Replaces os.environ (and so os.getenv) with a routed environment (once) and returns it.
+        """
+        if isinstance(os.environ, RoutedEnviron):
+            return os.environ
+        routed = RoutedEnviron(os.environ)
+        os.environ = routed
+        return routed
+
+    def __init__(self, default):
+        self.default = default
+        self.local = threading.local()
+
+    def target(self):
+        environ = getattr(self.local, "environ", None)
+        return self.default if environ is None else environ
+
+    @contextmanager
+    def route(self, environ: Optional[dict]):
+        """
+        Routes the calling thread to the given environment for the duration of the block, None keeps
+        the daemon's own.
+        """
+        previous = getattr(self.local, "environ", None)
+        self.local.environ = None if environ is None else dict(environ)
+        try:
+            yield self
+        finally:
+            self.local.environ = previous
+
+    def __getitem__(self, key: str) -> str:
+        return self.target()[key]
+
+    def __setitem__(self, key: str, value: str) -> None:
+        self.target()[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self.target()[key]
+
+    def __iter__(self):
+        return iter(self.target())
+
+    def __len__(self) -> int:
+        return len(self.target())
+
+    def copy(self) -> dict:
+        return dict(self.target())
@@ -0,0 +1,46 @@
+"""
+Wire protocol shared by the smah daemon and its thin client.
+
+Frames are single line JSON objects exchanged over a unix domain socket.
+
+Client -> Daemon:
+- request: {"type": "request", "argv": [...], "cwd": str, "env": {...}, "stdin": str | None, "tty": {...}}
+- line: {"type": "line", "data": str} reply to a readline frame ("" on EOF).
+- exec-result: {"type": "exec-result", "returncode": int} reply to an exec frame.
+
+Daemon -> Client:
+- stdout / stderr: {"type": "stdout", "data": str} output to write to the client's stream.
+- readline: {"type": "readline"} request a line from the client's stdin.
+- exec: {"type": "exec", "command": str, "cwd": str} run a confirmed command in the client's shell.
+- exit: {"type": "exit", "code": int} invocation finished.
+"""
+import json
+from typing import BinaryIO, Optional
+
+
+def send(stream: BinaryIO, frame: dict) -> None:
+    """
+    Writes a single frame to the stream.
+
+    Args:
+        stream (BinaryIO): The socket file to write to.
+        frame (dict): The frame to send.
+    """
+    stream.write(json.dumps(frame).encode("utf-8") + b"\n")
+    stream.flush()
+
+
+def receive(stream: BinaryIO) -> Optional[dict]:
+    """
+    Reads a single frame from the stream.
+
+    Args:
+        stream (BinaryIO): The socket file to read from.
+
+    Returns:
+        Optional[dict]: The frame, or None if the peer closed the connection.
+    """
+    line = stream.readline()
+    if not line:
+        return None
+    return json.loads(line)
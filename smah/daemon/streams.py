@@ -0,0 +1,148 @@
+import io
+import sys
+import threading
+from contextlib import contextmanager
+from typing import BinaryIO, Optional
+
+from smah.daemon.protocol import send, receive
+
+
+class RoutedStream(io.TextIOBase):
+    """
+    Stand-in for sys.stdin, sys.stdout or sys.stderr that forwards to a per-thread target.
+
+    The daemon serves each client on its own thread; routing lets print(), rich consoles and
+    prompts reach the right client without changing any of the code that writes to the std streams.
+    Threads without a route fall through to the original stream.
+    """
+
+    @staticmethod
+    def install(name: str) -> "RoutedStream":
+        """
+        Replaces sys.<name> with a routed stream (once) and returns it.
+
+        Args:
+            name (str): One of "stdin", "stdout" or "stderr".
+
+        Returns:
+            RoutedStream: The installed stream.
+        """
+        current = getattr(sys, name)
+        if isinstance(current, RoutedStream):
+            return current
+        routed = RoutedStream(current)
+        setattr(sys, name, routed)
+        return routed
+
+    def __init__(self, default):
+        super().__init__()
+        self.default = default
+        self.local = threading.local()
+
+    def target(self):
+        return getattr(self.local, "stream", None) or self.default
+
+    @contextmanager
+    def route(self, stream):
+        """
+        Routes the calling thread to the given stream for the duration of the block.
+        """
+        previous = getattr(self.local, "stream", None)
+        self.local.stream = stream
+        try:
+            yield stream
+        finally:
+            self.local.stream = previous
+
+    @property
+    def encoding(self):
+        return getattr(self.target(), "encoding", "utf-8")
+
+    def isatty(self) -> bool:
+        return self.target().isatty()
+
+    def fileno(self) -> int:
+        return self.target().fileno()
+
+    def writable(self) -> bool:
+        return True
+
+    def readable(self) -> bool:
+        return True
+
+    def write(self, s: str) -> int:
+        return self.target().write(s)
+
+    def flush(self) -> None:
+        self.target().flush()
+
+    def read(self, size: Optional[int] = -1) -> str:
+        return self.target().read(size)
+
+    def readline(self, size: Optional[int] = -1) -> str:
+        return self.target().readline(size)
+
+
+class ClientOutput(io.TextIOBase):
+    """
+    Writable text stream that forwards everything written to a connected client as it is written.
+    """
+
+    def __init__(self, wfile: BinaryIO, channel: str, tty: bool = False):
+        super().__init__()
+        self.wfile = wfile
+        self.channel = channel
+        self.tty = tty
+
+    @property
+    def encoding(self):
+        return "utf-8"
+
+    def isatty(self) -> bool:
+        return self.tty
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, s: str) -> int:
+        if s:
+            send(self.wfile, {"type": self.channel, "data": s})
+        return len(s)
+
+
+class ClientInput(io.TextIOBase):
+    """
+    Readable text stream backed by a connected client.
+
+    Piped input is shipped with the request and served from memory. When the client's stdin is
+    a terminal, each readline is requested from the client on demand so prompts work as usual.
+    """
+
+    def __init__(self, rfile: BinaryIO, wfile: BinaryIO, data: Optional[str] = None, tty: bool = False):
+        super().__init__()
+        self.rfile = rfile
+        self.wfile = wfile
+        self.buffer = io.StringIO(data or "")
+        self.tty = tty
+
+    @property
+    def encoding(self):
+        return "utf-8"
+
+    def isatty(self) -> bool:
+        return self.tty
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: Optional[int] = -1) -> str:
+        return self.buffer.read(size)
+
+    def readline(self, size: Optional[int] = -1) -> str:
+        if not self.tty:
+            return self.buffer.readline(size)
+        send(self.wfile, {"type": "readline"})
+        frame = receive(self.rfile)
+        if frame is None or frame.get("type") != "line":
+            return ""
+        return frame.get("data") or ""
@@ -2,5 +2,7 @@
 # smah/database/__init__.py
 from .database import Database
 from .migration import Migration
+from .retention import Retention
+from .export import Exporter, Importer
 
-__all__ = ['Database', 'Migration']
\ No newline at end of file
+__all__ = ['Database', 'Migration', 'Retention', 'Exporter', 'Importer']
\ No newline at end of file
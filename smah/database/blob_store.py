@@ -0,0 +1,131 @@
+import hashlib
+import json
+import lzma
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Optional
+
+
+class BlobStore:
+    """
+    Content addressed, compressed storage for pipe input and large message bodies.
+
+    Bodies are keyed by the sha256 of their text so identical inputs (e.g. the same file piped by a
+    cron job every hour) are stored once. Rows that reference a blob keep a short preview inline,
+    which keeps listings and the search index cheap; the full body is decompressed only when a
+    session is actually loaded.
+    """
+    # Bodies smaller than this (in bytes) stay inline.
+    THRESHOLD = 8192
+    # Characters kept inline as a preview of a stored body.
+    PREVIEW = 2048
+    CODEC = "zlib"
+
+    # Decompressed bodies by hash, shared by all stores (blobs are immutable).
+    CACHE_SIZE = 32
+    CACHE: OrderedDict = OrderedDict()
+    CACHE_LOCK = threading.Lock()
+
+    @staticmethod
+    def digest(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def encode(codec: str, text: str) -> bytes:
+        data = text.encode("utf-8")
+        if codec == "zlib":
+            return zlib.compress(data, 6)
+        if codec == "lzma":
+            return lzma.compress(data)
+        raise ValueError(f"Unsupported blob codec: {codec}")
+
+    @staticmethod
+    def decode(codec: str, data: bytes) -> str:
+        if codec == "zlib":
+            return zlib.decompress(data).decode("utf-8")
+        if codec == "lzma":
+            return lzma.decompress(data).decode("utf-8")
+        raise ValueError(f"Unsupported blob codec: {codec}")
+
+    @staticmethod
+    def large(text: Optional[str]) -> bool:
+        return text is not None and len(text.encode("utf-8")) > BlobStore.THRESHOLD
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def put(self, cursor: sqlite3.Cursor, text: str) -> str:
+        """
+        Stores text (once) and returns its hash.
+
+        Args:
+            cursor (sqlite3.Cursor): Cursor of the caller's open transaction.
+            text (str): The body to store.
+
+        Returns:
+            str: The body's hash.
+        """
+        hash = self.digest(text)
+        cursor.execute(
+            """
+            INSERT OR IGNORE INTO blob (hash, codec, size, data)
+            VALUES (?, ?, ?, ?)
+            """,
+            (hash, self.CODEC, len(text), self.encode(self.CODEC, text))
+        )
+        return hash
+
+    def get(self, hash: str) -> Optional[str]:
+        """
+        Loads and decompresses a stored body.
+
+        Args:
+            hash (str): The body's hash.
+
+        Returns:
+            Optional[str]: The body, or None if no such blob is stored.
+        """
+        with self.CACHE_LOCK:
+            if hash in self.CACHE:
+                self.CACHE.move_to_end(hash)
+                return self.CACHE[hash]
+        row = self.connection.execute("SELECT codec, data FROM blob WHERE hash = ?", (hash,)).fetchone()
+        if row is None:
+            return None
+        text = self.decode(*row)
+        with self.CACHE_LOCK:
+            self.CACHE[hash] = text
+            while len(self.CACHE) > self.CACHE_SIZE:
+                self.CACHE.popitem(last=False)
+        return text
+
+    def pipe(self, cursor: sqlite3.Cursor, pipe: Optional[str]) -> tuple[Optional[str], Optional[str]]:
+        """
+        Prepares pipe input for storage.
+
+        Returns:
+            tuple: (inline value, blob hash), the inline value is a preview when the body was stored as a blob.
+        """
+        if not self.large(pipe):
+            return pipe, None
+        return pipe[:self.PREVIEW], self.put(cursor, pipe)
+
+    def message(self, cursor: sqlite3.Cursor, message: dict) -> tuple[str, Optional[str]]:
+        """
+        Prepares a message for storage.
+
+        Returns:
+            tuple: (inline json, blob hash), the inline json holds a truncated preview of the content
+            when the message was stored as a blob.
+        """
+        body = json.dumps(message)
+        if not self.large(body):
+            return body, None
+        preview = {
+            'role': message.get('role'),
+            'content': (message.get('content') or "")[:self.PREVIEW],
+            'truncated': True
+        }
+        return json.dumps(preview), self.put(cursor, body)
@@ -2,12 +2,61 @@ import argparse
 import json
 import sqlite3
 import os
+import sys
+import threading
 from typing import Optional
 
+from smah.database.blob_store import BlobStore
+from smah.database.writer import Writer
+
 
 class Database:
     DEFAULT_DATABASE = os.path.expanduser("~/.smah/smah.db")
 
+    # Connection tuning, applied once when a process first opens a database file.
+    BUSY_TIMEOUT = 10.0
+    STATEMENT_CACHE = 256
+    PRAGMAS = [
+        # Only takes effect on new databases, `smah-db compact` converts existing ones.
+        "PRAGMA auto_vacuum=INCREMENTAL",
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA mmap_size=268435456",
+        "PRAGMA cache_size=-32768",
+    ]
+
+    # One shared connection (write lock and write-behind queue) per database file per process.
+    CONNECTIONS: dict = {}
+    CONNECTIONS_LOCK = threading.Lock()
+
+    # Batch and daemon workloads commit queued writes in groups.
+    GROUP_COMMIT = False
+
+    # A session and its fork ancestors, each with the last message id it contributes.
+    # Parameters: (session id, upper bound for the session's own messages).
+    LINEAGE = """
+        WITH RECURSIVE lineage(id, upto) AS (
+            SELECT ?, ?
+            UNION ALL
+            SELECT chat_history.parent_id, MIN(lineage.upto, chat_history.fork_message_id)
+            FROM lineage
+            JOIN chat_history ON chat_history.id = lineage.id
+            WHERE chat_history.parent_id IS NOT NULL
+        )
+    """
+
+    @staticmethod
+    def group_commit(enabled: bool = True) -> None:
+        """
+        Switches the write-behind queue of every database opened by this process to group-commit mode.
+        """
+        Database.GROUP_COMMIT = enabled
+        with Database.CONNECTIONS_LOCK:
+            for shared in Database.CONNECTIONS.values():
+                if shared["writer"]:
+                    shared["writer"].group_commit = enabled
+
     @staticmethod
     def default_database() -> str:
         return Database.DEFAULT_DATABASE
@@ -16,69 +65,123 @@ class Database:
     def args_to_dict(args: argparse.Namespace) -> dict:
         return vars(args)
 
+    @staticmethod
+    def connect(file: str) -> sqlite3.Connection:
+        """
+        Opens a tuned connection: WAL journaling so readers never block the writer, NORMAL sync
+        (durable with WAL, one fsync per checkpoint instead of per commit), a busy timeout so
+        concurrent smah processes wait for the write lock rather than failing, plus mmap, page
+        cache and statement cache sizing.
+
+        Transactions are managed explicitly (autocommit mode), write paths use BEGIN IMMEDIATE.
+        """
+        connection = sqlite3.connect(
+            file,
+            timeout=Database.BUSY_TIMEOUT,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=Database.STATEMENT_CACHE
+        )
+        for pragma in Database.PRAGMAS:
+            connection.execute(pragma)
+        return connection
+
     def __init__(self, args):
         file = args.database or self.default_database()
-        migrate = False
         if not os.path.exists(file):
-            os.makedirs(os.path.dirname(file), exist_ok=True)
-            migrate = True
-        self.connection: sqlite3.Connection = sqlite3.connect(file)
-
-
-    def last_session(self):
-        cursor = self.connection.cursor()
-        cursor.execute(
-            """
-            SELECT setting_value
-            FROM settings
-            WHERE setting = ?
-            """,
-            ("last_session",)
-        )
-        result = cursor.fetchone()
-        cursor.close()
+            os.makedirs(os.path.dirname(file) or ".", exist_ok=True)
+        self.file: str = file
+        with Database.CONNECTIONS_LOCK:
+            shared = Database.CONNECTIONS.get(file)
+            # Connections must not cross a fork.
+            if shared is None or shared["pid"] != os.getpid():
+                shared = {
+                    "pid": os.getpid(),
+                    "connection": self.connect(file),
+                    "lock": threading.RLock(),
+                    "writer": None
+                }
+                Database.CONNECTIONS[file] = shared
+        self.shared: dict = shared
+        self.connection: sqlite3.Connection = shared["connection"]
+        self.lock: threading.RLock = shared["lock"]
+        self.blobs: BlobStore = BlobStore(self.connection)
+
+    @property
+    def writer(self) -> Writer:
+        """
+        The connection's write-behind queue, started on first write.
+        """
+        with Database.CONNECTIONS_LOCK:
+            if self.shared["writer"] is None:
+                self.shared["writer"] = Writer(self.connection, self.lock, group_commit=Database.GROUP_COMMIT)
+            return self.shared["writer"]
+
+    def flush(self) -> None:
+        """
+        Waits for queued writes to be committed, giving reads a consistent view of this process's writes.
+        """
+        writer = self.shared["writer"]
+        if writer:
+            writer.flush()
+
+
+    def last_session(self, messages: bool = True):
+        self.flush()
+        with self.lock:
+            result = self.connection.execute(
+                """
+                SELECT setting_value
+                FROM settings
+                WHERE setting = ?
+                """,
+                ("last_session",)
+            ).fetchone()
         if result:
             (session_id,) = result
             session_id = int(session_id)
-            return self.session(session_id)
+            return self.session(session_id, messages=messages)
         return None
 
-    def session(self, session_id: int):
-        cursor = self.connection.cursor()
-        cursor.execute(
-            """
-            SELECT chat_history.id, chat_history.title, chat_history.created_on, chat_history.modified_on, chat_history_details.args, chat_history_details.plan, chat_history_details.pipe_input
-            FROM chat_history
-            JOIN chat_history_details
-            ON chat_history.id = chat_history_details.chat_history_id
-            WHERE chat_history.id = ?
-            """,
-            (session_id,)
-        )
-        result = cursor.fetchone()
+    def session(self, session_id: int, messages: bool = True):
+        """
+        Loads a session.
+
+        Args:
+            session_id (int): The session.
+            messages (bool): Load every message of the session, when False "messages" is None
+                and messages can be streamed with `messages()` as needed.
+        """
+        self.flush()
+        with self.lock:
+            result = self.connection.execute(
+                """
+                SELECT chat_history.id, chat_history.title, chat_history.created_on, chat_history.modified_on, chat_history.parent_id, chat_history.fork_message_id, chat_history_details.args, chat_history_details.plan, chat_history_details.pipe_input, chat_history_details.pipe_blob
+                FROM chat_history
+                JOIN chat_history_details
+                ON chat_history.id = chat_history_details.chat_history_id
+                WHERE chat_history.id = ?
+                """,
+                (session_id,)
+            ).fetchone()
 
         # get chat_history_messages
-        mr = cursor.execute(
-            """
-            SELECT message
-            FROM chat_history_message
-            WHERE chat_history_id = ?
-            ORDER BY id ASC
-            """,
-            (session_id,)
-        ).fetchall()
-        messages = []
-        for row in mr:
-            (row,) = row
-            messages.append(json.loads(row))
-        cursor.close()
+        if messages:
+            messages = [message for _, message in self.messages(session_id)]
+        else:
+            messages = None
         if result:
-            id, title, created_on, modified_on, args, plan, pipe = result
+            id, title, created_on, modified_on, parent_id, fork_message_id, args, plan, pipe, pipe_blob = result
+            if pipe_blob:
+                with self.lock:
+                    pipe = self.blobs.get(pipe_blob)
             return {
                 "id": id,
                 "title": title,
                 "created_on": created_on,
                 "modified_on": modified_on,
+                "parent_id": parent_id,
+                "fork_message_id": fork_message_id,
                 "args": json.loads(args),
                 "plan": json.loads(plan),
                 "pipe": pipe,
@@ -86,19 +189,310 @@ class Database:
             }
         return None
 
-    def history(self, limit: int = 10):
-        cursor = self.connection.cursor()
-        cursor.execute(
-            """
-            SELECT chat_history.id, chat_history.title, chat_history.created_on, chat_history.modified_on
-            FROM chat_history
-            ORDER BY created_on DESC
-            LIMIT ?
-            """,
-            (limit,)
-        )
-        result = cursor.fetchall()
-        cursor.close()
+    def messages(self, session_id: int, before: Optional[int] = None, limit: Optional[int] = None, newest_first: bool = False, batch_size: int = 64, after: Optional[int] = None):
+        """
+        Streams a session's messages a batch at a time, each batch fetched and decoded under the
+        connection lock by its own keyset query, so no statement is left open across the writer's
+        transactions. Forked sessions include their ancestors' messages up to the fork points.
+
+        Args:
+            session_id (int): The session.
+            before (Optional[int]): Only messages with an id lower than this one.
+            after (Optional[int]): Only messages with an id greater than this one.
+            limit (Optional[int]): Maximum number of messages.
+            newest_first (bool): Yield the most recent messages first.
+            batch_size (int): Rows fetched from sqlite at a time.
+
+        Yields:
+            tuple: (message id, message)
+        """
+        self.flush()
+        before = before if before is not None else sys.maxsize
+        after = after if after is not None else 0
+        remaining = limit if limit is not None else -1
+        while remaining != 0:
+            size = batch_size if remaining < 0 else min(batch_size, remaining)
+            with self.lock:
+                rows = self.connection.execute(
+                    f"""
+                    {self.LINEAGE}
+                    SELECT chat_history_message.id, role, content, message, message_blob
+                    FROM lineage
+                    JOIN chat_history_message ON chat_history_message.chat_history_id = lineage.id
+                    WHERE chat_history_message.id <= lineage.upto AND chat_history_message.id < ? AND chat_history_message.id > ?
+                    ORDER BY chat_history_message.id {"DESC" if newest_first else "ASC"}
+                    LIMIT ?
+                    """,
+                    (session_id, sys.maxsize, before, after, size)
+                ).fetchall()
+                batch = [(id, self.decode_message(self.blobs, role, content, message, message_blob)) for id, role, content, message, message_blob in rows]
+            yield from batch
+            if len(rows) < size:
+                break
+            if newest_first:
+                before = rows[-1][0]
+            else:
+                after = rows[-1][0]
+            if remaining > 0:
+                remaining -= len(rows)
+
+    @staticmethod
+    def decode_message(blobs: BlobStore, role: Optional[str], content: Optional[str], message: Optional[str], message_blob: Optional[str]) -> dict:
+        """
+        Rebuilds a message from its row: the blob store for large messages, the JSON for rows not yet
+        backfilled or with keys beyond role and content, or the typed columns.
+        """
+        if message_blob:
+            return json.loads(blobs.get(message_blob))
+        if message is not None:
+            return json.loads(message)
+        return {'role': role, 'content': content}
+
+    def context_messages(self, session_id: int, budget: int, after: Optional[int] = None) -> list:
+        """
+        Returns the most recent messages of a session whose token counts sum to at most `budget`.
+
+        A single statement over the session's index: a running total of token_count, newest first,
+        cut at the budget. Rows not yet backfilled are estimated from their JSON.
+
+        Args:
+            session_id (int): The session.
+            budget (int): Token budget.
+            after (Optional[int]): Only messages with an id greater than this one.
+
+        Returns:
+            list: (message id, message) pairs, oldest first.
+        """
+        self.flush()
+        with self.lock:
+            rows = self.connection.execute(
+                f"""
+                {self.LINEAGE}
+                SELECT id, role, content, message, message_blob
+                FROM (
+                    SELECT chat_history_message.id, role, content, message, message_blob,
+                           SUM(COALESCE(token_count, LENGTH(json_extract(message, '$.content')) / 4 + 4))
+                               OVER (ORDER BY chat_history_message.id DESC) AS spent
+                    FROM lineage
+                    JOIN chat_history_message ON chat_history_message.chat_history_id = lineage.id
+                    WHERE chat_history_message.id <= lineage.upto AND chat_history_message.id > ?
+                )
+                WHERE spent <= ?
+                ORDER BY id ASC
+                """,
+                (session_id, sys.maxsize, after if after is not None else 0, budget)
+            ).fetchall()
+            return [(id, self.decode_message(self.blobs, role, content, message, message_blob)) for id, role, content, message, message_blob in rows]
+
+    def summary(self, session_id: int) -> Optional[dict]:
+        """
+        Returns the session's latest rolling summary. A fork inherits its ancestors' summaries of
+        messages before the fork point.
+
+        Returns:
+            Optional[dict]: The summary with the message id range it covers, or None.
+        """
+        self.flush()
+        with self.lock:
+            row = self.connection.execute(
+                f"""
+                {self.LINEAGE}
+                SELECT chat_history_summary.id, from_message_id, to_message_id, summary, model, created_on
+                FROM lineage
+                JOIN chat_history_summary ON chat_history_summary.chat_history_id = lineage.id
+                WHERE to_message_id <= lineage.upto
+                ORDER BY to_message_id DESC
+                LIMIT 1
+                """,
+                (session_id, sys.maxsize)
+            ).fetchone()
+        if row is None:
+            return None
+        id, from_message_id, to_message_id, summary, model, created_on = row
+        return {
+            "id": id,
+            "from_message_id": from_message_id,
+            "to_message_id": to_message_id,
+            "summary": summary,
+            "model": model,
+            "created_on": created_on
+        }
+
+    def save_summary(self, session_id: int, from_message_id: int, to_message_id: int, summary: str, model: str) -> None:
+        """
+        Queues a rolling summary covering messages from_message_id..to_message_id of a session.
+        """
+        def job(cursor: sqlite3.Cursor, blobs: BlobStore) -> None:
+            cursor.execute(
+                """
+                INSERT INTO chat_history_summary (chat_history_id, from_message_id, to_message_id, summary, model)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (session_id, from_message_id, to_message_id, summary, model)
+            )
+        self.writer.submit(job)
+
+    def rendered(self, hashes: list, width: int) -> dict:
+        """
+        Looks up cached renders of messages at a terminal width.
+
+        Args:
+            hashes (list): Render keys, see `Runner.render_key`.
+
+        Returns:
+            dict: Rendered output by key, for the keys found.
+        """
+        if not hashes:
+            return {}
+        self.flush()
+        marks = ",".join("?" * len(hashes))
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT hash, codec, data FROM render_cache WHERE width = ? AND hash IN ({marks})",
+                [width] + list(hashes)
+            ).fetchall()
+        return {hash: BlobStore.decode(codec, data) for hash, codec, data in rows}
+
+    def save_rendered(self, renders: dict, width: int) -> None:
+        """
+        Queues rendered output of messages (by render key) for a terminal width.
+        """
+        if not renders:
+            return
+        rows = [(hash, width, BlobStore.CODEC, BlobStore.encode(BlobStore.CODEC, text)) for hash, text in renders.items()]
+
+        def job(cursor: sqlite3.Cursor, blobs: BlobStore) -> None:
+            cursor.executemany(
+                "INSERT OR REPLACE INTO render_cache (hash, width, codec, data) VALUES (?, ?, ?, ?)",
+                rows
+            )
+        self.writer.submit(job)
+
+    def fork(self, session_id: int, title: Optional[str] = None) -> Optional[int]:
+        """
+        Branches a session at its latest message.
+
+        The fork records its parent and fork point and shares the parent's details (pipe blobs are
+        referenced by hash); no messages are copied, so forking costs the same whatever the size of
+        the session.
+
+        Args:
+            session_id (int): The session to fork.
+            title (Optional[str]): Title of the fork, defaults to the parent's.
+
+        Returns:
+            Optional[int]: The new session's id, None if the session does not exist.
+        """
+        self.flush()
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE TRANSACTION")
+            try:
+                parent = cursor.execute("SELECT title FROM chat_history WHERE id = ?", (session_id,)).fetchone()
+                if parent is None:
+                    cursor.execute("ROLLBACK")
+                    return None
+                # The fork point: the newest message the parent sees (one index probe per ancestor).
+                (fork_message_id,) = cursor.execute(
+                    f"""
+                    {self.LINEAGE}
+                    SELECT COALESCE(MAX((
+                        SELECT MAX(id) FROM chat_history_message
+                        WHERE chat_history_id = lineage.id AND id <= lineage.upto
+                    )), 0)
+                    FROM lineage
+                    """,
+                    (session_id, sys.maxsize)
+                ).fetchone()
+                cursor.execute(
+                    """
+                    INSERT INTO chat_history (title, parent_id, fork_message_id)
+                    VALUES (?, ?, ?)
+                    """,
+                    (title or parent[0], session_id, fork_message_id)
+                )
+                fork_id = cursor.lastrowid
+                cursor.execute(
+                    """
+                    INSERT INTO chat_history_details (chat_history_id, args, plan, pipe_input, pipe_blob)
+                    SELECT ?, args, plan, pipe_input, pipe_blob
+                    FROM chat_history_details
+                    WHERE chat_history_id = ?
+                    """,
+                    (fork_id, session_id)
+                )
+                cursor.execute(
+                    """
+                    INSERT INTO settings (setting, setting_value)
+                    VALUES (?, ?)
+                    ON CONFLICT(setting) DO UPDATE SET
+                        setting_value = excluded.setting_value
+                    """,
+                    ("last_session", f"{fork_id}")
+                )
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            finally:
+                cursor.close()
+        return fork_id
+
+    def history(self, limit: int = 10, before: Optional[int] = None, after: Optional[int] = None):
+        """
+        Lists sessions, oldest first, a page at a time.
+
+        Pages are addressed by keyset cursors (session ids) rather than offsets, so every page
+        is a single index range scan regardless of how far back it is.
+
+        Args:
+            limit (int): Page size.
+            before (Optional[int]): Return the page of sessions older than this session.
+            after (Optional[int]): Return the page of sessions newer than this session.
+
+        Returns:
+            list: Sessions in the page, oldest first.
+        """
+        self.flush()
+        with self.lock:
+            cursor = self.connection.cursor()
+            if after is not None:
+                cursor.execute(
+                    """
+                    SELECT chat_history.id, chat_history.title, chat_history.created_on, chat_history.modified_on
+                    FROM chat_history
+                    WHERE (created_on, id) > (SELECT created_on, id FROM chat_history WHERE id = ?)
+                    ORDER BY created_on ASC, id ASC
+                    LIMIT ?
+                    """,
+                    (after, limit)
+                )
+                result = cursor.fetchall()
+            else:
+                if before is not None:
+                    cursor.execute(
+                        """
+                        SELECT chat_history.id, chat_history.title, chat_history.created_on, chat_history.modified_on
+                        FROM chat_history
+                        WHERE (created_on, id) < (SELECT created_on, id FROM chat_history WHERE id = ?)
+                        ORDER BY created_on DESC, id DESC
+                        LIMIT ?
+                        """,
+                        (before, limit)
+                    )
+                else:
+                    cursor.execute(
+                        """
+                        SELECT chat_history.id, chat_history.title, chat_history.created_on, chat_history.modified_on
+                        FROM chat_history
+                        ORDER BY created_on DESC, id DESC
+                        LIMIT ?
+                        """,
+                        (limit,)
+                    )
+                result = cursor.fetchall()
+                result.reverse()
+            cursor.close()
         response = []
         for row in result:
             id, title, created_on, modified_on = row
@@ -108,64 +502,129 @@ class Database:
                 "created_on": created_on,
                 "modified_on": modified_on
             })
-        response.reverse()
         return response
 
-    def append_to_chat(self, session_id: int, messages: list) -> None:
-        cursor = self.connection.cursor()
-        cursor.execute("BEGIN TRANSACTION")
-        for message in messages:
+    # Snippet highlight markers, control characters that never appear in indexed text.
+    MATCH_START = "\x02"
+    MATCH_END = "\x03"
+
+    @staticmethod
+    def search_query(terms: str) -> str:
+        """
+        Converts free text into an FTS5 query matching all terms, quoting each so punctuation
+        in user input is never parsed as query syntax.
+        """
+        return " ".join('"' + term.replace('"', '""') + '"' for term in terms.split())
+
+    # Matching rows fetched per page of a search, as a multiple of the requested sessions.
+    SEARCH_PAGE = 10
+
+    def search(self, terms: str, limit: int = 10) -> list:
+        """
+        Full text search over session titles, messages and pipe input.
+
+        Bodies kept in the blob store (over BlobStore.THRESHOLD bytes) are indexed by their inline
+        preview, the first BlobStore.PREVIEW characters, so the index never holds an uncompressed
+        copy of every large pipe: terms past the preview do not match.
+
+        Args:
+            terms (str): Search terms, all must match.
+            limit (int): Maximum number of sessions to return.
+
+        Returns:
+            list: Sessions ordered by relevance, each with the best matching snippet. Matched terms
+            in the snippet are wrapped in MATCH_START/MATCH_END.
+        """
+        query = self.search_query(terms)
+        if not query:
+            return []
+        self.flush()
+        # Several rows can match per session, rows are paged in rank order keeping the best ranked
+        # row of each session until enough sessions are found or the matches run out.
+        page = limit * self.SEARCH_PAGE
+        offset = 0
+        response = []
+        seen = set()
+        while len(response) < limit:
+            with self.lock:
+                rows = self.connection.execute(
+                    """
+                    SELECT chat_history_search.chat_history_id, chat_history.title, chat_history.created_on,
+                           chat_history_search.source,
+                           snippet(chat_history_search, 0, ?, ?, '…', 16)
+                    FROM chat_history_search
+                    JOIN chat_history ON chat_history.id = chat_history_search.chat_history_id
+                    WHERE chat_history_search MATCH ?
+                    ORDER BY rank
+                    LIMIT ? OFFSET ?
+                    """,
+                    (self.MATCH_START, self.MATCH_END, query, page, offset)
+                ).fetchall()
+            for id, title, created_on, source, snippet in rows:
+                if id in seen:
+                    continue
+                seen.add(id)
+                response.append({
+                    "id": id,
+                    "title": title,
+                    "created_on": created_on,
+                    "source": source,
+                    "snippet": snippet
+                })
+                if len(response) >= limit:
+                    break
+            if len(rows) < page:
+                break
+            offset += page
+        return response
+
+    def append_to_chat(self, session_id: int, messages: list, model: Optional[str] = None) -> None:
+        """
+        Queues messages to be appended to a session, committed by the background writer.
+
+        Args:
+            model (Optional[str]): Model that produced the assistant messages.
+        """
+        self.writer.append(session_id, messages, model)
+
+    def save_chat(self, title: str, args: argparse.Namespace, plan: dict, messages: list, pipe: Optional[str] = None) -> None:
+        """
+        Queues a new session, committed by the background writer.
+        """
+        args = json.dumps(self.args_to_dict(args))
+        model = plan.get('model')
+        plan = json.dumps(plan)
+
+        def job(cursor: sqlite3.Cursor, blobs: BlobStore) -> None:
+            # Insert into chat_history
             cursor.execute(
                 """
-                INSERT INTO chat_history_message (chat_history_id, message)
-                VALUES (?, ?)
-                """,
-                (session_id, json.dumps(message))
+                INSERT INTO chat_history (title)
+                VALUES (?)
+                """, (title,)
             )
-        cursor.execute("COMMIT")
-        cursor.close()
-
-    def save_chat(self, title: str, args: argparse.Namespace, plan: dict, messages: list, pipe: Optional[str] = None) -> None:
-        cursor = self.connection.cursor()
-
-        cursor.execute("BEGIN TRANSACTION")
-        # Insert into chat_history
-        cursor.execute(
-            """
-            INSERT INTO chat_history (title)
-            VALUES (?)
-            """, (title,)
-        )
-        chat_history_id = cursor.lastrowid
-
-        # Insert into chat_history_details
-        cursor.execute(
-            """
-            INSERT INTO chat_history_details (chat_history_id, args, plan, pipe_input)
-            VALUES (?, ?, ?, ?)
-            """, (chat_history_id, json.dumps(self.args_to_dict(args)), json.dumps(plan), pipe)
-        )
+            chat_history_id = cursor.lastrowid
 
-        # Insert into chat_history_message
-        for message in messages:
+            # Large pipe input is stored once in the blob store, the row keeps a preview.
+            pipe_input, pipe_blob = blobs.pipe(cursor, pipe)
             cursor.execute(
                 """
-                INSERT INTO chat_history_message (chat_history_id, message)
-                VALUES (?, ?)
-                """, (chat_history_id, json.dumps(message))
+                INSERT INTO chat_history_details (chat_history_id, args, plan, pipe_input, pipe_blob)
+                VALUES (?, ?, ?, ?, ?)
+                """, (chat_history_id, args, plan, pipe_input, pipe_blob)
             )
 
-        cursor.execute(
-            """
-            INSERT INTO settings (setting, setting_value)
-            VALUES (?, ?)
-            ON CONFLICT(setting) DO UPDATE SET
-                setting_value = excluded.setting_value
-            """,
-            ("last_session", f"{chat_history_id}")
-        )
+            # Insert into chat_history_message
+            Writer.insert(cursor, [Writer.row(cursor, blobs, chat_history_id, message, model) for message in messages])
 
-        # Commit the transaction
-        cursor.execute("COMMIT")
-        cursor.close()
+            cursor.execute(
+                """
+                INSERT INTO settings (setting, setting_value)
+                VALUES (?, ?)
+                ON CONFLICT(setting) DO UPDATE SET
+                    setting_value = excluded.setting_value
+                """,
+                ("last_session", f"{chat_history_id}")
+            )
 
+        self.writer.submit(job)
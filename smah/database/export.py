@@ -0,0 +1,446 @@
+import gzip
+import json
+import os
+import sqlite3
+import sys
+from typing import Callable, Iterator, Optional, TextIO
+
+from smah.database.blob_store import BlobStore
+from smah.database.database import Database
+from smah.database.writer import Writer
+
+
+class Exporter:
+    """
+    Streams chat history out of the database.
+
+    Sessions (with their args, plan, pipe input and per session metrics), messages and summaries are
+    read through stepping sqlite cursors inside a single read transaction, so the export is a
+    consistent snapshot and memory use stays constant however large the history is.
+
+    JSONL output is one record per line, each session followed by its messages and summaries.
+    Columnar output (Parquet or Arrow IPC, when pyarrow is installed) writes one file per record
+    type into the output directory, in record batches of BATCH_SIZE rows.
+    """
+    FORMATS = ["jsonl", "parquet", "arrow"]
+
+    # Rows fetched from sqlite, and rows per columnar record batch.
+    BATCH_SIZE = 1000
+
+    @staticmethod
+    def pyarrow():
+        try:
+            import pyarrow
+            import pyarrow.ipc
+            import pyarrow.parquet
+            return pyarrow
+        except ImportError:
+            raise RuntimeError("Parquet and Arrow formats require pyarrow (pip install pyarrow)")
+
+    @staticmethod
+    def schemas(pa) -> dict:
+        return {
+            "sessions": pa.schema([
+                ("id", pa.int64()),
+                ("title", pa.string()),
+                ("created_on", pa.string()),
+                ("modified_on", pa.string()),
+                ("parent_id", pa.int64()),
+                ("fork_message_id", pa.int64()),
+                ("args", pa.string()),
+                ("plan", pa.string()),
+                ("pipe", pa.string()),
+                ("message_count", pa.int64()),
+                ("byte_len", pa.int64()),
+            ]),
+            "messages": pa.schema([
+                ("id", pa.int64()),
+                ("session_id", pa.int64()),
+                ("created_on", pa.string()),
+                ("role", pa.string()),
+                ("content", pa.string()),
+                ("model", pa.string()),
+                ("token_count", pa.int64()),
+            ]),
+            "summaries": pa.schema([
+                ("id", pa.int64()),
+                ("session_id", pa.int64()),
+                ("from_message_id", pa.int64()),
+                ("to_message_id", pa.int64()),
+                ("summary", pa.string()),
+                ("model", pa.string()),
+                ("created_on", pa.string()),
+            ]),
+        }
+
+    @staticmethod
+    def open_text(file: str, mode: str) -> TextIO:
+        if file == "-":
+            return sys.stdout if "w" in mode else sys.stdin
+        if file.endswith(".gz"):
+            return gzip.open(file, mode + "t", encoding="utf-8")
+        return open(file, mode, encoding="utf-8")
+
+    def __init__(self, database: Database):
+        self.database = database
+        # A connection of its own, so the snapshot transaction does not hold up this process's writer.
+        self.connection: sqlite3.Connection = Database.connect(database.file)
+        self.blobs = BlobStore(self.connection)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def rows(self, sql: str, parameters: tuple = ()) -> Iterator[tuple]:
+        cursor = self.connection.cursor()
+        cursor.execute(sql, parameters)
+        try:
+            while True:
+                rows = cursor.fetchmany(self.BATCH_SIZE)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
+    def sessions(self) -> Iterator[dict]:
+        for id, title, created_on, modified_on, parent_id, fork_message_id, args, plan, pipe, pipe_blob, message_count, byte_len in self.rows(
+            """
+            SELECT chat_history.id, chat_history.title, chat_history.created_on, chat_history.modified_on,
+                   chat_history.parent_id, chat_history.fork_message_id,
+                   chat_history_details.args, chat_history_details.plan, chat_history_details.pipe_input, chat_history_details.pipe_blob,
+                   (SELECT COUNT(*) FROM chat_history_message WHERE chat_history_message.chat_history_id = chat_history.id),
+                   (SELECT COALESCE(SUM(COALESCE(chat_history_message.byte_len, blob.size, LENGTH(chat_history_message.message))), 0)
+                    FROM chat_history_message
+                    LEFT JOIN blob ON blob.hash = chat_history_message.message_blob
+                    WHERE chat_history_message.chat_history_id = chat_history.id)
+            FROM chat_history
+            LEFT JOIN chat_history_details ON chat_history_details.chat_history_id = chat_history.id
+            ORDER BY chat_history.id ASC
+            """
+        ):
+            yield {
+                "id": id,
+                "title": title,
+                "created_on": created_on,
+                "modified_on": modified_on,
+                "parent_id": parent_id,
+                "fork_message_id": fork_message_id,
+                "args": args,
+                "plan": plan,
+                "pipe": self.blobs.get(pipe_blob) if pipe_blob else pipe,
+                "message_count": message_count,
+                "byte_len": byte_len,
+            }
+
+    def messages(self) -> Iterator[dict]:
+        for id, session_id, created_on, role, content, message, message_blob, model, token_count in self.rows(
+            """
+            SELECT id, chat_history_id, created_on, role, content, message, message_blob, model, token_count
+            FROM chat_history_message
+            ORDER BY chat_history_id ASC, id ASC
+            """
+        ):
+            message = Database.decode_message(self.blobs, role, content, message, message_blob)
+            yield {
+                "id": id,
+                "session_id": session_id,
+                "created_on": created_on,
+                "role": message.get("role"),
+                "content": message.get("content"),
+                "model": model,
+                "token_count": token_count if token_count is not None else Writer.estimate_tokens(message.get("content")),
+            }
+
+    def summaries(self) -> Iterator[dict]:
+        for id, session_id, from_message_id, to_message_id, summary, model, created_on in self.rows(
+            """
+            SELECT id, chat_history_id, from_message_id, to_message_id, summary, model, created_on
+            FROM chat_history_summary
+            ORDER BY chat_history_id ASC, id ASC
+            """
+        ):
+            yield {
+                "id": id,
+                "session_id": session_id,
+                "from_message_id": from_message_id,
+                "to_message_id": to_message_id,
+                "summary": summary,
+                "model": model,
+                "created_on": created_on,
+            }
+
+    def records(self) -> Iterator[dict]:
+        """
+        Yields every record in JSONL order: each session, then its messages and summaries.
+        The three cursors are walked in step (all ordered by session id) rather than queried per session.
+        """
+        messages = self.messages()
+        summaries = self.summaries()
+        message = next(messages, None)
+        summary = next(summaries, None)
+        for session in self.sessions():
+            id = session["id"]
+            yield {
+                "type": "session",
+                **session,
+                "args": json.loads(session["args"]) if session["args"] else None,
+                "plan": json.loads(session["plan"]) if session["plan"] else None,
+            }
+            while message is not None and message["session_id"] <= id:
+                if message["session_id"] == id:
+                    yield {"type": "message", **message}
+                message = next(messages, None)
+            while summary is not None and summary["session_id"] <= id:
+                if summary["session_id"] == id:
+                    yield {"type": "summary", **summary}
+                summary = next(summaries, None)
+
+    def export(self, out: str, format: str = "jsonl", progress: Optional[Callable] = None) -> dict:
+        """
+        Exports the history.
+
+        Args:
+            out (str): Output file for JSONL ("-" for stdout, ".gz" to compress), output directory for columnar formats.
+            format (str): One of FORMATS.
+            progress (Optional[callable]): Called with the running record counts every BATCH_SIZE records.
+
+        Returns:
+            dict: Records written per type.
+        """
+        self.database.flush()
+        counts = {"session": 0, "message": 0, "summary": 0}
+        self.connection.execute("BEGIN")
+        try:
+            if format == "jsonl":
+                self.export_jsonl(out, counts, progress)
+            elif format in ("parquet", "arrow"):
+                self.export_columnar(out, format, counts, progress)
+            else:
+                raise ValueError(f"Unsupported export format: {format}")
+        finally:
+            self.connection.execute("COMMIT")
+        return counts
+
+    def export_jsonl(self, out: str, counts: dict, progress: Optional[Callable]) -> None:
+        stream = self.open_text(out, "w")
+        try:
+            for record in self.records():
+                stream.write(json.dumps(record, separators=(",", ":"), ensure_ascii=False))
+                stream.write("\n")
+                counts[record["type"]] += 1
+                if progress and sum(counts.values()) % self.BATCH_SIZE == 0:
+                    progress(counts)
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+            else:
+                stream.flush()
+
+    def export_columnar(self, out: str, format: str, counts: dict, progress: Optional[Callable]) -> None:
+        pa = self.pyarrow()
+        os.makedirs(out, exist_ok=True)
+        schemas = self.schemas(pa)
+        for table, kind, source in [
+            ("sessions", "session", self.sessions()),
+            ("messages", "message", self.messages()),
+            ("summaries", "summary", self.summaries()),
+        ]:
+            schema = schemas[table]
+            path = os.path.join(out, f"{table}.{format}")
+            if format == "parquet":
+                writer = pa.parquet.ParquetWriter(path, schema, compression="zstd")
+            else:
+                writer = pa.ipc.new_file(path, schema)
+            try:
+                batch = []
+                for row in source:
+                    batch.append(row)
+                    if len(batch) >= self.BATCH_SIZE:
+                        writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+                        counts[kind] += len(batch)
+                        batch = []
+                        if progress:
+                            progress(counts)
+                if batch:
+                    writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+                    counts[kind] += len(batch)
+            finally:
+                writer.close()
+
+
+class Importer:
+    """
+    Streams exported history back into a database, appending to what is already there.
+
+    Records are inserted with batched `executemany` calls, one transaction per BATCH_SIZE records.
+    Exported session and message ids are shifted past the highest ids already in the database, so
+    relationships survive the import without holding an id map in memory.
+    """
+    BATCH_SIZE = 1000
+
+    def __init__(self, database: Database):
+        self.database = database
+        self.session_offset = 0
+        self.message_offset = 0
+
+    def offsets(self) -> None:
+        self.session_offset = self.highest_id("chat_history")
+        self.message_offset = self.highest_id("chat_history_message")
+
+    def highest_id(self, table: str) -> int:
+        """
+        Highest id the table has ever issued. Sessions moved to the archive by retention keep their
+        ids, so the live rows alone would let imported ids collide with archived ones.
+        """
+        connection = self.database.connection
+        row = connection.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+        (live,) = connection.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()
+        return max(live, row[0] if row else 0)
+
+    def commit(self, batch: list) -> None:
+        """
+        Inserts a batch of records, grouped by type so each type is one executemany.
+        """
+        if not batch:
+            return
+        with self.database.lock:
+            cursor = self.database.connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE TRANSACTION")
+            try:
+                sessions, details, messages, summaries = [], [], [], []
+                for record in batch:
+                    kind = record.get("type")
+                    if kind == "session":
+                        id = record["id"] + self.session_offset
+                        parent_id, fork_message_id = record.get("parent_id"), record.get("fork_message_id")
+                        sessions.append((
+                            id,
+                            record.get("title"),
+                            record.get("created_on"),
+                            record.get("modified_on"),
+                            parent_id + self.session_offset if parent_id is not None else None,
+                            fork_message_id + self.message_offset if fork_message_id is not None else None
+                        ))
+                        args, plan = record.get("args"), record.get("plan")
+                        pipe_input, pipe_blob = self.database.blobs.pipe(cursor, record.get("pipe"))
+                        details.append((
+                            id,
+                            args if isinstance(args, str) or args is None else json.dumps(args),
+                            plan if isinstance(plan, str) or plan is None else json.dumps(plan),
+                            pipe_input,
+                            pipe_blob
+                        ))
+                    elif kind == "message":
+                        _, *row = Writer.row(
+                            cursor,
+                            self.database.blobs,
+                            None,
+                            {"role": record.get("role"), "content": record.get("content")},
+                            record.get("model")
+                        )
+                        messages.append((
+                            record["id"] + self.message_offset,
+                            record["session_id"] + self.session_offset,
+                            record.get("created_on"),
+                            *row
+                        ))
+                    elif kind == "summary":
+                        summaries.append((
+                            record["session_id"] + self.session_offset,
+                            record["from_message_id"] + self.message_offset,
+                            record["to_message_id"] + self.message_offset,
+                            record.get("summary"),
+                            record.get("model"),
+                            record.get("created_on")
+                        ))
+                cursor.executemany(
+                    """
+                    INSERT INTO chat_history (id, title, created_on, modified_on, parent_id, fork_message_id)
+                    VALUES (?, ?, COALESCE(?, CURRENT_TIMESTAMP), COALESCE(?, CURRENT_TIMESTAMP), ?, ?)
+                    """,
+                    sessions
+                )
+                cursor.executemany(
+                    """
+                    INSERT INTO chat_history_details (chat_history_id, args, plan, pipe_input, pipe_blob)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    details
+                )
+                cursor.executemany(
+                    """
+                    INSERT INTO chat_history_message (id, chat_history_id, created_on, role, content, token_count, byte_len, model, message_blob, message)
+                    VALUES (?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    messages
+                )
+                cursor.executemany(
+                    """
+                    INSERT INTO chat_history_summary (chat_history_id, from_message_id, to_message_id, summary, model, created_on)
+                    VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+                    """,
+                    summaries
+                )
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            finally:
+                cursor.close()
+
+    def records(self, file: str, format: str) -> Iterator[dict]:
+        if format == "jsonl":
+            stream = Exporter.open_text(file, "r")
+            try:
+                for line in stream:
+                    if line.strip():
+                        yield json.loads(line)
+            finally:
+                if stream is not sys.stdin:
+                    stream.close()
+        elif format in ("parquet", "arrow"):
+            pa = Exporter.pyarrow()
+            # Sessions first so every message and summary lands after the session it belongs to.
+            for table, kind in [("sessions", "session"), ("messages", "message"), ("summaries", "summary")]:
+                path = os.path.join(file, f"{table}.{format}")
+                if not os.path.exists(path):
+                    continue
+                if format == "parquet":
+                    batches = pa.parquet.ParquetFile(path).iter_batches(batch_size=self.BATCH_SIZE)
+                else:
+                    reader = pa.ipc.open_file(path)
+                    batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+                for batch in batches:
+                    for row in batch.to_pylist():
+                        yield {"type": kind, **row}
+        else:
+            raise ValueError(f"Unsupported import format: {format}")
+
+    def load(self, file: str, format: str = "jsonl", progress: Optional[Callable] = None) -> dict:
+        """
+        Imports an export.
+
+        Args:
+            file (str): JSONL file ("-" for stdin, ".gz" compressed) or columnar export directory.
+            format (str): One of Exporter.FORMATS.
+            progress (Optional[callable]): Called with the running record counts after each batch.
+
+        Returns:
+            dict: Records imported per type.
+        """
+        self.database.flush()
+        self.offsets()
+        counts = {"session": 0, "message": 0, "summary": 0}
+        batch = []
+        for record in self.records(file, format):
+            if record.get("type") not in counts:
+                continue
+            batch.append(record)
+            counts[record["type"]] += 1
+            if len(batch) >= self.BATCH_SIZE:
+                self.commit(batch)
+                batch = []
+                if progress:
+                    progress(counts)
+        self.commit(batch)
+        return counts
@@ -3,14 +3,25 @@ import hashlib
 import os
 import time
 import importlib
+import json
 import textwrap
 import sqlite3
+from typing import Callable, Optional
 from smah.database.database import Database
 
 class Migration:
     # Migrations are stored in the `migrations` directory
     MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
 
+    # Data backfill bookkeeping, added to schema_migrations of databases created before it existed.
+    BACKFILL_COLUMNS = [
+        ("backfill_checkpoint", "TEXT DEFAULT NULL"),
+        ("backfill_rows", "INTEGER DEFAULT 0"),
+        ("backfill_total", "INTEGER DEFAULT NULL"),
+        ("backfill_done", "BOOLEAN DEFAULT FALSE"),
+    ]
+    BACKFILL_BATCH_SIZE = 500
+
     def __init__(self):
         pass
 
@@ -30,20 +41,35 @@ class Migration:
             """
         ).strip()
         cursor.execute(create_table)
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(schema_migrations)").fetchall()}
+        for column, definition in Migration.BACKFILL_COLUMNS:
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE schema_migrations ADD COLUMN {column} {definition}")
 
-        cursor.execute("SELECT migration, checksum, applied, created_at, modified_at FROM schema_migrations ORDER BY migration ASC")
+        cursor.execute(
+            """
+            SELECT migration, checksum, applied, created_at, modified_at,
+                   backfill_checkpoint, backfill_rows, backfill_total, backfill_done
+            FROM schema_migrations
+            ORDER BY migration ASC
+            """
+        )
         result = cursor.fetchall()
         cursor.close()
         migrations = []
         for row in result:
-            migration, checksum, applied, created_at, modified_at = row
+            migration, checksum, applied, created_at, modified_at, backfill_checkpoint, backfill_rows, backfill_total, backfill_done = row
             migrations.append(
                 {
                     'migration': migration,
                     'checksum': checksum,
                     'applied': applied == 1,
                     'created_at': created_at,
-                    'modified_at': modified_at
+                    'modified_at': modified_at,
+                    'backfill_checkpoint': json.loads(backfill_checkpoint) if backfill_checkpoint else None,
+                    'backfill_rows': backfill_rows or 0,
+                    'backfill_total': backfill_total,
+                    'backfill_done': backfill_done == 1
                 }
             )
         return migrations
@@ -52,7 +78,7 @@ class Migration:
     def get_migrations():
         migrations = []
         os.makedirs(Migration.MIGRATIONS_DIR, exist_ok=True)
-        for migration in os.listdir(Migration.MIGRATIONS_DIR):
+        for migration in sorted(os.listdir(Migration.MIGRATIONS_DIR)):
             if migration.endswith(".py"):
                 digest = hashlib.md5(open(os.path.join(Migration.MIGRATIONS_DIR, migration), "rb").read()).hexdigest()
                 migrations.append({'file': migration, 'checksum': digest})
@@ -61,7 +87,7 @@ class Migration:
     @staticmethod
     def apply_migration(database: Database, migration: dict, silent: bool = False, exit_on_finish: bool = True) -> tuple:
         cursor = database.connection.cursor()
-        module = importlib.import_module(f"smah.database.migrations.{migration['file'][:-3]}")
+        module = Migration.module(migration['file'])
         cursor.execute("BEGIN TRANSACTION")
         try:
             module.up(cursor)
@@ -98,7 +124,7 @@ class Migration:
     @staticmethod
     def rollback_migration(database: Database, migration: dict, silent: bool = False, exit_on_finish: bool = True) -> tuple:
         cursor = database.connection.cursor()
-        module = importlib.import_module(f"smah.database.migrations.{migration['file'][:-3]}")
+        module = Migration.module(migration['file'])
         cursor.execute("BEGIN TRANSACTION")
         try:
             module.down(cursor)
@@ -108,7 +134,11 @@ class Migration:
                 VALUES (?, ?, ?)
                 ON CONFLICT(migration) DO UPDATE SET
                     checksum = excluded.checksum,
-                    applied = excluded.applied
+                    applied = excluded.applied,
+                    backfill_checkpoint = NULL,
+                    backfill_rows = 0,
+                    backfill_total = NULL,
+                    backfill_done = FALSE
                 """,
                 (migration['file'], migration['checksum'], False)
             )
@@ -207,6 +237,114 @@ class Migration:
             return "success", r
 
 
+    @staticmethod
+    def module(migration: str):
+        return importlib.import_module(f"smah.database.migrations.{migration[:-3]}")
+
+    @staticmethod
+    def pending_backfills(database: Database) -> list:
+        """
+        Applied migrations with a data backfill that has not completed.
+        """
+        available = {m['file'] for m in Migration.get_migrations()}
+        return [
+            m for m in Migration.get_schema_migrations(database)
+            if m['applied'] and not m['backfill_done'] and m['migration'] in available
+            and hasattr(Migration.module(m['migration']), "backfill")
+        ]
+
+    @staticmethod
+    def backfill_batch(database: Database, state: dict, batch_size: int) -> int:
+        """
+        Runs one batch of a migration's backfill and records its checkpoint, in one short transaction.
+
+        Returns:
+            int: Rows processed, 0 once the backfill is complete.
+        """
+        module = Migration.module(state['migration'])
+        with database.lock:
+            cursor = database.connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE TRANSACTION")
+            try:
+                if state['backfill_total'] is None and hasattr(module, "total"):
+                    state['backfill_total'] = module.total(cursor)
+                checkpoint, rows = module.backfill(cursor, state['backfill_checkpoint'], batch_size)
+                state['backfill_checkpoint'] = checkpoint
+                state['backfill_rows'] += rows
+                state['backfill_done'] = rows == 0
+                cursor.execute(
+                    """
+                    UPDATE schema_migrations
+                    SET backfill_checkpoint = ?, backfill_rows = ?, backfill_total = ?, backfill_done = ?,
+                        modified_at = CURRENT_TIMESTAMP
+                    WHERE migration = ?
+                    """,
+                    (
+                        json.dumps(checkpoint) if checkpoint is not None else None,
+                        state['backfill_rows'],
+                        state['backfill_total'],
+                        state['backfill_done'],
+                        state['migration']
+                    )
+                )
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            finally:
+                cursor.close()
+        return rows
+
+    @staticmethod
+    def backfill(
+            database: Database,
+            migration: Optional[str] = None,
+            batch_size: Optional[int] = None,
+            seconds: Optional[float] = None,
+            progress: Optional[Callable] = None
+    ) -> dict:
+        """
+        Runs pending data backfills of applied migrations.
+
+        Migrations opt in by defining `backfill(cursor, checkpoint, batch_size) -> (checkpoint, rows)`,
+        which processes the batch after `checkpoint` (None to start, any JSON value) and reports the
+        rows it processed (0 when complete), and optionally `total(cursor)` for progress reporting.
+        Each batch commits with its checkpoint in schema_migrations and releases the write lock, so
+        normal traffic keeps writing and an interrupted backfill resumes where it stopped.
+
+        Args:
+            migration (Optional[str]): Only this migration's backfill.
+            batch_size (Optional[int]): Rows per batch.
+            seconds (Optional[float]): Stop after this long (the backfill resumes on the next run).
+            progress (Optional[callable]): Called with the migration's state after each batch.
+
+        Returns:
+            dict: Rows processed per migration.
+        """
+        batch_size = batch_size or Migration.BACKFILL_BATCH_SIZE
+        deadline = time.monotonic() + seconds if seconds is not None else None
+        processed = {}
+        for state in Migration.pending_backfills(database):
+            if migration and state['migration'] != migration:
+                continue
+            processed[state['migration']] = 0
+            while not state['backfill_done']:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return processed
+                processed[state['migration']] += Migration.backfill_batch(database, state, batch_size)
+                if progress:
+                    progress(state)
+        return processed
+
+    @staticmethod
+    def backfill_status(state: dict) -> str:
+        if state['backfill_done']:
+            return "(backfill complete)"
+        if state['backfill_total']:
+            percent = min(100.0, 100.0 * state['backfill_rows'] / state['backfill_total'])
+            return f"(backfill {state['backfill_rows']}/{state['backfill_total']} rows, {percent:.0f}%)"
+        return f"(backfill pending, {state['backfill_rows']} rows)"
+
     @staticmethod
     def rollback(database: Database, args: argparse.Namespace):
         count = 0
@@ -248,12 +386,15 @@ class Migration:
         for migration in available_migrations:
             migration['applied'] = False
             migration['checksum_mismatch'] = False
+            migration['backfill'] = ''
             tracked = tracked_migrations.get(migration['file'])
             if tracked:
                 migration['applied'] = tracked['applied']
                 if tracked['checksum'] != migration['checksum']:
                     migration['checksum_mismatch'] = True
-            out += f"{migration['file']} {'(applied)' if migration['applied'] else ''} {'(checksum mismatch)' if migration['checksum_mismatch'] else ''}\n"
+                if tracked['applied'] and hasattr(Migration.module(migration['file']), "backfill"):
+                    migration['backfill'] = Migration.backfill_status(tracked)
+            out += f"{migration['file']} {'(applied)' if migration['applied'] else ''} {'(checksum mismatch)' if migration['checksum_mismatch'] else ''} {migration['backfill']}\n"
         print(f"Migrations:\n{out}")
 
     @staticmethod
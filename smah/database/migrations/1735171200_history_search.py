@@ -0,0 +1,114 @@
+def up(cursor):
+    """
+    Apply schema.
+
+    Full text index over session titles, message content and pipe input.
+    Row ids are chosen so every source row maps to exactly one index row:
+    messages use their own id, titles use -2 * session id and pipe input -2 * session id - 1.
+    """
+    cursor.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS chat_history_search USING fts5(
+            body,
+            chat_history_id UNINDEXED,
+            source UNINDEXED,
+            tokenize = 'porter unicode61'
+        )
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS chat_history_search_title_insert
+        AFTER INSERT ON chat_history
+        BEGIN
+            INSERT INTO chat_history_search (rowid, body, chat_history_id, source)
+            VALUES (-2 * new.id, new.title, new.id, 'title');
+        END
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS chat_history_search_title_update
+        AFTER UPDATE OF title ON chat_history
+        BEGIN
+            DELETE FROM chat_history_search WHERE rowid = -2 * old.id;
+            INSERT INTO chat_history_search (rowid, body, chat_history_id, source)
+            VALUES (-2 * new.id, new.title, new.id, 'title');
+        END
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS chat_history_search_title_delete
+        AFTER DELETE ON chat_history
+        BEGIN
+            DELETE FROM chat_history_search WHERE rowid IN (-2 * old.id, -2 * old.id - 1);
+        END
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS chat_history_search_pipe_insert
+        AFTER INSERT ON chat_history_details
+        WHEN new.pipe_input IS NOT NULL
+        BEGIN
+            INSERT INTO chat_history_search (rowid, body, chat_history_id, source)
+            VALUES (-2 * new.chat_history_id - 1, new.pipe_input, new.chat_history_id, 'pipe');
+        END
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS chat_history_search_message_insert
+        AFTER INSERT ON chat_history_message
+        BEGIN
+            INSERT INTO chat_history_search (rowid, body, chat_history_id, source)
+            VALUES (new.id, json_extract(new.message, '$.content'), new.chat_history_id, 'message');
+        END
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS chat_history_search_message_delete
+        AFTER DELETE ON chat_history_message
+        BEGIN
+            DELETE FROM chat_history_search WHERE rowid = old.id;
+        END
+        """
+    )
+
+    # Index existing history.
+    cursor.execute(
+        """
+        INSERT INTO chat_history_search (rowid, body, chat_history_id, source)
+        SELECT -2 * id, title, id, 'title' FROM chat_history
+        """
+    )
+    cursor.execute(
+        """
+        INSERT INTO chat_history_search (rowid, body, chat_history_id, source)
+        SELECT -2 * chat_history_id - 1, pipe_input, chat_history_id, 'pipe'
+        FROM chat_history_details
+        WHERE pipe_input IS NOT NULL
+        """
+    )
+    cursor.execute(
+        """
+        INSERT INTO chat_history_search (rowid, body, chat_history_id, source)
+        SELECT id, json_extract(message, '$.content'), chat_history_id, 'message'
+        FROM chat_history_message
+        """
+    )
+
+
+def down(cursor):
+    """
+    Rollback schema.
+    """
+    cursor.execute("DROP TRIGGER IF EXISTS chat_history_search_message_delete")
+    cursor.execute("DROP TRIGGER IF EXISTS chat_history_search_message_insert")
+    cursor.execute("DROP TRIGGER IF EXISTS chat_history_search_pipe_insert")
+    cursor.execute("DROP TRIGGER IF EXISTS chat_history_search_title_delete")
+    cursor.execute("DROP TRIGGER IF EXISTS chat_history_search_title_update")
+    cursor.execute("DROP TRIGGER IF EXISTS chat_history_search_title_insert")
+    cursor.execute("DROP TABLE IF EXISTS chat_history_search")
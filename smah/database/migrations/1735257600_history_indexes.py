@@ -0,0 +1,26 @@
+def up(cursor):
+    """
+    Apply schema.
+    """
+    # History listing and keyset pagination order by (created_on, id).
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS chat_history_created_on
+        ON chat_history(created_on, id)
+        """
+    )
+    # Session messages are loaded by session in id order.
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS chat_history_message_chat_history_id
+        ON chat_history_message(chat_history_id, id)
+        """
+    )
+
+
+def down(cursor):
+    """
+    Rollback schema.
+    """
+    cursor.execute("DROP INDEX IF EXISTS chat_history_message_chat_history_id")
+    cursor.execute("DROP INDEX IF EXISTS chat_history_created_on")
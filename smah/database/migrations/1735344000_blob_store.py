@@ -0,0 +1,56 @@
+from smah.database.blob_store import BlobStore
+
+
+def up(cursor):
+    """
+    Apply schema.
+
+    Content addressed, compressed storage for pipe input and large messages.
+    Rows moved to the store keep a short preview in their original column (which is what the
+    search index sees) and reference the full body by hash.
+    """
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS blob(
+            hash CHAR(64) PRIMARY KEY,
+            codec VARCHAR(8),
+            size INTEGER,
+            data BLOB,
+            created_on TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    cursor.execute("ALTER TABLE chat_history_details ADD COLUMN pipe_blob CHAR(64) DEFAULT NULL")
+    cursor.execute("ALTER TABLE chat_history_message ADD COLUMN message_blob CHAR(64) DEFAULT NULL")
+
+
+def down(cursor):
+    """
+    Rollback schema.
+    """
+    # Restore full bodies before dropping the store.
+    cursor.execute(
+        """
+        SELECT chat_history_details.chat_history_id, blob.codec, blob.data
+        FROM chat_history_details JOIN blob ON blob.hash = chat_history_details.pipe_blob
+        """
+    )
+    for chat_history_id, codec, data in cursor.fetchall():
+        cursor.execute(
+            "UPDATE chat_history_details SET pipe_input = ? WHERE chat_history_id = ?",
+            (BlobStore.decode(codec, data), chat_history_id)
+        )
+    cursor.execute(
+        """
+        SELECT chat_history_message.id, blob.codec, blob.data
+        FROM chat_history_message JOIN blob ON blob.hash = chat_history_message.message_blob
+        """
+    )
+    for id, codec, data in cursor.fetchall():
+        cursor.execute(
+            "UPDATE chat_history_message SET message = ? WHERE id = ?",
+            (BlobStore.decode(codec, data), id)
+        )
+    cursor.execute("ALTER TABLE chat_history_message DROP COLUMN message_blob")
+    cursor.execute("ALTER TABLE chat_history_details DROP COLUMN pipe_blob")
+    cursor.execute("DROP TABLE IF EXISTS blob")
@@ -0,0 +1,35 @@
+def up(cursor):
+    """
+    Apply schema.
+
+    Rolling summaries of older conversation turns. Each summary covers the session's messages
+    from from_message_id to to_message_id (inclusive); the latest summary supersedes earlier ones.
+    """
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS chat_history_summary(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_history_id INTEGER,
+            from_message_id INTEGER,
+            to_message_id INTEGER,
+            summary TEXT,
+            model VARCHAR(255),
+            created_on TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(chat_history_id) REFERENCES chat_history(id)
+        )
+        """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS chat_history_summary_chat_history_id
+        ON chat_history_summary(chat_history_id, to_message_id)
+        """
+    )
+
+
+def down(cursor):
+    """
+    Rollback schema.
+    """
+    cursor.execute("DROP INDEX IF EXISTS chat_history_summary_chat_history_id")
+    cursor.execute("DROP TABLE IF EXISTS chat_history_summary")
@@ -0,0 +1,54 @@
+def up(cursor):
+    """
+    Apply schema.
+
+    Typed message columns. New messages are written to role/content (the content column holds a
+    preview when the body is in the blob store) and leave the legacy `message` JSON NULL; existing
+    rows are converted by the resumable backfill of 1735603260_message_columns_backfill (run by
+    `smah-db migrate --backfill` or `smah-db backfill`), reads fall back to the JSON until then.
+    """
+    cursor.execute("ALTER TABLE chat_history_message ADD COLUMN role VARCHAR(32) DEFAULT NULL")
+    cursor.execute("ALTER TABLE chat_history_message ADD COLUMN content TEXT DEFAULT NULL")
+    cursor.execute("ALTER TABLE chat_history_message ADD COLUMN token_count INTEGER DEFAULT NULL")
+    cursor.execute("ALTER TABLE chat_history_message ADD COLUMN byte_len INTEGER DEFAULT NULL")
+    cursor.execute("ALTER TABLE chat_history_message ADD COLUMN model VARCHAR(255) DEFAULT NULL")
+    cursor.execute("DROP TRIGGER IF EXISTS chat_history_search_message_insert")
+    cursor.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS chat_history_search_message_insert
+        AFTER INSERT ON chat_history_message
+        BEGIN
+            INSERT INTO chat_history_search (rowid, body, chat_history_id, source)
+            VALUES (new.id, COALESCE(new.content, json_extract(new.message, '$.content')), new.chat_history_id, 'message');
+        END
+        """
+    )
+
+
+def down(cursor):
+    """
+    Rollback schema.
+    """
+    cursor.execute(
+        """
+        UPDATE chat_history_message
+        SET message = CASE
+            WHEN message_blob IS NULL THEN json_object('role', role, 'content', content)
+            ELSE json_object('role', role, 'content', content, 'truncated', json('true'))
+        END
+        WHERE message IS NULL
+        """
+    )
+    cursor.execute("DROP TRIGGER IF EXISTS chat_history_search_message_insert")
+    cursor.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS chat_history_search_message_insert
+        AFTER INSERT ON chat_history_message
+        BEGIN
+            INSERT INTO chat_history_search (rowid, body, chat_history_id, source)
+            VALUES (new.id, json_extract(new.message, '$.content'), new.chat_history_id, 'message');
+        END
+        """
+    )
+    for column in ["model", "byte_len", "token_count", "content", "role"]:
+        cursor.execute(f"ALTER TABLE chat_history_message DROP COLUMN {column}")
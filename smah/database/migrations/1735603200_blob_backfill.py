@@ -0,0 +1,100 @@
+import json
+
+from smah.database.blob_store import BlobStore
+from smah.database.database import Database
+from smah.database.writer import Writer
+
+# Tables scanned, in order, with their key and the columns read.
+TABLES = [
+    ("chat_history_details", "chat_history_id", "pipe_input", "pipe_blob"),
+    ("chat_history_message", "id", "role, content, message", "message_blob"),
+]
+
+
+def up(cursor):
+    """
+    Apply schema.
+
+    Moves large pipe inputs and messages written before the blob store existed into it.
+    The data is converted by `backfill`, batch by batch, after the migration is applied.
+    """
+    pass
+
+
+def down(cursor):
+    """
+    Rollback schema.
+    """
+    pass
+
+
+def total(cursor):
+    """
+    Rows the backfill will examine.
+    """
+    return sum(
+        cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE {blob_column} IS NULL").fetchone()[0]
+        for table, _, _, blob_column in TABLES
+    )
+
+
+def backfill(cursor, checkpoint, batch_size):
+    """
+    Converts the next batch of rows.
+
+    Args:
+        checkpoint (Optional[dict]): {"table": index into TABLES, "last": last key examined}, None to start.
+        batch_size (int): Rows examined per batch.
+
+    Returns:
+        tuple: (checkpoint, rows examined), no rows examined means the backfill is complete.
+    """
+    blobs = BlobStore(cursor.connection)
+    checkpoint = checkpoint or {"table": 0, "last": 0}
+    while checkpoint["table"] < len(TABLES):
+        table, key, columns, blob_column = TABLES[checkpoint["table"]]
+        rows = cursor.execute(
+            f"""
+            SELECT {key}, {columns}
+            FROM {table}
+            WHERE {key} > ? AND {blob_column} IS NULL
+            ORDER BY {key} ASC
+            LIMIT ?
+            """,
+            (checkpoint["last"], batch_size)
+        ).fetchall()
+        if not rows:
+            checkpoint = {"table": checkpoint["table"] + 1, "last": 0}
+            continue
+        for id, *values in rows:
+            if table == "chat_history_details":
+                (value,) = values
+                if not BlobStore.large(value):
+                    continue
+                inline, blob = blobs.pipe(cursor, value)
+                cursor.execute(
+                    "UPDATE chat_history_details SET pipe_input = ?, pipe_blob = ? WHERE chat_history_id = ?",
+                    (inline, blob, id)
+                )
+                search_row, search_body = -2 * id - 1, inline
+            else:
+                message = Database.decode_message(blobs, *values, None)
+                if not BlobStore.large(json.dumps(message)):
+                    continue
+                role, inline, token_count, byte_len, blob = Writer.columns(cursor, blobs, message)
+                cursor.execute(
+                    """
+                    UPDATE chat_history_message
+                    SET role = ?, content = ?, token_count = ?, byte_len = ?, message = NULL, message_blob = ?
+                    WHERE id = ?
+                    """,
+                    (role, inline, token_count, byte_len, blob, id)
+                )
+                search_row, search_body = id, inline
+            # Trim the search index copy down to the preview as well.
+            cursor.execute(
+                "UPDATE chat_history_search SET body = ? WHERE rowid = ?",
+                (search_body, search_row)
+            )
+        return {"table": checkpoint["table"], "last": rows[-1][0]}, len(rows)
+    return checkpoint, 0
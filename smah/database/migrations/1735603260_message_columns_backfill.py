@@ -0,0 +1,79 @@
+import json
+
+from smah.database.blob_store import BlobStore
+from smah.database.writer import Writer
+
+
+def up(cursor):
+    """
+    Apply schema.
+
+    Fills the typed message columns of rows written before they existed, from the legacy JSON,
+    and drops the JSON copy unless it holds keys the columns do not (name, tool_calls, ...). Assistant messages get the model from their session's plan.
+    The data is converted by `backfill`, batch by batch, after the migration is applied.
+    """
+    pass
+
+
+def down(cursor):
+    """
+    Rollback schema.
+    """
+    pass
+
+
+def total(cursor):
+    """
+    Rows the backfill will convert.
+    """
+    return cursor.execute("SELECT COUNT(*) FROM chat_history_message WHERE role IS NULL").fetchone()[0]
+
+
+def backfill(cursor, checkpoint, batch_size):
+    """
+    Converts the next batch of rows.
+
+    Args:
+        checkpoint (Optional[int]): Last message id converted, None to start.
+        batch_size (int): Rows per batch.
+
+    Returns:
+        tuple: (checkpoint, rows converted), no rows converted means the backfill is complete.
+    """
+    blobs = BlobStore(cursor.connection)
+    rows = cursor.execute(
+        """
+        SELECT chat_history_message.id, chat_history_message.message, chat_history_message.message_blob,
+               json_extract(chat_history_details.plan, '$.model')
+        FROM chat_history_message
+        LEFT JOIN chat_history_details ON chat_history_details.chat_history_id = chat_history_message.chat_history_id
+        WHERE chat_history_message.id > ? AND chat_history_message.role IS NULL
+        ORDER BY chat_history_message.id ASC
+        LIMIT ?
+        """,
+        (checkpoint or 0, batch_size)
+    ).fetchall()
+    updates = []
+    for id, message, message_blob, model in rows:
+        # Blob rows keep their preview as content, counts describe the full body.
+        inline = json.loads(message) if message else {}
+        full = json.loads(blobs.get(message_blob)) if message_blob else inline
+        content = full.get('content') or ""
+        updates.append((
+            inline.get('role'),
+            inline.get('content'),
+            Writer.estimate_tokens(content),
+            len(content.encode("utf-8")),
+            model if inline.get('role') == 'assistant' else None,
+            None if message_blob else Writer.extended(inline),
+            id
+        ))
+    cursor.executemany(
+        """
+        UPDATE chat_history_message
+        SET role = ?, content = ?, token_count = ?, byte_len = ?, model = ?, message = ?
+        WHERE id = ?
+        """,
+        updates
+    )
+    return (rows[-1][0] if rows else checkpoint), len(rows)
@@ -0,0 +1,19 @@
+def up(cursor):
+    """
+    Apply schema.
+
+    Forked sessions point at their parent and the last parent message they include. Messages are
+    shared, never copied: a session's messages are its own plus its ancestors' up to each fork point.
+    """
+    cursor.execute("ALTER TABLE chat_history ADD COLUMN parent_id INTEGER DEFAULT NULL REFERENCES chat_history(id)")
+    cursor.execute("ALTER TABLE chat_history ADD COLUMN fork_message_id INTEGER DEFAULT NULL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS chat_history_parent_id ON chat_history(parent_id)")
+
+
+def down(cursor):
+    """
+    Rollback schema.
+    """
+    cursor.execute("DROP INDEX IF EXISTS chat_history_parent_id")
+    cursor.execute("ALTER TABLE chat_history DROP COLUMN fork_message_id")
+    cursor.execute("ALTER TABLE chat_history DROP COLUMN parent_id")
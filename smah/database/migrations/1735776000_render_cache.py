@@ -0,0 +1,27 @@
+def up(cursor):
+    """
+    Apply schema.
+
+    Rendered (ANSI) output of history messages, keyed by a hash of the message and the render
+    options and by terminal width. Entries are derived data: they are compressed, never archived
+    and safe to drop at any time.
+    """
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS render_cache(
+            hash TEXT NOT NULL,
+            width INTEGER NOT NULL,
+            codec VARCHAR(16) NOT NULL,
+            data BLOB NOT NULL,
+            created_on TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY(hash, width)
+        ) WITHOUT ROWID
+        """
+    )
+
+
+def down(cursor):
+    """
+    Rollback schema.
+    """
+    cursor.execute("DROP TABLE IF EXISTS render_cache")
@@ -0,0 +1,331 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from typing import Callable, Optional
+
+from smah.database.database import Database
+
+
+class Retention:
+    """
+    Keeps the hot history database small.
+
+    Sessions that fall outside the retention policy (older than `max_age_days`, or the oldest
+    sessions while the database is larger than `max_size_mb`) are moved, with their messages,
+    summaries and blobs, into an archive database attached alongside it. Pages freed by the move
+    are returned to the filesystem with bounded `incremental_vacuum` steps, so compaction never
+    holds the write lock for long and concurrent smah processes keep working.
+
+    The policy is stored in the database's `settings` table. When it is marked `auto`, `maintain`
+    applies it at most once per `interval_hours`.
+    """
+    DEFAULT_POLICY: dict = {
+        "max_age_days": None,
+        "max_size_mb": None,
+        "archive": None,
+        "auto": False,
+        "interval_hours": 24
+    }
+
+    # Tables moved to the archive, in copy order. Deletes run in reverse.
+    TABLES = [
+        ("chat_history", "id"),
+        ("chat_history_details", "chat_history_id"),
+        ("chat_history_message", "chat_history_id"),
+        ("chat_history_summary", "chat_history_id"),
+    ]
+
+    # Sessions moved per transaction, smaller batches while trimming to size so little is archived past the limit.
+    BATCH_SIZE = 50
+    SIZE_BATCH_SIZE = 10
+    # Pages released per incremental vacuum step, and the time spent vacuuming per run.
+    VACUUM_PAGES = 256
+    VACUUM_SECONDS = 2.0
+
+    @staticmethod
+    def default_policy() -> dict:
+        return dict(Retention.DEFAULT_POLICY)
+
+    @staticmethod
+    def default_archive(file: str) -> str:
+        root, ext = os.path.splitext(file)
+        return f"{root}.archive{ext or '.db'}"
+
+    def __init__(self, database: Database):
+        self.database = database
+        self.file = database.file
+        # Compaction runs on its own connection so the attached archive never leaks into other threads.
+        self.connection: Optional[sqlite3.Connection] = None
+
+    def open(self) -> sqlite3.Connection:
+        if self.connection is None:
+            self.connection = Database.connect(self.file)
+        return self.connection
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def setting(self, name: str) -> Optional[str]:
+        row = self.open().execute("SELECT setting_value FROM settings WHERE setting = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_setting(self, name: str, value: str) -> None:
+        self.open().execute(
+            """
+            INSERT INTO settings (setting, setting_value)
+            VALUES (?, ?)
+            ON CONFLICT(setting) DO UPDATE SET
+                setting_value = excluded.setting_value
+            """,
+            (name, value)
+        )
+
+    def policy(self) -> dict:
+        """
+        Returns the stored retention policy, with defaults for unset keys.
+        """
+        stored = self.setting("retention_policy")
+        return {**self.default_policy(), **(json.loads(stored) if stored else {})}
+
+    def save_policy(self, **policy) -> dict:
+        """
+        Updates the stored retention policy, keys passed as None are left unchanged.
+        """
+        current = self.policy()
+        current.update({k: v for k, v in policy.items() if v is not None})
+        self.set_setting("retention_policy", json.dumps(current))
+        return current
+
+    def size(self) -> int:
+        """
+        Bytes in use by the database (allocated pages less free pages).
+        """
+        connection = self.open()
+        page_count = connection.execute("PRAGMA main.page_count").fetchone()[0]
+        free = connection.execute("PRAGMA main.freelist_count").fetchone()[0]
+        page_size = connection.execute("PRAGMA main.page_size").fetchone()[0]
+        return (page_count - free) * page_size
+
+    def attach(self, archive: str) -> None:
+        """
+        Attaches the archive database, creating or extending its tables to match the hot database.
+        """
+        connection = self.open()
+        if os.path.dirname(archive):
+            os.makedirs(os.path.dirname(archive), exist_ok=True)
+        connection.execute("ATTACH DATABASE ? AS archive", (archive,))
+        for table in [t for t, _ in self.TABLES] + ["blob"]:
+            (sql,) = connection.execute(
+                "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+            ).fetchone()
+            connection.execute(
+                re.sub(r"^CREATE TABLE (IF NOT EXISTS )?", "CREATE TABLE IF NOT EXISTS archive.", sql, count=1)
+            )
+            # Columns added to the hot table by later migrations.
+            archived = {row[1] for row in connection.execute(f"PRAGMA archive.table_info({table})")}
+            for _, name, type, _, default, _ in connection.execute(f"PRAGMA main.table_info({table})").fetchall():
+                if name not in archived:
+                    column = f"{name} {type}" + (f" DEFAULT {default}" if default is not None else "")
+                    connection.execute(f"ALTER TABLE archive.{table} ADD COLUMN {column}")
+
+    def detach(self) -> None:
+        self.open().execute("DETACH DATABASE archive")
+
+    def candidates(self, max_age_days: Optional[float], over_size: bool, limit: int) -> list:
+        """
+        Picks the next batch of sessions to archive, oldest first. The last session is always kept,
+        as are sessions with forks in the hot database (their messages are shared with the forks).
+        """
+        connection = self.open()
+        keep = self.setting("last_session")
+        keep = int(keep) if keep else -1
+        if over_size:
+            rows = connection.execute(
+                """
+                SELECT id FROM chat_history
+                WHERE id != ?
+                  AND NOT EXISTS (SELECT 1 FROM chat_history AS fork WHERE fork.parent_id = chat_history.id)
+                ORDER BY created_on ASC, id ASC
+                LIMIT ?
+                """,
+                (keep, limit)
+            ).fetchall()
+        elif max_age_days is not None:
+            # Sessions are scanned by creation time through its index, then kept if they saw recent messages.
+            rows = connection.execute(
+                """
+                SELECT id FROM chat_history
+                WHERE created_on < datetime('now', ?) AND id != ?
+                  AND NOT EXISTS (SELECT 1 FROM chat_history AS fork WHERE fork.parent_id = chat_history.id)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM chat_history_message
+                      WHERE chat_history_message.chat_history_id = chat_history.id
+                        AND chat_history_message.created_on >= datetime('now', ?)
+                  )
+                ORDER BY created_on ASC, id ASC
+                LIMIT ?
+                """,
+                (f"-{max_age_days} days", keep, f"-{max_age_days} days", limit)
+            ).fetchall()
+        else:
+            rows = []
+        return [id for (id,) in rows]
+
+    def move(self, sessions: list) -> None:
+        """
+        Moves sessions into the attached archive in one transaction.
+        """
+        connection = self.open()
+        marks = ",".join("?" * len(sessions))
+        connection.execute("BEGIN IMMEDIATE TRANSACTION")
+        try:
+            for table, key in self.TABLES:
+                columns = ", ".join(row[1] for row in connection.execute(f"PRAGMA main.table_info({table})"))
+                connection.execute(
+                    f"INSERT OR REPLACE INTO archive.{table} ({columns}) SELECT {columns} FROM main.{table} WHERE {key} IN ({marks})",
+                    sessions
+                )
+            connection.execute(
+                f"""
+                INSERT OR IGNORE INTO archive.blob
+                SELECT * FROM main.blob WHERE hash IN (
+                    SELECT pipe_blob FROM main.chat_history_details WHERE chat_history_id IN ({marks})
+                    UNION
+                    SELECT message_blob FROM main.chat_history_message WHERE chat_history_id IN ({marks})
+                )
+                """,
+                sessions + sessions
+            )
+            for table, key in reversed(self.TABLES):
+                connection.execute(f"DELETE FROM main.{table} WHERE {key} IN ({marks})", sessions)
+            # Blobs are shared between sessions, only drop those nothing in the hot database references.
+            connection.execute(
+                """
+                DELETE FROM main.blob
+                WHERE hash NOT IN (SELECT pipe_blob FROM main.chat_history_details WHERE pipe_blob IS NOT NULL)
+                  AND hash NOT IN (SELECT message_blob FROM main.chat_history_message WHERE message_blob IS NOT NULL)
+                """
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def incremental(self) -> bool:
+        """
+        Checks if the database uses incremental auto vacuum, without which freed pages can only be
+        released by a full VACUUM.
+        """
+        return self.open().execute("PRAGMA main.auto_vacuum").fetchone()[0] == 2
+
+    def convert(self) -> None:
+        """
+        Converts a database created before incremental auto vacuum was enabled. This takes one full
+        VACUUM, which rewrites the file and holds an exclusive lock until it is done, so it is only
+        run when the operator asks for it (`smah-db compact --convert`).
+        """
+        connection = self.open()
+        connection.execute("PRAGMA main.auto_vacuum=INCREMENTAL")
+        connection.execute("VACUUM main")
+        logging.warning("[RETENTION] converted database to incremental auto vacuum")
+
+    def vacuum(self, seconds: Optional[float] = None) -> int:
+        """
+        Releases free pages in bounded steps until none are left or the time budget is spent.
+        Databases without incremental auto vacuum release nothing until they are converted.
+
+        Returns:
+            int: Pages released.
+        """
+        connection = self.open()
+        if not self.incremental():
+            logging.warning("[RETENTION] incremental vacuum is off, run `smah-db compact --convert` to enable it")
+            return 0
+        deadline = time.monotonic() + (self.VACUUM_SECONDS if seconds is None else seconds)
+        released = 0
+        while time.monotonic() < deadline:
+            free = connection.execute("PRAGMA main.freelist_count").fetchone()[0]
+            if not free:
+                break
+            # executescript steps the pragma to completion, execute() would release a single page.
+            connection.executescript(f"PRAGMA main.incremental_vacuum({min(free, self.VACUUM_PAGES)});")
+            remaining = connection.execute("PRAGMA main.freelist_count").fetchone()[0]
+            if remaining >= free:
+                break
+            released += free - remaining
+        return released
+
+    def compact(
+            self,
+            max_age_days: Optional[float] = None,
+            max_size_mb: Optional[float] = None,
+            archive: Optional[str] = None,
+            vacuum_seconds: Optional[float] = None,
+            progress: Optional[Callable] = None
+    ) -> dict:
+        """
+        Archives sessions outside the retention policy and vacuums the freed space.
+        Arguments left as None fall back to the stored policy.
+
+        Args:
+            max_age_days (Optional[float]): Archive sessions with no activity for this many days.
+            max_size_mb (Optional[float]): Archive the oldest sessions while the database is larger than this.
+            archive (Optional[str]): Archive database path.
+            vacuum_seconds (Optional[float]): Time budget for incremental vacuum.
+            progress (Optional[callable]): Called with (sessions archived, database bytes) after each batch.
+
+        Returns:
+            dict: "archived" sessions, "released" pages and database size "before"/"after" in bytes.
+        """
+        self.database.flush()
+        policy = self.policy()
+        max_age_days = policy["max_age_days"] if max_age_days is None else max_age_days
+        max_size_mb = policy["max_size_mb"] if max_size_mb is None else max_size_mb
+        archive = archive or policy["archive"] or self.default_archive(self.file)
+        limit = int(max_size_mb * 1024 * 1024) if max_size_mb else None
+
+        before = self.size()
+        archived = 0
+        if max_age_days is not None or limit is not None:
+            self.attach(archive)
+            try:
+                while True:
+                    sessions = self.candidates(max_age_days, False, self.BATCH_SIZE)
+                    if not sessions and limit is not None and self.size() > limit:
+                        sessions = self.candidates(None, True, self.SIZE_BATCH_SIZE)
+                    if not sessions:
+                        break
+                    self.move(sessions)
+                    archived += len(sessions)
+                    if progress:
+                        progress(archived, self.size())
+            finally:
+                self.detach()
+        if archived:
+            # Renders are keyed by content, not session; they are cheap to rebuild, drop them all.
+            self.open().execute("DELETE FROM render_cache")
+        released = self.vacuum(vacuum_seconds)
+        self.set_setting("retention_last_run", str(time.time()))
+        if archived:
+            logging.info(f"[RETENTION] archived {archived} sessions to {archive}")
+        return {"archived": archived, "released": released, "before": before, "after": self.size()}
+
+    def maintain(self) -> Optional[dict]:
+        """
+        Applies the stored policy if it is automatic and due.
+
+        Returns:
+            Optional[dict]: The compaction outcome, None if nothing was due.
+        """
+        policy = self.policy()
+        if not policy["auto"]:
+            return None
+        last = self.setting("retention_last_run")
+        if last and time.time() - float(last) < policy["interval_hours"] * 3600:
+            return None
+        return self.compact()
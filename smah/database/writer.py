@@ -0,0 +1,205 @@
+import atexit
+import json
+import logging
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from typing import Callable, Optional
+
+from smah.database.blob_store import BlobStore
+
+
+class Writer:
+    """
+    Write-behind queue for chat history.
+
+    Writes are queued by the foreground thread and drained by a background thread, so the user is not
+    kept waiting on fsync after a response has been printed. Each drain commits everything queued in a
+    single transaction, with consecutive message appends merged into one `executemany`.
+
+    In group-commit mode (batch and daemon workloads) the drain waits up to GROUP_DELAY for more writes
+    before committing, trading a little latency for far fewer commits.
+
+    Pending writes are flushed at interpreter exit, which covers normal exit, `exit()` and SIGINT
+    (KeyboardInterrupt unwinding to the top level).
+
+    A write that fails is retried on its own with exponential backoff (RETRIES times, starting at
+    BACKOFF seconds), staying queued so `flush` keeps waiting on it. Writes that still fail are
+    reported by the next `flush`, and on stderr at exit.
+    """
+    GROUP_DELAY = 0.05
+    GROUP_SIZE = 1000
+    RETRIES = 4
+    BACKOFF = 0.25
+    # Message keys stored in the typed columns, anything else (name, tool_calls, ...) keeps the JSON.
+    COLUMN_KEYS = ("role", "content")
+
+    def __init__(self, connection: sqlite3.Connection, lock: threading.RLock, group_commit: bool = False):
+        self.connection = connection
+        self.lock = lock
+        self.blobs = BlobStore(connection)
+        self.group_commit = group_commit
+        self.queue: queue.Queue = queue.Queue()
+        self.failures: list = []
+        self.thread = threading.Thread(target=self.drain, name="smah-db-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.shutdown)
+
+    @staticmethod
+    def estimate_tokens(content: Optional[str]) -> int:
+        """
+        Rough token count of a message (~4 characters per token plus per message overhead).
+        """
+        return len(content or "") // 4 + 4
+
+    @staticmethod
+    def columns(cursor: sqlite3.Cursor, blobs: BlobStore, message: dict) -> tuple:
+        """
+        Prepares a message for the typed message columns.
+
+        Returns:
+            tuple: (role, content, token_count, byte_len, message_blob), content is a preview when the
+            message was stored as a blob. Counts always describe the full content.
+        """
+        content = message.get('content') or ""
+        inline, blob = blobs.message(cursor, message)
+        if blob:
+            content_inline = json.loads(inline)['content']
+        else:
+            content_inline = message.get('content')
+        return message.get('role'), content_inline, Writer.estimate_tokens(content), len(content.encode("utf-8")), blob
+
+    @staticmethod
+    def extended(message: dict) -> Optional[str]:
+        """
+        JSON of a message with keys the typed columns do not hold, None for plain role/content messages.
+        """
+        return json.dumps(message) if set(message) - set(Writer.COLUMN_KEYS) else None
+
+    def append(self, session_id: int, messages: list, model: Optional[str] = None) -> None:
+        """
+        Queues messages to be appended to a session.
+
+        Args:
+            model (Optional[str]): Model that produced the assistant messages.
+        """
+        self.queue.put(("append", (session_id, messages, model)))
+
+    def submit(self, job: Callable[[sqlite3.Cursor, BlobStore], None]) -> None:
+        """
+        Queues an arbitrary write, run with a cursor inside the drain's transaction.
+        """
+        self.queue.put(("job", job))
+
+    def flush(self) -> None:
+        """
+        Blocks until every queued write has been committed or has run out of retries.
+
+        Raises:
+            RuntimeError: If writes were dropped since the last flush.
+        """
+        if self.thread.is_alive():
+            self.queue.join()
+        if self.failures:
+            failures, self.failures = self.failures, []
+            raise RuntimeError(f"[DB WRITER] {len(failures)} write(s) could not be saved: {failures[-1]}")
+
+    def shutdown(self) -> None:
+        """
+        Flushes at interpreter exit, telling the user if chat history could not be saved.
+        """
+        try:
+            self.flush()
+        except RuntimeError as e:
+            print(str(e), file=sys.stderr)
+
+    def collect(self) -> list:
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.GROUP_DELAY if self.group_commit else None
+        while len(batch) < self.GROUP_SIZE:
+            try:
+                if deadline is None:
+                    batch.append(self.queue.get_nowait())
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def drain(self) -> None:
+        while True:
+            batch = self.collect()
+            try:
+                self.commit(batch)
+            except Exception as e:
+                # Retry one write at a time so a single bad write does not lose the whole group.
+                logging.error(f"[DB WRITER] group commit failed, retrying individually: {str(e)}")
+                for item in batch:
+                    self.retry(item)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def retry(self, item: tuple) -> None:
+        """
+        Commits a single write, backing off between attempts (e.g. while another process holds the lock).
+        """
+        for attempt in range(self.RETRIES + 1):
+            try:
+                self.commit([item])
+                return
+            except Exception as e:
+                if attempt < self.RETRIES:
+                    time.sleep(self.BACKOFF * 2 ** attempt)
+                    continue
+                logging.error(f"[DB WRITER] write failed after {attempt + 1} attempts: {str(e)}\n---------- trace -------------\n{traceback.format_exc()}\n")
+                self.failures.append(str(e))
+
+    def commit(self, batch: list) -> None:
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE TRANSACTION")
+            try:
+                rows: list = []
+                for kind, payload in batch:
+                    if kind == "append":
+                        session_id, messages, model = payload
+                        rows.extend(self.row(cursor, self.blobs, session_id, message, model) for message in messages)
+                    else:
+                        self.insert(cursor, rows)
+                        rows = []
+                        payload(cursor, self.blobs)
+                self.insert(cursor, rows)
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            finally:
+                cursor.close()
+
+    @staticmethod
+    def row(cursor: sqlite3.Cursor, blobs: BlobStore, session_id: int, message: dict, model: Optional[str] = None) -> tuple:
+        """
+        Builds the `insert` row for a message, the model is only recorded on assistant messages.
+        Blobs hold the whole message, otherwise extra keys are kept in the JSON column.
+        """
+        role, content, token_count, byte_len, blob = Writer.columns(cursor, blobs, message)
+        extended = None if blob else Writer.extended(message)
+        return session_id, role, content, token_count, byte_len, model if role == 'assistant' else None, blob, extended
+
+    @staticmethod
+    def insert(cursor: sqlite3.Cursor, rows: list) -> None:
+        if rows:
+            cursor.executemany(
+                """
+                INSERT INTO chat_history_message (chat_history_id, role, content, token_count, byte_len, model, message_blob, message)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows
+            )
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Iterable, Iterator
+
+from openai import NotGiven
+
+
+def fingerprint(request: dict, stream: bool = False) -> str:
+    """
+    Returns a stable digest of a completion request (model, final thread and options).
+    Unset (NOT_GIVEN) options are ignored so they do not change the key.
+
+    Args:
+        request (dict): The completion request arguments.
+        stream (bool): Whether the request streams, streamed and complete responses are keyed apart.
+
+    Returns:
+        str: Hex sha256 digest.
+    """
+    canonical = {k: v for k, v in request.items() if not isinstance(v, NotGiven)}
+    canonical['stream'] = stream
+    payload = json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Flight:
+    """
+    A single upstream request shared by every caller that asked for the same fingerprint while it was in flight.
+    Items (the result, or stream chunks) are kept so late joiners replay from the start.
+
+    A bounded publish blocks while even the furthest subscriber is BUFFER items behind, so a stream
+    is read from upstream no faster than its fastest reader consumes it.
+    """
+    BUFFER = 64
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.items: list = []
+        self.done: bool = False
+        self.error: BaseException | None = None
+        self.subscribers: int = 0
+        # Items consumed by each open subscription.
+        self.positions: dict[int, int] = {}
+
+    def lagging(self) -> bool:
+        return bool(self.positions) and len(self.items) - max(self.positions.values()) >= self.BUFFER
+
+    def publish(self, item: Any, bounded: bool = False) -> bool:
+        """
+        Adds an item for the subscribers.
+
+        Args:
+            bounded (bool): Wait for a subscriber to catch up when every one lags BUFFER items behind.
+
+        Returns:
+            bool: False if every subscriber has gone and the item was dropped.
+        """
+        with self.condition:
+            while bounded and self.subscribers > 0 and self.lagging():
+                self.condition.wait()
+            if bounded and self.subscribers <= 0:
+                return False
+            self.items.append(item)
+            self.condition.notify_all()
+            return True
+
+    def finish(self, error: BaseException | None = None) -> None:
+        with self.condition:
+            self.error = error
+            self.done = True
+            self.condition.notify_all()
+
+    def subscribe(self) -> "Subscription":
+        """
+        Returns an iterator over every item of the flight, blocking until more arrive or the flight finishes.
+        """
+        return Subscription(self)
+
+
+class Subscription:
+    """
+    One subscriber's iterator over a flight's items.
+
+    The subscriber is released when the flight ends, when the subscription is closed, or when it is
+    garbage collected, so a stream that is dropped without ever being iterated still lets the
+    flight cancel upstream.
+    """
+
+    def __init__(self, flight: Flight):
+        self.flight = flight
+        self.index = 0
+        self.closed = False
+        with flight.condition:
+            flight.positions[id(self)] = 0
+
+    def __iter__(self) -> "Subscription":
+        return self
+
+    def __next__(self) -> Any:
+        flight = self.flight
+        with flight.condition:
+            while not self.closed and self.index >= len(flight.items) and not flight.done:
+                flight.condition.wait()
+            if self.closed:
+                raise StopIteration
+            if self.index < len(flight.items):
+                self.index += 1
+                flight.positions[id(self)] = self.index
+                # Wakes a publisher waiting for room.
+                flight.condition.notify_all()
+                return flight.items[self.index - 1]
+            self.close()
+            if flight.error:
+                raise flight.error
+            raise StopIteration
+
+    def close(self) -> None:
+        with self.flight.condition:
+            if not self.closed:
+                self.closed = True
+                self.flight.subscribers -= 1
+                self.flight.positions.pop(id(self), None)
+                self.flight.condition.notify_all()
+
+    def __del__(self) -> None:
+        self.close()
+
+
+class Coalescer:
+    """
+    De-duplicates identical in-flight completion requests.
+
+    Concurrent callers with the same fingerprint (e.g. daemon clients sending byte identical pipe or
+    query requests) share one upstream call. Once a flight finishes it is dropped, later requests go
+    upstream again.
+
+    Flights live in process memory: only requests served by the same process share them, which in
+    practice means requests served by the daemon. Separate `smah` processes that bypass the daemon
+    each make their own upstream call.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights: dict[str, Flight] = {}
+
+    def join(self, key: str) -> tuple[Flight, bool]:
+        """
+        Returns the flight for key and whether the caller is its leader (created it).
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = Flight()
+                self.flights[key] = flight
+            with flight.condition:
+                flight.subscribers += 1
+            return flight, leader
+
+    def land(self, key: str, flight: Flight) -> None:
+        with self.lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+
+    def call(self, key: str, request: Callable[[], Any]) -> Any:
+        """
+        Runs request once for all concurrent callers with the same key and returns its result.
+
+        Args:
+            key (str): Request fingerprint.
+            request (Callable): Performs the upstream call.
+
+        Returns:
+            Any: The upstream result.
+        """
+        flight, leader = self.join(key)
+        if leader:
+            try:
+                flight.publish(request())
+                flight.finish()
+            except BaseException as e:
+                flight.finish(e)
+            finally:
+                self.land(key, flight)
+        subscription = flight.subscribe()
+        try:
+            return next(subscription)
+        finally:
+            subscription.close()
+
+    def stream(self, key: str, request: Callable[[], Iterable]) -> Iterator:
+        """
+        Streams request once for all concurrent callers with the same key.
+
+        The upstream stream is pumped on a background thread so a slow or departed subscriber never
+        stalls the others, and no further ahead than Flight.BUFFER chunks of the fastest subscriber,
+        so slow readers hold back the upstream read. When every subscriber has gone the upstream
+        stream is closed, which cancels the request.
+
+        Args:
+            key (str): Request fingerprint.
+            request (Callable): Opens the upstream stream.
+
+        Returns:
+            Iterator: The stream's items.
+        """
+        flight, leader = self.join(key)
+        # Subscribed before the pump starts, so it is held back from the first chunk.
+        subscription = flight.subscribe()
+        if leader:
+            threading.Thread(target=self.pump, args=(key, flight, request), daemon=True).start()
+        return subscription
+
+    def pump(self, key: str, flight: Flight, request: Callable[[], Iterable]) -> None:
+        source = None
+        try:
+            source = request()
+            for item in source:
+                if not flight.publish(item, bounded=True):
+                    break
+            flight.finish()
+        except BaseException as e:
+            flight.finish(e)
+        finally:
+            self.land(key, flight)
+            close = getattr(source, "close", None)
+            if close:
+                close()
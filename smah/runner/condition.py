@@ -0,0 +1,220 @@
+import ast
+import operator
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
+
+
+class Condition:
+    """
+    A compiled `exec-if` expression.
+
+    Conditions are model written, so they are never handed to `eval`. The source is parsed once into
+    a Python AST, checked against an allowlist (literals, names, boolean logic, comparisons,
+    arithmetic, subscripts, attribute lookups on dicts and a few pure builtins) and compiled into a
+    tree of closures. Compiled conditions are cached by source text, so batches of responses
+    repeating the same conditions compile each of them once.
+
+    Names are looked up in the conditions passed to `evaluate` (operator choices and system
+    details), names that are not set evaluate to None.
+    """
+    CACHE_SIZE = 512
+    CACHE: OrderedDict = OrderedDict()
+    CACHE_LOCK = threading.Lock()
+
+    UNARY = {ast.Not: operator.not_, ast.USub: operator.neg, ast.UAdd: operator.pos}
+    BINARY = {
+        ast.Add: lambda a, b: Condition.concatenate(a, b),
+        ast.Sub: operator.sub,
+        ast.Mult: lambda a, b: Condition.multiply(a, b),
+        ast.Div: operator.truediv,
+        ast.FloorDiv: operator.floordiv,
+        ast.Mod: lambda a, b: Condition.modulo(a, b),
+    }
+    COMPARE = {
+        ast.Eq: operator.eq,
+        ast.NotEq: operator.ne,
+        ast.Lt: operator.lt,
+        ast.LtE: operator.le,
+        ast.Gt: operator.gt,
+        ast.GtE: operator.ge,
+        ast.In: lambda a, b: a in b,
+        ast.NotIn: lambda a, b: a not in b,
+        ast.Is: operator.is_,
+        ast.IsNot: operator.is_not,
+    }
+    FUNCTIONS = {
+        "len": len,
+        "min": min,
+        "max": max,
+        "abs": abs,
+        "int": int,
+        "float": float,
+        "str": lambda value: Condition.text(value),
+        "bool": bool,
+    }
+    # Guards against expressions built to exhaust memory or recursion. MAX_SIZE bounds the length
+    # of every sequence an expression builds, checked before it is built.
+    MAX_LENGTH = 1024
+    MAX_SIZE = 4096
+
+    @staticmethod
+    def multiply(a: Any, b: Any) -> Any:
+        """
+        Multiplication that refuses to build a sequence longer than MAX_SIZE.
+        """
+        for sequence, count in ((a, b), (b, a)):
+            if isinstance(sequence, (str, list, tuple)) and isinstance(count, int) and len(sequence) * count > Condition.MAX_SIZE:
+                raise ValueError("exec-if condition builds a sequence that is too long")
+        return a * b
+
+    @staticmethod
+    def concatenate(a: Any, b: Any) -> Any:
+        """
+        Addition that refuses to build a sequence longer than MAX_SIZE.
+        """
+        if isinstance(a, (str, list, tuple)) and isinstance(b, (str, list, tuple)) and len(a) + len(b) > Condition.MAX_SIZE:
+            raise ValueError("exec-if condition builds a sequence that is too long")
+        return a + b
+
+    @staticmethod
+    def text(value: Any) -> str:
+        """
+        `str` for scalars only. Containers are cheap to nest (repetition copies references), but
+        converting one writes out every element: a few nested repetitions would build gigabytes.
+        """
+        if not isinstance(value, (str, int, float, bool, type(None))):
+            raise ValueError("exec-if condition converts a container to a string")
+        return str(value)
+
+    @staticmethod
+    def modulo(a: Any, b: Any) -> Any:
+        """
+        Numeric modulo only, `%` string formatting can build strings of any width.
+        """
+        if isinstance(a, (str, bytes)):
+            raise ValueError("exec-if condition uses string formatting")
+        return operator.mod(a, b)
+
+    @staticmethod
+    def compile(source: str) -> "Condition":
+        """
+        Returns the (cached) compiled condition for an expression.
+
+        Raises:
+            ValueError: The expression is not valid or uses anything outside the allowlist.
+        """
+        with Condition.CACHE_LOCK:
+            condition = Condition.CACHE.get(source)
+            if condition is not None:
+                Condition.CACHE.move_to_end(source)
+                return condition
+        condition = Condition(source)
+        with Condition.CACHE_LOCK:
+            Condition.CACHE[source] = condition
+            while len(Condition.CACHE) > Condition.CACHE_SIZE:
+                Condition.CACHE.popitem(last=False)
+        return condition
+
+    def __init__(self, source: str):
+        self.source = source
+        if len(source) > self.MAX_LENGTH:
+            raise ValueError(f"exec-if condition longer than {self.MAX_LENGTH} characters")
+        try:
+            tree = ast.parse(source.strip(), mode="eval")
+        except SyntaxError as e:
+            raise ValueError(f"Invalid exec-if condition {source!r}: {e.msg}")
+        self.evaluator = self.build(tree.body)
+
+    def evaluate(self, conditions: dict) -> Any:
+        return self.evaluator(conditions)
+
+    def build(self, node: ast.AST) -> Callable[[dict], Any]:
+        """
+        Compiles an allowlisted AST node into a closure over the conditions.
+        """
+        if isinstance(node, ast.Constant):
+            value = node.value
+            return lambda conditions: value
+        if isinstance(node, ast.Name):
+            name = node.id
+            if name in ("True", "False", "None"):
+                value = {"True": True, "False": False, "None": None}[name]
+                return lambda conditions: value
+            return lambda conditions: conditions.get(name)
+        if isinstance(node, (ast.Tuple, ast.List, ast.Set)):
+            items = [self.build(item) for item in node.elts]
+            kind = {ast.Tuple: tuple, ast.List: list, ast.Set: set}[type(node)]
+            return lambda conditions: kind(item(conditions) for item in items)
+        if isinstance(node, ast.BoolOp):
+            values = [self.build(value) for value in node.values]
+            if isinstance(node.op, ast.And):
+                def evaluate_and(conditions):
+                    result = True
+                    for value in values:
+                        result = value(conditions)
+                        if not result:
+                            return result
+                    return result
+                return evaluate_and
+
+            def evaluate_or(conditions):
+                result = False
+                for value in values:
+                    result = value(conditions)
+                    if result:
+                        return result
+                return result
+            return evaluate_or
+        if isinstance(node, ast.UnaryOp) and type(node.op) in self.UNARY:
+            op, operand = self.UNARY[type(node.op)], self.build(node.operand)
+            return lambda conditions: op(operand(conditions))
+        if isinstance(node, ast.BinOp) and type(node.op) in self.BINARY:
+            op, left, right = self.BINARY[type(node.op)], self.build(node.left), self.build(node.right)
+            return lambda conditions: op(left(conditions), right(conditions))
+        if isinstance(node, ast.Compare):
+            if any(type(op) not in self.COMPARE for op in node.ops):
+                raise ValueError(f"Unsupported comparison in exec-if condition {self.source!r}")
+            left = self.build(node.left)
+            comparisons = [(self.COMPARE[type(op)], self.build(right)) for op, right in zip(node.ops, node.comparators)]
+
+            def evaluate_compare(conditions):
+                a = left(conditions)
+                for op, right in comparisons:
+                    b = right(conditions)
+                    if not op(a, b):
+                        return False
+                    a = b
+                return True
+            return evaluate_compare
+        if isinstance(node, ast.IfExp):
+            test, body, orelse = self.build(node.test), self.build(node.body), self.build(node.orelse)
+            return lambda conditions: body(conditions) if test(conditions) else orelse(conditions)
+        if isinstance(node, ast.Attribute):
+            # Attribute lookups only read keys of dict valued conditions (e.g. system.os).
+            if node.attr.startswith("_"):
+                raise ValueError(f"Private attribute in exec-if condition {self.source!r}")
+            value, attr = self.build(node.value), node.attr
+
+            def evaluate_attribute(conditions):
+                container = value(conditions)
+                return container.get(attr) if isinstance(container, dict) else None
+            return evaluate_attribute
+        if isinstance(node, ast.Subscript):
+            value, key = self.build(node.value), self.build(node.slice)
+
+            def evaluate_subscript(conditions):
+                container = value(conditions)
+                if not isinstance(container, (dict, list, tuple, str)):
+                    return None
+                try:
+                    return container[key(conditions)]
+                except (KeyError, IndexError, TypeError):
+                    return None
+            return evaluate_subscript
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in self.FUNCTIONS or node.keywords:
+                raise ValueError(f"Unsupported call in exec-if condition {self.source!r}")
+            function, args = self.FUNCTIONS[node.func.id], [self.build(arg) for arg in node.args]
+            return lambda conditions: function(*(arg(conditions) for arg in args))
+        raise ValueError(f"Unsupported {type(node).__name__} in exec-if condition {self.source!r}")
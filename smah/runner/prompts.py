@@ -1,3 +1,4 @@
+import re
 import textwrap
 
 import yaml
@@ -9,6 +10,10 @@ from smah.settings.inference import Inference
 class Prompts:
     MAX_PIPE_LENGTH = 2048
     PIPE_HEAD_LENGTH = 1024
+    # Live system readings change on every request. They are sent in their own section, which
+    # `stable` leaves out so identical requests fingerprint the same.
+    STATS_KEYS = ("cpu", "memory", "disk")
+    STATS_SECTION = re.compile(r"\n+# System Stats\n.*?```yaml\n.*?```", re.DOTALL)
 
     def __init__(self):
         pass
@@ -305,7 +310,9 @@ class Prompts:
         Generates a system settings prompt based on the provided settings.
         """
         operator = yaml.dump(settings.user.to_yaml({"stats": True, "prompt": True}), sort_keys=False)
-        system = yaml.dump(settings.system.to_yaml({"prompt": True, "stats": True}), sort_keys=False)
+        system = settings.system.to_yaml({"prompt": True, "stats": True})
+        stats = yaml.dump({k: system.pop(k) for k in Prompts.STATS_KEYS if k in system}, sort_keys=False)
+        system = yaml.dump(system, sort_keys=False)
         if not include_system:
             template = textwrap.dedent(
                 """
@@ -339,9 +346,26 @@ class Prompts:
                 ```yaml
                 {system}
                 ```
-                """).strip().format(operator=operator, system=system)
+
+                # System Stats
+                Readings taken when this request was made.
+                ```yaml
+                {stats}
+                ```
+                """).strip().format(operator=operator, system=system, stats=stats)
         return Prompts.message(content=template)
 
+    @staticmethod
+    def stable(thread: list) -> list:
+        """
+        Returns the thread without its live system readings, for request fingerprints.
+        """
+        return [
+            {**message, 'content': Prompts.STATS_SECTION.sub("", message['content'])}
+            if isinstance(message.get('content'), str) and "# System Stats" in message['content'] else message
+            for message in thread
+        ]
+
     @staticmethod
     def query_prompt(request: str):
         prompt = textwrap.dedent(
@@ -394,6 +418,37 @@ class Prompts:
         ).format(request=request)
         return Prompts.message(content=prompt)
 
+    @staticmethod
+    def summarize_prompt(messages: list, summary: str | None = None):
+        """
+        Builds the request used to compact older conversation turns into a rolling summary.
+
+        Args:
+            messages (list): The messages to fold into the summary.
+            summary (str | None): The previous summary these messages follow, if any.
+
+        Returns:
+            dict: The summarization request message.
+        """
+        transcript = "\n\n".join(f"--- {m['role']} ---\n{m['content']}" for m in messages)
+        prompt = textwrap.dedent(
+            """
+            # SYSTEM PROMPT
+            You compact conversations between an operator and an in-terminal AI Assistant.
+            Write a concise summary of the conversation below that preserves everything needed to continue it:
+            the operator's goals, facts about their system, decisions made, commands suggested or run and their outcomes, and open questions.
+            Drop pleasantries and thought statements. Output only the summary.
+            """
+        ).strip()
+        if summary:
+            prompt += "\n\n# Summary Of Earlier Conversation\n" + summary
+        prompt += "\n\n# Conversation\n" + transcript
+        return Prompts.message(content=prompt)
+
+    @staticmethod
+    def summary_message(summary: str):
+        return Prompts.message(content=f"--- SUMMARY OF EARLIER CONVERSATION ---\n{summary}")
+
     @staticmethod
     def pipe_prompt():
         prompt = textwrap.dedent(
@@ -1,8 +1,16 @@
+import copy
+import hashlib
+import logging
+import re
 import textwrap
+import threading
+from collections import OrderedDict
 from enum import Enum
 from typing import Optional
 from lxml import etree
 
+from smah.runner.condition import Condition
+
 html_tags = [
     "a",
     "abbr",
@@ -112,6 +120,36 @@ html_tags = [
     "wbr",
 ]
 
+# Tags smah understands, in addition to html_tags, which are left as markup by escape_response.
+smah_tags = ["smah-", "cot", "exec", "prompt", "title", "command", "set-condition", "choices", "choice"]
+
+# One pass escaper: matches `&amp;`, `&` and every `<` with the tag name (if any) that follows it.
+ESCAPE_PATTERN = re.compile(r"&amp;|&|<(/?)([A-Za-z_][\w.:-]*)?")
+# Tags left as markup, matched as a prefix of the tag name.
+KNOWN_TAG = re.compile("|".join(re.escape(tag) for tag in smah_tags + html_tags))
+ESCAPES = {
+    "&amp;": ":_smah_amp_amp_:",
+    "&": ":_smah_amp_:",
+    "<": ":_smah_lt_:",
+}
+
+# One pass unescaper for escape_response markers, used on text read from parsed elements.
+UNESCAPE_PATTERN = re.compile(r":_smah_lt_:|:_smah_amp_amp_:|:_smah_amp_:")
+UNESCAPES = {
+    ":_smah_lt_:": "<",
+    ":_smah_amp_amp_:": "&amp;",
+    ":_smah_amp_:": "&",
+}
+# Serialized trees also hold the entities lxml writes for `&`, `<` and `>` in text. The input never
+# contains raw entities (they were escaped), so both are decoded in the same single pass.
+UNESCAPE_MARKUP_PATTERN = re.compile(r":_smah_lt_:|:_smah_amp_amp_:|:_smah_amp_:|&lt;|&gt;|&amp;")
+UNESCAPES_MARKUP = {
+    **UNESCAPES,
+    "&lt;": "<",
+    "&gt;": ">",
+    "&amp;": "&",
+}
+
 class ThoughtType(Enum):
     OTHER = 0
     THINKING = 1
@@ -120,13 +158,32 @@ class ThoughtType(Enum):
     INNER_CRITIC = 4
     TANGENT = 5
 
+# Compiled once; selecting by CSS translated and compiled a selector on every property read.
+CHILD_XPATHS = {
+    tag: etree.XPath(f"descendant::{tag}[1]")
+    for tag in ["title", "purpose", "command", "prompt"]
+}
+CHOICE_XPATH = etree.XPath("descendant::choices//choice")
+
 class TagBase(etree.ElementBase):
+    def cached(self, key: str, extract):
+        """
+        Memoizes a value extracted from this element. The cache lives on the element proxy, which
+        lxml keeps while it is referenced (e.g. during a tree walk).
+        """
+        values = self.__dict__.setdefault("values", {})
+        if key not in values:
+            values[key] = extract()
+        return values[key]
+
     def extract_child(self, tag: str):
-        child = self.cssselect(tag)
-        if len(child) > 0:
-            child = child[0]
-            return ResponseParser.unescape_response(child.text.strip())
-        return None
+        def extract():
+            xpath = CHILD_XPATHS.get(tag) or etree.XPath(f"descendant::{tag}[1]")
+            child = xpath(self)
+            if len(child) > 0:
+                return ResponseParser.unescape_response((child[0].text or "").strip())
+            return None
+        return self.cached(tag, extract)
 
 class SetConditionTag(TagBase):
     @property
@@ -144,8 +201,11 @@ class SetConditionTag(TagBase):
 
     @property
     def choices(self):
+        return self.cached("choices", self.extract_choices)
+
+    def extract_choices(self):
         choices = []
-        x = self.cssselect("choices choice")
+        x = CHOICE_XPATH(self)
         if len(x) > 0:
             for c in x:
                 c_value = ResponseParser.unescape_response(c.get("value"))
@@ -218,7 +278,7 @@ class ExecTag(TagBase):
 
     @property
     def shell(self):
-        return self.get("shell")
+        return ResponseParser.unescape_response(self.get("shell"))
 
     @property
     def exec_if(self):
@@ -240,7 +300,7 @@ class ExecTag(TagBase):
     def markdown(self):
         title = self.extract_child("title") or "Run Command"
         title = textwrap.indent(title, "# ")
-        shell = self.get("shell")
+        shell = self.shell
         command = self.extract_child("command") or ""
 
         template = textwrap.dedent(
@@ -270,6 +330,303 @@ class SmahLookup(etree.CustomElementClassLookup):
                 return SetConditionTag
         return None
 
+class ParsedResponse:
+    """
+    Everything smah needs from one assistant message, from a single parse.
+
+    The response is escaped and parsed once; exec commands, set-conditions and thought statements
+    are collected in the same walk and markdown is rendered from the parsed tree on demand (once per
+    `strip_cot` variant). Results are memoized by content hash, so printing a message and then
+    extracting its commands, or re-rendering it on resume, never parses it twice.
+    """
+    CACHE_SIZE = 128
+    CACHE: OrderedDict = OrderedDict()
+    CACHE_LOCK = threading.Lock()
+
+    @staticmethod
+    def parse(response: str) -> "ParsedResponse":
+        """
+        Returns the (memoized) analysis of a response.
+        """
+        key = hashlib.sha256(response.encode("utf-8")).digest()
+        with ParsedResponse.CACHE_LOCK:
+            parsed = ParsedResponse.CACHE.get(key)
+            if parsed is not None:
+                ParsedResponse.CACHE.move_to_end(key)
+                return parsed
+        parsed = ParsedResponse(response)
+        with ParsedResponse.CACHE_LOCK:
+            ParsedResponse.CACHE[key] = parsed
+            while len(ParsedResponse.CACHE) > ParsedResponse.CACHE_SIZE:
+                ParsedResponse.CACHE.popitem(last=False)
+        return parsed
+
+    def __init__(self, response: str):
+        self.response = response
+        self.exec_tags: list = []
+        self.condition_tags: list = []
+        self.thoughts: list = []
+        self.rendered: dict = {}
+        self.lock = threading.Lock()
+        self.root = None
+        if "<" not in response:
+            # No markup at all: nothing to extract and the markdown is the response itself.
+            self.rendered = {True: response, False: response}
+            return
+
+        parser = etree.XMLParser(recover=True)
+        parser.set_element_class_lookup(SmahLookup())
+        parser.feed("<smah-msg>\n" + ResponseParser.escape_response(response) + "\n</smah-msg>")
+        self.root = parser.close()
+
+        for _, elem in etree.iterwalk(self.root, events=("end",)):
+            if isinstance(elem, ExecTag):
+                # Tag properties are unescaped once when read, a second pass would decode
+                # entities written in the command itself.
+                self.exec_tags.append({
+                    'title': elem.title,
+                    'purpose': elem.purpose,
+                    'command': elem.command,
+                    'shell': elem.shell,
+                    'exec_if': elem.exec_if
+                })
+            elif isinstance(elem, SetConditionTag):
+                self.condition_tags.append({
+                    'name': elem.name,
+                    'prompt': elem.prompt,
+                    'choices': elem.choices
+                })
+            elif isinstance(elem, ThoughtTag):
+                self.thoughts.append({
+                    'type': elem.type,
+                    'thought': elem.thought
+                })
+
+    @property
+    def conditions(self) -> list:
+        return self.condition_tags
+
+    def commands(self, conditions: Optional[dict] = None) -> list:
+        """
+        Exec commands whose `exec-if` holds for the given conditions.
+        """
+        conditions = conditions or {}
+        commands = []
+        for tag in self.exec_tags:
+            c = tag['exec_if']
+            # include operator and system
+            try:
+                holds = c is None or Condition.compile(c).evaluate(conditions)
+            except Exception as e:
+                logging.warning(f"[EXEC-IF] {str(e)}")
+                holds = False
+            if holds:
+                commands.append({k: tag[k] for k in ('title', 'purpose', 'command', 'shell')})
+            else:
+                print(f"Skipping command: {tag['title']} due to falsy condition: {c}")
+        return commands
+
+    def markdown(self, strip_cot: bool = True) -> str:
+        """
+        Renders the response as markdown: exec tags become code blocks, set-conditions are dropped and
+        thoughts are dropped or rendered inline.
+        """
+        with self.lock:
+            if strip_cot not in self.rendered:
+                # Rendering rewrites the tree, keep the parsed one intact for the other variant.
+                root = copy.deepcopy(self.root)
+                for _, elem in etree.iterwalk(root, events=("end",)):
+                    if isinstance(elem, ExecTag):
+                        ResponseParser.replace_tag(elem, replace=elem.markdown, tail=elem.tail)
+                    elif isinstance(elem, SetConditionTag):
+                        ResponseParser.replace_tag(elem, replace=None, tail=elem.tail)
+                    elif isinstance(elem, ThoughtTag):
+                        ResponseParser.replace_tag(elem, replace=(None if strip_cot else elem.markdown), tail=elem.tail)
+                response = etree.tostring(root, pretty_print=True, encoding="unicode")
+                response = ResponseParser.unescape_markup(response)
+                self.rendered[strip_cot] = response[len("<smah-msg>\n"):-(len("\n</smah-msg>") + 1)]
+            return self.rendered[strip_cot]
+
+
+class StreamingParser:
+    """
+    Incremental parsing of a response as it streams in.
+
+    Text deltas are fed as they arrive. Each `exec`, `cot` or `set-condition` block is parsed (with
+    `ParsedResponse`) as soon as its closing tag arrives, and the text around blocks is released a
+    paragraph at a time. Only an unfinished block, a fragment that may still open one, or an
+    unfinished paragraph is held back.
+
+    `feed` and `close` return events in response order:
+        {'type': 'markdown', 'content': str}: Rendered markdown, blocks rendered as by `to_markdown`
+            (a rendered block also carries 'exec': True if it holds exec commands).
+        {'type': 'command', 'command': dict}: An exec command whose `exec-if` holds.
+        {'type': 'condition', 'condition': dict}: A set-condition.
+        {'type': 'thought', 'thought': dict}: A thought statement.
+    """
+    BLOCK_TAGS = ("exec", "cot", "set-condition")
+    OPEN_PATTERN = re.compile(r"<(exec|cot|set-condition)(?=[\s>/])")
+    FENCE = "```"
+    # Paragraph breaks and code fence markers, scanned once each as the buffer grows.
+    SCAN_PATTERN = re.compile(r"\n\s*\n|" + re.escape(FENCE))
+    # Longest opening tag prefix (`<set-condition`), held back while it may still be completed.
+    FRAGMENT = len("<set-condition")
+
+    def __init__(self, strip_cot: bool = True, conditions: Optional[dict] = None, evaluate: bool = True):
+        """
+        Args:
+            evaluate (bool): Evaluate `exec-if` and emit command events, False to only render.
+        """
+        self.strip_cot = strip_cot
+        self.conditions = conditions
+        self.evaluate = evaluate
+        self.buffer = ""
+        self.reset_scan()
+        self.column = 0
+        self.parts: list = []
+        self.commands: list = []
+        self.condition_tags: list = []
+        self.thoughts: list = []
+
+    @property
+    def response(self) -> str:
+        """
+        Everything fed so far.
+        """
+        return "".join(self.parts)
+
+    @staticmethod
+    def block_end(buffer: str, tag: str, start: int) -> Optional[int]:
+        """
+        End offset of the block opened at `start`, None while it is incomplete.
+        """
+        close = buffer.find(">", start)
+        if close < 0:
+            return None
+        if buffer[close - 1] == "/":
+            return close + 1
+        match = re.compile(r"</" + re.escape(tag) + r"\s*>").search(buffer, close + 1)
+        return match.end() if match else None
+
+    @staticmethod
+    def open_fragment(buffer: str) -> int:
+        """
+        Offset of a trailing fragment that may still become a block's opening tag, or len(buffer).
+        """
+        start = buffer.rfind("<", max(0, len(buffer) - StreamingParser.FRAGMENT))
+        if start >= 0:
+            fragment = buffer[start:]
+            if any(("<" + tag).startswith(fragment) for tag in StreamingParser.BLOCK_TAGS):
+                return start
+        return len(buffer)
+
+    def reset_scan(self) -> None:
+        """
+        Resets the buffer scan state: offsets searched for block tags and scanned for paragraphs,
+        whether the scanned text ends inside a code fence, and the last paragraph break found.
+        """
+        self.searched = 0
+        self.scanned = 0
+        self.fenced = False
+        self.cut = 0
+
+    def paragraphs(self, end: int) -> int:
+        """
+        Offset up to which the buffer (up to `end`) holds complete paragraphs, a paragraph break
+        inside an open code fence does not count.
+
+        Only text added since the last call is scanned, except for trailing whitespace or backticks
+        that may still become part of a break or fence.
+        """
+        last = self.scanned
+        for match in self.SCAN_PATTERN.finditer(self.buffer, self.scanned, end):
+            if match.group(0) == self.FENCE:
+                self.fenced = not self.fenced
+            elif not self.fenced:
+                self.cut = match.end()
+            last = match.end()
+        while end > last and self.buffer[end - 1] in " \t\r\n`":
+            end -= 1
+        self.scanned = end
+        return self.cut
+
+    def text(self, text: str) -> list:
+        if not text:
+            return []
+        # Column the next block starts at, blocks are indented to it as `replace_tag` does.
+        line = text.rsplit("\n", 1)
+        self.column = len(line[-1]) if len(line) > 1 else self.column + len(text)
+        return [{'type': 'markdown', 'content': text}]
+
+    def block(self, text: str) -> list:
+        parsed = ParsedResponse.parse(text)
+        events = []
+        markdown = parsed.markdown(strip_cot=self.strip_cot)
+        if markdown.strip():
+            markdown = textwrap.indent(markdown, " " * self.column).lstrip()
+            self.column = len(markdown.rsplit("\n", 1)[-1])
+            events.append({'type': 'markdown', 'content': markdown, 'exec': bool(parsed.exec_tags)})
+        for thought in parsed.thoughts:
+            self.thoughts.append(thought)
+            events.append({'type': 'thought', 'thought': thought})
+        for condition in parsed.conditions:
+            self.condition_tags.append(condition)
+            events.append({'type': 'condition', 'condition': condition})
+        for command in (parsed.commands(self.conditions) if self.evaluate else []):
+            self.commands.append(command)
+            events.append({'type': 'command', 'command': command})
+        return events
+
+    def feed(self, delta: Optional[str]) -> list:
+        """
+        Adds a text delta.
+
+        Returns:
+            list: Events completed by this delta.
+        """
+        if not delta:
+            return []
+        self.parts.append(delta)
+        self.buffer += delta
+        events = []
+        while True:
+            match = self.OPEN_PATTERN.search(self.buffer, self.searched)
+            if match is None:
+                # An opening tag may still complete at the end of the buffer.
+                self.searched = max(0, len(self.buffer) - self.FRAGMENT)
+                break
+            end = self.block_end(self.buffer, match.group(1), match.start())
+            if end is None:
+                # Text before an unfinished block is complete.
+                events.extend(self.text(self.buffer[:match.start()]))
+                self.buffer = self.buffer[match.start():]
+                self.reset_scan()
+                return events
+            events.extend(self.text(self.buffer[:match.start()]))
+            events.extend(self.block(self.buffer[match.start():end]))
+            self.buffer = self.buffer[end:]
+            self.reset_scan()
+        cut = self.paragraphs(self.open_fragment(self.buffer))
+        events.extend(self.text(self.buffer[:cut]))
+        # Scan offsets move with the text released, the cut is outside any fence.
+        self.buffer = self.buffer[cut:]
+        self.searched = max(0, self.searched - cut)
+        self.scanned -= cut
+        self.cut = 0
+        return events
+
+    def close(self) -> list:
+        """
+        Ends the stream, releasing whatever is held back. An unfinished block is parsed as is.
+        """
+        buffer, self.buffer = self.buffer, ""
+        self.reset_scan()
+        match = self.OPEN_PATTERN.search(buffer)
+        if match is None:
+            return self.text(buffer)
+        return self.text(buffer[:match.start()]) + self.block(buffer[match.start():])
+
+
 class ResponseParser:
     def __init__(self):
         pass
@@ -279,134 +636,79 @@ class ResponseParser:
         ps = elem.getprevious()
         p = elem.getparent()
         if ps is not None:
-            t = (ps.tail or "")
-            l = t.split("\n")
-            if len(l) > 0:
-                r = len(l[-1])
-                if replace:
-                    t += textwrap.indent(replace, " " * r).lstrip()
-                t += (tail or "")
-            else:
-                t += ((replace or "").lstrip() + (tail or ""))
-            ps.tail = t
-
+            ps.tail = ResponseParser.append_replacement(ps.tail or "", replace, tail)
         elif p is not None:
-            t = (p.text or "")
-            l = t.split("\n")
-            if len(l) > 0:
-                r = len(l[-1])
-                if replace:
-                    t += textwrap.indent(replace, " " * r).lstrip()
-                t += (tail or "")
-            else:
-                t += ((replace or "").lstrip() + (tail or ""))
-            p.text = t
+            p.text = ResponseParser.append_replacement(p.text or "", replace, tail)
         if p is not None:
             p.remove(elem)
 
+    @staticmethod
+    def append_replacement(t: str, replace: Optional[str], tail: Optional[str]) -> str:
+        """
+        Appends a replacement, indented to the column the text ends at, and the replaced element's tail.
+        """
+        # Only the last line sets the column, splitting all of t made many replacements quadratic.
+        r = len(t) - t.rfind("\n") - 1
+        if replace:
+            t += textwrap.indent(replace, " " * r).lstrip()
+        return t + (tail or "")
+
 
     @staticmethod
     def extract_conditions(response: str, options: Optional[dict] = None) -> Optional[list]:
-        options = options or {}
-        parser = etree.XMLPullParser(recover=True)
-        parser.set_element_class_lookup(SmahLookup())
-        events = parser.read_events()
-        response = ResponseParser.escape_response(response)
-        parser.feed("<smah-msg>" + response + "</smah-msg>")
-        response = []
-        for action, elem in events:
-            if action == "end":
-                if isinstance(elem, SetConditionTag):
-                    c = {
-                        'name': ResponseParser.unescape_response(elem.name),
-                        'prompt': ResponseParser.unescape_response(elem.prompt),
-                        'choices': elem.choices
-                    }
-                    response.append(c)
-        return response
+        return ParsedResponse.parse(response).conditions
 
     @staticmethod
     def extract_commands(response: str, options: Optional[dict] = None) -> Optional[list]:
         options = options or {}
-        parser = etree.XMLPullParser(recover=True)
-        parser.set_element_class_lookup(SmahLookup())
-        events = parser.read_events()
-
-        response = ResponseParser.escape_response(response)
-        parser.feed("<smah-msg>" + response + "</smah-msg>")
-        commands = []
-        for action, elem in events:
-            if action == "end":
-                if isinstance(elem, ExecTag):
-                    conditions = options.get("conditions") or {}
-                    # include operator and system
-                    c = elem.exec_if
-                    c = ResponseParser.unescape_response(c)
-                    if c is None or eval(c, conditions):
-                        c = {
-                            'title': ResponseParser.unescape_response(elem.title),
-                            'purpose': ResponseParser.unescape_response(elem.purpose),
-                            'command': ResponseParser.unescape_response(elem.command),
-                            'shell': ResponseParser.unescape_response(elem.shell)
-                        }
-                        commands.append(c)
-                    else:
-                        print(f"Skipping command: {elem.title} due to falsy condition: {c}")
-        return commands
+        return ParsedResponse.parse(response).commands(options.get("conditions"))
 
     @staticmethod
     def escape_response(response: str) -> str:
-        response = response.replace("<", ":_smah_lt_:")
-        response = response.replace("&amp;", ":_smah_amp_amp_:")
-        response = response.replace("&", ":_smah_amp_:")
-
-        for tag in ["smah-", "cot", "exec", "prompt", "title", "command", "set-condition", "choices", "choice"]:
-            response = response.replace(f":_smah_lt_:{tag}", f"<{tag}")
-            response = response.replace(f":_smah_lt_:/{tag}", f"</{tag}")
-
-        for tag in html_tags:
-            response = response.replace(f":_smah_lt_:{tag}", f"<{tag}")
-            response = response.replace(f":_smah_lt_:/{tag}", f"</{tag}")
-
-
-        return response
+        """
+        Escapes everything in a response that is not smah or html markup, so the response parses as XML.
+        A single scan: `&` and stray `<` are replaced with markers restored by `unescape_response`.
+        """
+        if "<" not in response and "&" not in response:
+            return response
+        # Closing tags with no open element of that name are escaped too: lxml's recovery would end
+        # the document at them, dropping everything after.
+        open_tags: dict = {}
+
+        def escape(match: re.Match) -> str:
+            text = match.group(0)
+            if text[0] == "&":
+                return ESCAPES[text]
+            close, name = match.group(1), match.group(2)
+            if name is None or not KNOWN_TAG.match(name):
+                return ESCAPES["<"] + text[1:]
+            if not close:
+                open_tags[name] = open_tags.get(name, 0) + 1
+                return text
+            if open_tags.get(name):
+                open_tags[name] -= 1
+                return text
+            return ESCAPES["<"] + text[1:]
+        return ESCAPE_PATTERN.sub(escape, response)
 
     @staticmethod
     def unescape_response(response: Optional[str]) -> Optional[str]:
         if response is None:
             return None
-        response = response.replace(":_smah_lt_:", "<")
-        response = response.replace(":_smah_amp_amp_:", "&amp;")
-        response = response.replace(":_smah_amp_:", "&")
+        if ":_smah_" not in response:
+            return response
+        return UNESCAPE_PATTERN.sub(lambda m: UNESCAPES[m.group(0)], response)
 
-        return response
+    @staticmethod
+    def unescape_markup(response: str) -> str:
+        """
+        Unescapes a serialized tree: escape_response markers and the entities lxml wrote for text.
+        """
+        if ":_smah_" not in response and "&" not in response:
+            return response
+        return UNESCAPE_MARKUP_PATTERN.sub(lambda m: UNESCAPES_MARKUP[m.group(0)], response)
 
     @staticmethod
     def to_markdown(response: str, options: Optional[dict] = None) -> str:
         options = options or {}
-        parser = etree.XMLPullParser(recover=True, encoding="utf-8")
-        parser.set_element_class_lookup(SmahLookup())
-        events = parser.read_events()
-        response = ResponseParser.escape_response(response)
-
-
-
-        parser.feed("<smah-msg>\n" + response + "\n</smah-msg>")
-        for action, elem in events:
-            if action == "end":
-                if isinstance(elem, ExecTag):
-                    ResponseParser.replace_tag(elem, replace=elem.markdown, tail=elem.tail)
-                elif isinstance(elem, SetConditionTag):
-                    ResponseParser.replace_tag(elem, replace=None, tail=elem.tail)
-                elif isinstance(elem, ThoughtTag):
-                    ResponseParser.replace_tag(elem, replace=(None if options.get("strip-cot", True) else elem.markdown), tail=elem.tail)
-
-        root = parser.close()
-        response = etree.tostring(root, pretty_print=True).decode()
-        response = ResponseParser.unescape_response(response)
-
-
-        return response[len("<smah-msg>\n"):-(len("\n</smah-msg>") + 1)]
-
-
-
+        return ParsedResponse.parse(response).markdown(strip_cot=options.get("strip-cot", True))
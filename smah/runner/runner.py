@@ -1,34 +1,51 @@
+import hashlib
+import io
 import json
 import logging
+import os
 import subprocess
+import sys
 import textwrap
+import threading
+import traceback
 
-import rich.box
-from typing import Optional, Tuple
+from typing import Callable, Optional, Tuple
 
 import yaml
 from openai import OpenAI, NotGiven, NOT_GIVEN
 from openai.types.chat import ChatCompletion
-from rich.markdown import Markdown
-from rich.panel import Panel
-from rich.prompt import Prompt, Confirm
 
-from smah.console import std_console, err_console
-from smah.runner.response_parser import ResponseParser
+from smah.console import std_console, err_console, RawOutput
+from smah.runner.coalescer import Coalescer, fingerprint
+from smah.runner.response_parser import ResponseParser, StreamingParser
+from smah.runner.transport import Transport
 from smah.settings.inference.provider.model import Model
 from smah.runner.prompts import Prompts
 from smah.database import Database
+from smah.database.writer import Writer
 
 class Runner:
     MAX_PIPE_LENGTH = 2048
     PIPE_HEAD_LENGTH = 1024
 
+    # Provider clients keyed by api key, kept for the life of the process so
+    # repeated requests (and daemon sessions) reuse pooled connections.
+    CLIENTS: dict = {}
+
+    # Conversation turns rendered when a session is resumed.
+    RESUME_TURNS = 3
+
+    # In-flight completion requests shared between threads of this process.
+    COALESCER: Coalescer = Coalescer()
 
     @staticmethod
     def log_query_plan(plan: dict, level: int = logging.DEBUG, show: bool = False):
         plan = yaml.dump(plan, sort_keys=False)
         logging.log(level, f"Query Plan:\n{plan}")
         if show:
+            import rich.box
+            from rich.markdown import Markdown
+            from rich.panel import Panel
             err_console.print(Panel(
                 Markdown("```yaml\n" + plan + "\n```\n"),
                 title="Query Plan",
@@ -41,6 +58,9 @@ class Runner:
         plan = yaml.dump(plan, sort_keys=False)
         logging.log(level, f"Pipe Plan:\n{plan}")
         if show:
+            import rich.box
+            from rich.markdown import Markdown
+            from rich.panel import Panel
             err_console.print(Panel(
                 Markdown("```yaml\n" + plan + "\n```\n"),
                 title="Pipe Plan",
@@ -52,6 +72,8 @@ class Runner:
     def log_mode(mode: str, level: int = logging.INFO, show: bool = False) -> None:
         logging.log(level, f"Processing In {mode} Mode")
         if show:
+            import rich.box
+            from rich.panel import Panel
             err_console.print(Panel(
                 f"Processing In {mode} Mode",
                 title="Mode",
@@ -80,6 +102,9 @@ class Runner:
         )
         logging.log(level, f"OpenAI Completion Payload:\n{payload}")
         if show:
+            import rich.box
+            from rich.markdown import Markdown
+            from rich.panel import Panel
             err_console.print(Panel(
                 Markdown("```yaml\n" + payload + "\n```\n"),
                 title="OpenAI Completion Payload",
@@ -95,6 +120,9 @@ class Runner:
         )
         logging.log(level, f"OpenAI Completion Response:\n{payload}")
         if show:
+            import rich.box
+            from rich.markdown import Markdown
+            from rich.panel import Panel
             err_console.print(Panel(
                 Markdown("```yaml\n" + payload + "\n```\n"),
                 title="OpenAI Completion Response",
@@ -114,19 +142,29 @@ class Runner:
             logging.error(f"Missing keys: {missing_keys}")
             return None
 
-    def __init__(self, args, settings):
+    @staticmethod
+    def shell_executor(command: dict) -> None:
+        # This is dangerous
+        subprocess.run(command['command'], shell=True)
+
+    def __init__(self, args, settings, executor: Optional[Callable[[dict], None]] = None):
         self.args = args
         self.settings = settings
         self.db = Database(args)
+        self.executor = executor or self.shell_executor
+        self.transport: Transport = Transport.factory(args)
 
 
 
 
     def openai_client(self):
         api_key = self.settings.inference.providers['openai'].api_key(self.args)
-        client = OpenAI(
-            api_key=api_key
-        )
+        client = self.CLIENTS.get(api_key)
+        if client is None:
+            client = OpenAI(
+                api_key=api_key
+            )
+            self.CLIENTS[api_key] = client
         return client
 
     @staticmethod
@@ -145,6 +183,10 @@ class Runner:
 
 
         if format:
+            import rich.box
+            from rich.markdown import Markdown
+            from rich.panel import Panel
+
             styles = styles or {
                 'assistant': 'bold white',
                 'user': 'bold blue',
@@ -157,12 +199,331 @@ class Runner:
                 Panel(Markdown(content, style="white"), title=message['role'], style=style, box=rich.box.ROUNDED)
             )
         else:
-            std_console.print(f"\n\n--- {message['role']} ---")
-            std_console.print(message['content'])
+            # Written as is: console markup and wrapping would alter the text.
+            RawOutput.write(f"\n\n--- {message['role']} ---\n{message['content']}\n")
+            RawOutput.flush()
+
+
+
+    @staticmethod
+    def render_key(message: dict, strip_cot: bool = True) -> str:
+        """
+        Render cache key of a message: its content, the render options and the terminal's color support.
+        """
+        key = json.dumps([message['role'], message['content'], strip_cot, std_console.color_system, std_console.is_terminal])
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def print_history(self, messages: list, strip_cot: bool = True) -> None:
+        """
+        Prints stored messages. Rich renders are cached per message and terminal width, so resuming a
+        session replays them and only renders messages not seen at this width before.
+        """
+        if not self.args.rich:
+            for message in messages:
+                self.print_message(message, format=False, strip_cot=strip_cot)
+            return
+        width = std_console.width
+        keys = [self.render_key(message, strip_cot) for message in messages]
+        cached = self.db.rendered(keys, width)
+        fresh = {}
+        for key, message in zip(keys, messages):
+            output = cached.get(key)
+            if output is None:
+                with std_console.capture() as capture:
+                    self.print_message(message, format=True, strip_cot=strip_cot)
+                output = fresh[key] = capture.get()
+            std_console.file.write(output)
+        std_console.file.flush()
+        self.db.save_rendered(fresh, width)
+
+    def confirm_command(self, command: dict) -> None:
+        """
+        Shows an exec command and runs it if the user confirms.
+        """
+        import rich.box
+        from rich.markdown import Markdown
+        from rich.panel import Panel
+        from rich.prompt import Confirm
+
+        std_console.print(
+            Panel(
+                Markdown(
+                    textwrap.dedent(
+                        """
+                        `RUNNING SHELL COMMANDS MAY BE DANGEROUS: BE CAREFUL`
+                        
+                        title: 
+                        {title}
+                        
+                        purpose: 
+                        {purpose}
+
+                        ```{shell} 
+                        {command} 
+                        ```                       
+                        """
+                    ).format(
+                        title=command['title'],
+                        purpose=command['purpose'],
+                        command=command['command'],
+                        shell=command['shell']
+                    ),
+                    style="white"
+                ),
+                title="EXEC COMMAND",
+                style="bold red",
+                box=rich.box.ROUNDED
+            )
+        )
+        c = Confirm.ask("[bold green]execute?[/bold green]")
+        if c:
+            self.executor(command)
+
+    def stream_response(self, model: Model, thread: list, conditions: Optional[dict] = None) -> str:
+        """
+        Streams a completion, printing markdown as it completes and confirming each exec command as
+        soon as its closing tag arrives, while the rest of the response keeps streaming in.
+
+        Returns:
+            str: The full response content.
+        """
+        parser = StreamingParser(strip_cot=True, conditions=conditions)
+        if self.args.rich:
+            from rich.markdown import Markdown
+        else:
+            RawOutput.write("\n\n--- assistant ---\n")
+
+        def handle(events: list) -> None:
+            for event in events:
+                if event['type'] == 'markdown':
+                    if self.args.rich:
+                        std_console.print(Markdown(event['content'], style="white"))
+                    else:
+                        RawOutput.write(event['content'])
+                        RawOutput.flush()
+                elif event['type'] == 'command':
+                    self.confirm_command(event['command'])
+
+        for chunk in self.run(model, thread, stream=True):
+            if chunk.choices:
+                handle(parser.feed(chunk.choices[0].delta.content))
+        handle(parser.close())
+        if not self.args.rich:
+            RawOutput.write("\n")
+            RawOutput.flush()
+        logging.info(f"OpenAI Completion Response (streamed):\n{parser.response}")
+        return parser.response
+
+    def paging(self) -> bool:
+        """
+        Checks if interactive responses stream into the pager (`--pager`) rather than the terminal.
+        The pager needs rich output on a terminal.
+        """
+        return bool(getattr(self.args, "pager", None)) and bool(self.args.rich) and RawOutput.interactive()
+
+    def page_response(self, model: Model, thread: list, title: str = "") -> str:
+        """
+        Streams a completion into the pager, which can be scrolled and searched while it streams.
+        Closing the pager early does not cancel the response, it is still needed for the session.
+
+        Returns:
+            str: The full response content.
+        """
+        from smah.console.pager import Pager
+        pager = Pager(title=title, color_system=std_console.color_system)
+        stream = self.run(model, thread, stream=True)
+        errors: list = []
+
+        def feed() -> None:
+            try:
+                for chunk in stream:
+                    if chunk.choices:
+                        pager.feed(chunk.choices[0].delta.content)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                pager.close()
+
+        feeder = threading.Thread(target=feed, name="smah-pager-feed", daemon=True)
+        feeder.start()
+        pager.run()
+        feeder.join()
+        if errors:
+            raise errors[0]
+        logging.info(f"OpenAI Completion Response (streamed):\n{pager.response}")
+        std_console.print(f"[dim]{title} response viewed in pager ({len(pager.response)} characters).[/dim]")
+        return pager.response
+
+    def stream_pipe(self, model: Model, thread: list) -> Tuple[str, bool]:
+        """
+        Streams a completion's text to stdout as it arrives, for downstream tools in a pipeline.
+
+        Each delta is written and flushed before the next is read, so a slow consumer holds the
+        writes back: once the coalescer buffers Flight.BUFFER chunks ahead of it, reading from
+        upstream pauses too. If the consumer
+        exits early (e.g. `| head`), the stream is closed, which cancels the upstream request
+        instead of paying for tokens nobody reads.
+
+        Returns:
+            Tuple[str, bool]: The text written, and False if the consumer went away first.
+        """
+        stream = self.run(model, thread, stream=True)
+        parts = []
+        try:
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    RawOutput.write(delta)
+                    RawOutput.flush()
+                    parts.append(delta)
+            RawOutput.write("\n")
+            RawOutput.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            stream.close()
+            logging.info(f"[PIPE] output closed after {len(parts)} chunks, request cancelled")
+            self.discard_stdout()
+            return "".join(parts), False
+        return "".join(parts), True
 
+    @staticmethod
+    def discard_stdout() -> None:
+        """
+        Points stdout at /dev/null once its reader has gone, so flushing it at exit does not raise again.
+        """
+        try:
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+            os.close(devnull)
+        except (OSError, ValueError, io.UnsupportedOperation):
+            # Not a file descriptor backed stream (e.g. a daemon client).
+            pass
+
+    @staticmethod
+    def estimate_tokens(message: dict) -> int:
+        """
+        Rough token count of a message (~4 characters per token plus per message overhead).
+        """
+        return Writer.estimate_tokens(message.get('content'))
+
+    def history_thread(self, session_id: int, model: Model, prefix: list, after: Optional[int] = None) -> list:
+        """
+        Pulls the most recent messages of a session that fit the model's context window.
+
+        The cut is made in SQL over the stored token counts, only the selected messages are decoded.
+
+        Args:
+            after (Optional[int]): Only messages newer than this id (those not covered by the session summary).
+
+        Returns:
+            list: (message id, message) pairs, oldest first.
+        """
+        context = model.context or {}
+        budget = context.get("window", 8192) - context.get("out", 4096)
+        budget -= sum(self.estimate_tokens(m) for m in prefix)
+        return self.db.context_messages(session_id, budget, after=after)
+
+    def compaction_model(self, fallback: Model) -> Model:
+        name = self.settings.inference.compaction.get("model")
+        return self.settings.inference.models.get(name) or fallback
+
+    def session_thread(self, session_id: int, model: Model, prefix: list) -> Tuple[list, list]:
+        """
+        Builds the thread for a session: the prefix, the rolling summary of older turns (if any)
+        and the most recent messages the summary does not cover.
+
+        Returns:
+            Tuple[list, list]: The thread and the (message id, message) history pairs it includes.
+        """
+        thread = list(prefix)
+        summary = self.db.summary(session_id)
+        after = None
+        if summary:
+            thread.append(Prompts.summary_message(summary['summary']))
+            thread.append(Prompts.ack())
+            after = summary['to_message_id']
+        history = self.history_thread(session_id, model, thread, after=after)
+        for _, message in history:
+            thread.append(Prompts.message(content=message['content'], role=message['role']))
+        return thread, history
+
+    def compact(self, session_id: int, model: Model) -> bool:
+        """
+        Folds older turns of a session into its rolling summary.
+
+        Once the messages not yet covered by the summary exceed the compaction threshold, everything
+        but the last `keep_turns` turns is summarized together with the previous summary and stored,
+        so long sessions resume with a bounded thread.
+
+        Returns:
+            bool: True if a new summary was stored.
+        """
+        config = self.settings.inference.compaction
+        if not config.get("enabled"):
+            return False
+        summary = self.db.summary(session_id)
+        after = summary['to_message_id'] if summary else None
+        pending = list(self.db.messages(session_id, after=after))
+        if sum(self.estimate_tokens(message) for _, message in pending) <= config["threshold"]:
+            return False
+        fold = pending[:-(config["keep_turns"] * 2)]
+        if not fold:
+            return False
+
+        model = self.compaction_model(model)
+        prompt = Prompts.summarize_prompt([message for _, message in fold], summary['summary'] if summary else None)
+        response = self.run(model, [prompt])
+        content = response.choices[0].message.content
+        if not content:
+            return False
+        self.db.save_summary(
+            session_id,
+            summary['from_message_id'] if summary else fold[0][0],
+            fold[-1][0],
+            content,
+            f"{model.provider}.{model.model}"
+        )
+        self.db.flush()
+        logging.info(f"[COMPACT] session {session_id} summarized through message {fold[-1][0]}")
+        return True
+
+    def compact_in_background(self, session_id: int, model: Model) -> threading.Thread:
+        """
+        Runs `compact` off the interactive thread; the result is stored on the returned thread as `compacted`.
+        """
+        def work():
+            try:
+                worker.compacted = self.compact(session_id, model)
+            except Exception as e:
+                logging.error(f"[COMPACT] failed: {str(e)}\n---------- trace -------------\n{traceback.format_exc()}\n")
+        worker = threading.Thread(target=work, name="smah-compact", daemon=True)
+        worker.compacted = False
+        worker.start()
+        return worker
+
+    def scrollback(self, session_id: int, before: Optional[int], turns: int) -> Optional[int]:
+        """
+        Renders the page of messages preceding `before`.
+
+        Returns:
+            Optional[int]: Id of the oldest rendered message, the cursor for the next page.
+        """
+        if before is None:
+            std_console.print("[bold yellow]No earlier messages[/bold yellow]")
+            return None
+        page = list(self.db.messages(session_id, before=before, limit=turns * 2, newest_first=True))
+        if not page:
+            std_console.print("[bold yellow]No earlier messages[/bold yellow]")
+            return None
+        page.reverse()
+        std_console.print("[bold yellow]--- earlier messages ---[/bold yellow]")
+        self.print_history([message for _, message in page])
+        std_console.print("[bold yellow]--- end of earlier messages ---[/bold yellow]")
+        return page[0][0]
 
+    def resume(self, id: int, title: str, plan: dict, pipe: str, messages: Optional[list] = None) -> None:
+        from rich.markdown import Markdown
+        from rich.prompt import Prompt
 
-    def resume(self, id: int, title: str, plan: dict, pipe: str, messages: list) -> None:
         model_name = self.args.model or plan['model']
         model = self.settings.inference.models[model_name]
         open = textwrap.dedent(
@@ -173,7 +534,7 @@ class Runner:
         )
         std_console.print(Markdown(open) if self.args.rich else open)
 
-        thread = [
+        prefix = [
             Prompts.conventions(),
             Prompts.ack(),
             Prompts.system_settings(self.settings, include_system=plan['include_settings']),
@@ -181,67 +542,58 @@ class Runner:
         ]
 
         if pipe:
-            thread.append(Prompts.message(content=f"--- INPUT ---\n{pipe}"))
-            thread.append(Prompts.ack())
+            prefix.append(Prompts.message(content=f"--- INPUT ---\n{pipe}"))
+            prefix.append(Prompts.ack())
 
-        for message in messages:
-            thread.append(Prompts.message(content=message['content'], role=message['role']))
-            self.print_message(message, format=self.args.rich)
+        # Older turns are replaced by the session's rolling summary, of the rest only what fits
+        # the context window is loaded, and only the last few turns are rendered.
+        if messages is None:
+            thread, history = self.session_thread(id, model, prefix)
+        else:
+            history = [(None, message) for message in messages]
+            thread = prefix + [Prompts.message(content=m['content'], role=m['role']) for m in messages]
+        compactor: Optional[threading.Thread] = None
+
+        turns = self.args.resume_turns or self.RESUME_TURNS
+        shown = history[-(turns * 2):]
+        oldest = shown[0][0] if shown else None
+        if oldest is not None and next(self.db.messages(id, before=oldest, limit=1), None):
+            std_console.print("[bold yellow]Earlier messages hidden, type '/more' to show them.[/bold yellow]")
+        self.print_history([message for _, message in shown])
 
         query = Prompt.ask("[bold green]Message[/bold green]: (type 'exit' or enter to end session)")
         query = query.strip()
         while query != 'exit' and query:
+            if query == '/more':
+                oldest = self.scrollback(id, oldest, turns)
+                query = Prompt.ask("[bold green]Message[/bold green]: (type 'exit' or enter to end session)").strip()
+                continue
             query_message = Prompts.message(content=query, role='user')
             self.print_message(query_message, format=self.args.rich, strip_cot=False)
 
+            # Pick up a summary finished in the background since the last turn.
+            if compactor and not compactor.is_alive():
+                if compactor.compacted:
+                    thread, _ = self.session_thread(id, model, prefix)
+                compactor = None
+
             # Query with Instructions
             thread.append(Prompts.query_prompt(request=query))
-            response = self.run(model, thread)
-
-            # Response
-            message = Prompts.message(role=response.choices[0].message.role, content=response.choices[0].message.content)
-            self.print_message(message, format=self.args.rich)
-
-            # Extract Commands
-            commands = ResponseParser.extract_commands(response.choices[0].message.content) or []
-            for command in commands:
-                std_console.print(
-                    Panel(
-                        Markdown(
-                            textwrap.dedent(
-                                """
-                                `RUNNING SHELL COMMANDS MAY BE DANGEROUS: BE CAREFUL`
-                                
-                                title: 
-                                {title}
-                                
-                                purpose: 
-                                {purpose}
-    
-                                ```{shell} 
-                                {command} 
-                                ```                       
-                                """
-                            ).format(
-                                title=command['title'],
-                                purpose=command['purpose'],
-                                command=command['command'],
-                                shell=command['shell']
-                            ),
-                            style="white"
-                        ),
-                        title="EXEC COMMAND",
-                        style="bold red",
-                        box=rich.box.ROUNDED
-                    )
-                )
-                c = Confirm.ask("[bold green]execute?[/bold green]")
-                if c:
-                    # This is dangerous
-                    subprocess.run(command['command'], shell=True)
+            if self.paging():
+                content = self.page_response(model, thread, title=f"Session #{id}")
+                # The pager only shows commands, they are confirmed once it closes.
+                for command in ResponseParser.extract_commands(content) or []:
+                    self.confirm_command(command)
+            else:
+                # Rendered, and its commands confirmed, as the response streams in.
+                content = self.stream_response(model, thread)
+            message = Prompts.message(role='assistant', content=content)
+            thread.append(message)
 
             # Update Chat History
-            self.db.append_to_chat(id, [query_message, message])
+            self.db.append_to_chat(id, [query_message, message], model=model_name)
+            if compactor is None:
+                compactor = self.compact_in_background(id, model)
 
             # Continue
             query = Prompt.ask("[bold green]Message[/bold green]: (type 'exit' or enter to end session)")
@@ -254,7 +606,8 @@ class Runner:
             response_format: dict | NotGiven = NOT_GIVEN,
             tools: dict | NotGiven = NOT_GIVEN,
             options: Optional[dict] = None,
-            show: bool = False
+            show: bool = False,
+            stream: bool = False
             ):
         options = options or {}
         if model.provider == "openai":
@@ -266,7 +619,6 @@ class Runner:
                 show=show
                 )
 
-            client = self.openai_client()
             model_settings = model.settings or {}
 
             max_output_tokens = model.context.get("out", 4096)
@@ -278,13 +630,25 @@ class Runner:
             else:
                 max_completion_tokens = NOT_GIVEN
 
-            response = client.chat.completions.create(
-                model=model.model,
-                messages=thread,
-                max_completion_tokens=max_completion_tokens,
-                max_tokens=max_tokens,
-                response_format=response_format,
-                tools=tools
+            request = {
+                'model': model.model,
+                'messages': thread,
+                'max_completion_tokens': max_completion_tokens,
+                'max_tokens': max_tokens,
+                'response_format': response_format,
+                'tools': tools
+            }
+            # Keyed without live system readings, so identical requests coalesce and replay.
+            key = fingerprint({**request, 'messages': Prompts.stable(thread)}, stream)
+            # Identical concurrent requests (e.g. daemon clients) share a single upstream call.
+            if stream:
+                return self.COALESCER.stream(
+                    key,
+                    lambda: self.transport.stream(self.openai_client, request, key)
+                )
+            response = self.COALESCER.call(
+                key,
+                lambda: self.transport.complete(self.openai_client, request, key)
             )
             self.log_openai_completion_response(response, show=show)
 
@@ -375,7 +739,8 @@ class Runner:
             print(query)
             self.print_message(Prompts.message(content=request), format=self.args.rich, strip_cot=False)
 
-            response = self.run(
+            # Rendered, and its commands confirmed, as the response streams in.
+            content = self.stream_response(
                 model=model,
                 thread=[
                     Prompts.conventions(),
@@ -386,63 +751,17 @@ class Runner:
                 ]
             )
 
-
-            msg = {'role': 'assistant', 'content': response.choices[0].message.content}
-            self.print_message(msg, format=self.args.rich)
-
-            # Extract Commands
-            commands = ResponseParser.extract_commands(response.choices[0].message.content) or []
-            for command in commands:
-                std_console.print(
-                    Panel(
-                        Markdown(
-                            textwrap.dedent(
-                                """
-                                `RUNNING SHELL COMMANDS MAY BE DANGEROUS: BE CAREFUL`
-                                
-                                title: 
-                                {title}
-
-                                purpose: 
-                                {purpose}
-
-                                ```{shell} 
-                                {command} 
-                                ```                       
-                                """
-                            ).format(
-                                title=command['title'],
-                                purpose=command['purpose'],
-                                command=command['command'],
-                                shell=command['shell']
-                            ),
-                            style="white"
-                        ),
-                        title="EXEC COMMAND",
-                        style="bold red",
-                        box=rich.box.ROUNDED
-                    )
-                )
-                c = Confirm.ask("[bold green]execute?[/bold green]")
-                if c:
-                    # This is dangerous
-                    subprocess.run(command['command'], shell=True)
-
-
-
             self.db.save_chat(
                 p["title"],
                 self.args,
                 p,
                 [
                     Prompts.message(content=request),
-                    {'role': 'assistant', 'content': response.choices[0].message.content}
+                    {'role': 'assistant', 'content': content}
                 ]
             )
 
-
-
-            return response.choices[0].message.content
+            return content
         return None
 
 
@@ -469,23 +788,21 @@ class Runner:
             )
 
             model = self.settings.inference.models[p["model"]]
-            response = self.run(
-                model=model,
-                thread=[
-                    Prompts.conventions(),
-                    Prompts.ack(),
-                    Prompts.system_settings(self.settings, include_system=p["include_settings"]),
-                    Prompts.ack(),
-                    Prompts.pipe_prompt(),
-                    Prompts.ack(),
-                    Prompts.message(content=request),
-                ]
-            )
-            response_body = response.choices[0].message.content
+            thread = [
+                Prompts.conventions(),
+                Prompts.ack(),
+                Prompts.system_settings(self.settings, include_system=p["include_settings"]),
+                Prompts.ack(),
+                Prompts.pipe_prompt(),
+                Prompts.ack(),
+                Prompts.message(content=request),
+            ]
             if p["format_output"] and self.args.rich:
+                from rich.markdown import Markdown
+                response_body = self.run(model=model, thread=thread).choices[0].message.content
                 std_console.print(Markdown(response_body))
             else:
-                print(response_body)
+                response_body, _ = self.stream_pipe(model, thread)
 
             request = textwrap.dedent(
                 """\
@@ -501,11 +818,11 @@ class Runner:
                 p,
                 [
                     Prompts.message(content=request),
-                    {'role': 'assistant', 'content': response.choices[0].message.content}
+                    {'role': 'assistant', 'content': response_body}
                 ],
                 pipe=pipe
             )
-            return response.choices[0].message.content
+            return response_body
         return None
 
 
@@ -0,0 +1,230 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Callable, Iterator, Optional
+
+from openai import NotGiven
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+
+class Cassette:
+    """
+    Compact store of recorded completion traffic.
+
+    A small sqlite file keyed by request fingerprint, each entry holding the zlib compressed request,
+    response and stream chunk timings. Lookups go straight to the primary key index so replaying from a
+    cassette with thousands of entries costs the same as replaying from one with a single entry.
+    """
+
+    def __init__(self, file: str):
+        self.file = file
+        if os.path.dirname(file):
+            os.makedirs(os.path.dirname(file), exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(file, check_same_thread=False)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cassette(
+                fingerprint CHAR(64) PRIMARY KEY,
+                request BLOB,
+                response BLOB,
+                chunks BLOB,
+                elapsed REAL,
+                recorded_on TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def pack(value: Any) -> Optional[bytes]:
+        if value is None:
+            return None
+        return zlib.compress(json.dumps(value, separators=(",", ":"), default=str).encode("utf-8"))
+
+    @staticmethod
+    def unpack(value: Optional[bytes]) -> Any:
+        if value is None:
+            return None
+        return json.loads(zlib.decompress(value))
+
+    def record(self, key: str, request: dict, elapsed: float, response: Optional[dict] = None, chunks: Optional[list] = None) -> None:
+        """
+        Stores a request/response pair, replacing any earlier recording of the same request.
+
+        Args:
+            key (str): Request fingerprint.
+            request (dict): The completion request.
+            elapsed (float): Seconds until the response completed.
+            response (Optional[dict]): The completion, for non streaming requests.
+            chunks (Optional[list]): [offset seconds, chunk] pairs, for streaming requests.
+        """
+        request = {k: v for k, v in request.items() if not isinstance(v, NotGiven)}
+        with self.lock:
+            self.connection.execute(
+                """
+                INSERT OR REPLACE INTO cassette (fingerprint, request, response, chunks, elapsed)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (key, self.pack(request), self.pack(response), self.pack(chunks), elapsed)
+            )
+            self.connection.commit()
+
+    def lookup(self, key: str) -> Optional[dict]:
+        """
+        Returns the recording for a request fingerprint.
+
+        Args:
+            key (str): Request fingerprint.
+
+        Returns:
+            Optional[dict]: The recording ("response", "chunks", "elapsed") or None.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT response, chunks, elapsed FROM cassette WHERE fingerprint = ?",
+                (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        response, chunks, elapsed = row
+        return {
+            "response": self.unpack(response),
+            "chunks": self.unpack(chunks),
+            "elapsed": elapsed or 0.0
+        }
+
+
+class Transport:
+    """
+    Passthrough transport: sends completion requests to the provider.
+
+    Sits underneath `Runner.run` so provider traffic can be recorded to, or replayed from, a cassette
+    for deterministic offline runs and benchmarks.
+    """
+    MODES = ["passthrough", "record", "replay"]
+
+    @staticmethod
+    def factory(args) -> "Transport":
+        """
+        Builds the transport selected by `--transport`.
+
+        Args:
+            args (argparse.Namespace): The parsed command-line arguments.
+
+        Returns:
+            Transport: The transport.
+        """
+        mode = getattr(args, "transport", None) or "passthrough"
+        if mode == "passthrough":
+            return Transport()
+        cassette = getattr(args, "cassette", None)
+        if not cassette:
+            raise ValueError(f"--transport {mode} requires --cassette")
+        if mode == "record":
+            return RecordTransport(Cassette(cassette))
+        if mode == "replay":
+            speed = getattr(args, "replay_speed", None)
+            return ReplayTransport(Cassette(cassette), speed=1.0 if speed is None else speed)
+        raise ValueError(f"Unsupported transport: {mode}")
+
+    def complete(self, client: Callable, request: dict, key: str) -> ChatCompletion:
+        """
+        Performs a completion request.
+
+        Args:
+            client (Callable): Returns the provider client.
+            request (dict): The completion request arguments.
+            key (str): Request fingerprint.
+
+        Returns:
+            ChatCompletion: The completion.
+        """
+        return client().chat.completions.create(**request)
+
+    def stream(self, client: Callable, request: dict, key: str) -> Iterator[ChatCompletionChunk]:
+        """
+        Performs a streaming completion request.
+
+        Args:
+            client (Callable): Returns the provider client.
+            request (dict): The completion request arguments.
+            key (str): Request fingerprint.
+
+        Returns:
+            Iterator[ChatCompletionChunk]: The completion chunks.
+        """
+        return client().chat.completions.create(**request, stream=True)
+
+
+class RecordTransport(Transport):
+    """
+    Sends requests to the provider and records each request/response pair, including stream chunk timing.
+    """
+
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+
+    def complete(self, client: Callable, request: dict, key: str) -> ChatCompletion:
+        start = time.monotonic()
+        response = super().complete(client, request, key)
+        self.cassette.record(key, request, time.monotonic() - start, response=response.model_dump(mode="json"))
+        return response
+
+    def stream(self, client: Callable, request: dict, key: str) -> Iterator[ChatCompletionChunk]:
+        start = time.monotonic()
+        chunks = []
+        source = super().stream(client, request, key)
+        try:
+            for chunk in source:
+                chunks.append([time.monotonic() - start, chunk.model_dump(mode="json")])
+                yield chunk
+        finally:
+            close = getattr(source, "close", None)
+            if close:
+                close()
+        # Only complete streams are recorded, a cancelled stream would replay truncated.
+        self.cassette.record(key, request, time.monotonic() - start, chunks=chunks)
+
+
+class ReplayTransport(Transport):
+    """
+    Serves recorded responses without touching the network.
+
+    Args:
+        speed (float): Playback rate relative to the recording, 1.0 is original timing and 0 replays instantly.
+    """
+
+    def __init__(self, cassette: Cassette, speed: float = 1.0):
+        self.cassette = cassette
+        self.speed = speed
+
+    def recording(self, key: str) -> dict:
+        recording = self.cassette.lookup(key)
+        if recording is None:
+            raise RuntimeError(f"No recorded response for request {key} in cassette {self.cassette.file}")
+        return recording
+
+    def delay(self, seconds: float) -> None:
+        if self.speed and seconds > 0:
+            time.sleep(seconds / self.speed)
+
+    def complete(self, client: Callable, request: dict, key: str) -> ChatCompletion:
+        recording = self.recording(key)
+        if recording["response"] is None:
+            raise RuntimeError(f"Request {key} was recorded as a stream in cassette {self.cassette.file}")
+        self.delay(recording["elapsed"])
+        return ChatCompletion.model_validate(recording["response"])
+
+    def stream(self, client: Callable, request: dict, key: str) -> Iterator[ChatCompletionChunk]:
+        recording = self.recording(key)
+        if recording["chunks"] is None:
+            raise RuntimeError(f"Request {key} was not recorded as a stream in cassette {self.cassette.file}")
+        previous = 0.0
+        for offset, chunk in recording["chunks"]:
+            self.delay(offset - previous)
+            previous = offset
+            yield ChatCompletionChunk.model_validate(chunk)
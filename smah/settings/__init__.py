@@ -1,5 +1,14 @@
 # smah/settings/__init__.py
 from .settings import Settings
-from .configurator import configurator
 
-__all__ = ['Settings', 'configurator']
\ No newline at end of file
+__all__ = ['Settings', 'configurator']
+
+
+def __getattr__(name: str):
+    # The configurator is interactive and imports rich, it is loaded on first use.
+    if name == 'configurator':
+        from .configurator import configurator
+        # Importing the submodule bound its name here, point it back at the function.
+        globals()['configurator'] = configurator
+        return configurator
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
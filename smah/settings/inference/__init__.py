@@ -1,4 +1,11 @@
 # smah/settings/inference/__init__.py
 from .inference import Inference
-from .configurator import inference_terminal_configurator
-__all__ = ['Inference', 'inference_terminal_configurator']
\ No newline at end of file
+__all__ = ['Inference', 'inference_terminal_configurator']
+
+
+def __getattr__(name: str):
+    # The configurator is interactive and imports rich, it is loaded on first use.
+    if name == 'inference_terminal_configurator':
+        from .configurator import inference_terminal_configurator
+        return inference_terminal_configurator
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -8,6 +8,34 @@ from .provider import Provider
 class Inference:
     CONFIG_VSN: str = "0.0.1"
 
+    # Rolling summarization of long resumed sessions, off unless enabled in the config: each summary
+    # is an extra completion request to `model` (the session's model if not configured).
+    DEFAULT_COMPACTION: dict = {
+        "enabled": False,
+        "threshold": 6000,
+        "keep_turns": 4,
+        "model": "openai.gpt-4o-mini"
+    }
+
+    @staticmethod
+    def default_compaction() -> dict:
+        return dict(Inference.DEFAULT_COMPACTION)
+
+    @staticmethod
+    def compaction_settings(config_data: Optional[dict]) -> dict:
+        """
+        Merges configured compaction settings over the defaults.
+
+        Raises:
+            ValueError: If keep_turns is below 1 or threshold below 0.
+        """
+        compaction = {**Inference.default_compaction(), **(config_data or {})}
+        if not isinstance(compaction["keep_turns"], int) or compaction["keep_turns"] < 1:
+            raise ValueError(f"compaction.keep_turns must be an integer of at least 1, got {compaction['keep_turns']!r}")
+        if not isinstance(compaction["threshold"], int) or compaction["threshold"] < 0:
+            raise ValueError(f"compaction.threshold must be a non-negative integer, got {compaction['threshold']!r}")
+        return compaction
+
     @staticmethod
     def config_vsn() -> str:
         """
@@ -27,6 +55,7 @@ class Inference:
         self.vsn = config_data.get("vsn", self.config_vsn())
         self.instructions: Optional[str] = config_data.get("instructions")
         self.model_picker = config_data.get("model_picker") or {"default": ["openai.gpt-4o-mini"]}
+        self.compaction = self.compaction_settings(config_data.get("compaction"))
         self.providers: dict[str,Provider] = {}
         providers = config_data.get("providers", {})
         for k, v in providers.items():
@@ -78,6 +107,7 @@ class Inference:
             'vsn': self.config_vsn(),
             'instructions': self.instructions,
             'model_picker': self.model_picker,
+            'compaction': self.compaction,
             'providers': providers
         }
 
@@ -85,6 +115,7 @@ class Inference:
             pass
         else:
             o.pop('model_picker')
+            o.pop('compaction')
             o.pop('vsn')
         return o
 
@@ -5,7 +5,6 @@ import yaml
 import logging
 from typing import Optional
 
-from rich.markdown import Markdown
 from smah.console import err_console
 from smah.settings.user import User
 from smah.settings.system import System
@@ -14,6 +13,7 @@ from smah.settings.inference import Inference
 class Settings:
     CONFIG_VSN = "0.0.1"
     DEFAULT_CONFIG_FILE = os.path.expanduser("~/.smah/config.yaml")
+    LOADED: dict = {}
 
     @staticmethod
     def config_vsn() -> str:
@@ -38,6 +38,30 @@ class Settings:
             return False
         return vsn <= Settings.config_vsn()
 
+    @staticmethod
+    def cached(config: Optional[str] = None) -> "Settings":
+        """
+        Returns settings for the given config file, reusing a previously loaded
+        instance for as long as the file on disk is unchanged.
+
+        Args:
+            config (Optional[str]): Path to the config file.
+
+        Returns:
+            Settings: The loaded settings.
+        """
+        config = config or Settings.default_config()
+        try:
+            mtime = os.path.getmtime(config)
+        except OSError:
+            mtime = None
+        entry = Settings.LOADED.get(config)
+        if entry and entry[0] == mtime and mtime is not None:
+            return entry[1]
+        settings = Settings(config=config)
+        Settings.LOADED[config] = (mtime, settings)
+        return settings
+
     def __init__(self, config = None):
         self.vsn: Optional[str] = None
         self.config: str = config or self.default_config()
@@ -139,6 +163,7 @@ class Settings:
                     """
                 ).strip().format(settings_yaml=settings_yaml)
                 if format:
+                    from rich.markdown import Markdown
                     o = Markdown(o)
                     err_console.print(o)
                 else:
@@ -1,4 +1,11 @@
 # smah/settings/system/__init__.py
 from .system import System
-from .configurator import system_terminal_configurator
-__all__ = ['System', 'system_terminal_configurator']
\ No newline at end of file
+__all__ = ['System', 'system_terminal_configurator']
+
+
+def __getattr__(name: str):
+    # The configurator is interactive and imports rich, it is loaded on first use.
+    if name == 'system_terminal_configurator':
+        from .configurator import system_terminal_configurator
+        return system_terminal_configurator
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,4 +1,11 @@
 # smah/settings/system/operating_system/__init__.py
 from .operating_system import OperatingSystem
-from .configurator import operating_system_terminal_configurator
-__all__ = ['OperatingSystem', 'operating_system_terminal_configurator']
\ No newline at end of file
+__all__ = ['OperatingSystem', 'operating_system_terminal_configurator']
+
+
+def __getattr__(name: str):
+    # The configurator is interactive and imports rich, it is loaded on first use.
+    if name == 'operating_system_terminal_configurator':
+        from .configurator import operating_system_terminal_configurator
+        return operating_system_terminal_configurator
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
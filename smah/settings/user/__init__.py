@@ -1,4 +1,11 @@
 # smah/settings/user/__init__.py
 from .user import User
-from .configurator import user_terminal_configurator
-__all__ = ['User', 'user_terminal_configurator']
\ No newline at end of file
+__all__ = ['User', 'user_terminal_configurator']
+
+
+def __getattr__(name: str):
+    # The configurator is interactive and imports rich, it is loaded on first use.
+    if name == 'user_terminal_configurator':
+        from .configurator import user_terminal_configurator
+        return user_terminal_configurator
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,7 +1,6 @@
 import textwrap
 from typing import Optional
 
-from rich.prompt import Prompt, Confirm
 from smah.console import std_console
 class User:
     CONFIG_VSN = "0.0.1"
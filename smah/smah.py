@@ -10,6 +10,7 @@ Classes and Functions:
 - extract_args: Parses and extracts command-line arguments.
 - log_settings: Logs current application settings using `rich`.
 - main: The primary function that sets up application configuration and executes user-specified queries.
+- dispatch: Executes a single parsed invocation, shared by `main` and the daemon (`smah --daemon`).
 
 Dependencies:
 - `os`, `argparse`, `textwrap`, and `yaml` for OS operations, argument parsing, text manipulation, and YAML operations.
@@ -25,31 +26,91 @@ Ensure the environment is set up with the necessary dependencies before executin
 
 import logging
 import textwrap
+import threading
 import traceback
-from typing import Optional
-
-from rich.traceback import Traceback
-from rich.prompt import Prompt
+from typing import Callable, Optional
 
 import smah.console
-from smah.database import Database, Migration
+from smah.daemon import Daemon
+from smah.database import Database, Migration, Retention
 from smah.runner import Runner
-from smah.settings import Settings, configurator
+from smah.settings import Settings
 import smah.logs
 import smah.args
 
-from smah.console import std_console, err_console
+from smah.console import std_console, err_console, RawOutput
 
 from types import SimpleNamespace
 
 from lxml import etree
 
+# Database files whose migrations have been checked by this process.
+INITIALIZED_DATABASES: set = set()
+
+# Time spent advancing migration backfills in the background per invocation.
+BACKFILL_SECONDS = 2.0
+
 def pick_session(args) -> int:
     """
     Picks a recent session from the database.
+    Pages through older (o) and newer (n) sessions using keyset cursors.
+    """
+    from rich.prompt import Prompt
+
+    db = Database(args)
+    limit = args.page or 10
+    before = args.before
+    after = args.after
+    while True:
+        sessions = db.history(limit=limit, before=before, after=after)
+        choices = [""]
+        choice_lookup = {}
+        count = 0
+        prompt = ""
+        for session in sessions:
+            count += 1
+            choices.append(f"{count}")
+            choice_lookup[str(count)] = session['id']
+            prompt += f"[bold green]{count}[/bold green] - (#{session['id']}) {session['title']}\n"
+        if not sessions:
+            prompt += "[bold yellow]No sessions on this page[/bold yellow]\n"
+        navigation = []
+        if len(sessions) == limit or (after is not None and not sessions):
+            choices.append("o")
+            navigation.append("[bold green]o[/bold green] - older")
+        if before is not None or (after is not None and len(sessions) == limit):
+            choices.append("n")
+            navigation.append("[bold green]n[/bold green] - newer")
+        if navigation:
+            prompt += ", ".join(navigation) + "\n"
+        prompt += "[bold green]Select a session number to resume:[/bold green] (enter to cancel)"
+
+        choice = Prompt.ask(prompt)
+        if not choice:
+            exit(0)
+        while choice not in choices:
+            choice = Prompt.ask("[bold red]Pick Valid Session[/bold red]")
+            if not choice:
+                exit(0)
+        if choice == "o":
+            before, after = (sessions[0]['id'] if sessions else after), None
+        elif choice == "n":
+            before, after = None, (sessions[-1]['id'] if sessions else before)
+        else:
+            return choice_lookup[str(choice)]
+
+def search_session(args) -> int:
+    """
+    Searches conversation history and picks a matching session.
     """
+    from rich.markup import escape
+    from rich.prompt import Prompt
+
     db = Database(args)
-    sessions = db.history()
+    sessions = db.search(args.search)
+    if not sessions:
+        print(f"No sessions found matching: {args.search}")
+        exit(1)
     choices = [""]
     choice_lookup = {}
     count = 0
@@ -58,7 +119,10 @@ def pick_session(args) -> int:
         count += 1
         choices.append(f"{count}")
         choice_lookup[str(count)] = session['id']
-        prompt += f"[bold green]{count}[/bold green] - (#{session['id']}) {session['title']}\n"
+        snippet = escape(" ".join(session['snippet'].split()))
+        snippet = snippet.replace(Database.MATCH_START, "[bold yellow]").replace(Database.MATCH_END, "[/bold yellow]")
+        prompt += f"[bold green]{count}[/bold green] - (#{session['id']}) {escape(session['title'] or '')} [dim]{session['created_on']}[/dim]\n"
+        prompt += f"    [dim]{session['source']}:[/dim] {snippet}\n"
     prompt += "[bold green]Select a session number to resume:[/bold green] (enter to cancel)"
 
     choice = Prompt.ask(prompt)
@@ -70,45 +134,68 @@ def pick_session(args) -> int:
             exit(0)
     return choice_lookup[str(choice)]
 
-def resume_session(args, session: Optional[int] = None):
+def resume_session(args, session: Optional[int] = None, executor: Optional[Callable[[dict], None]] = None):
     """
     Resumes the last conversation from the database.
 
     Args:
         args (argparse.Namespace): The parsed command-line arguments.
+        session (Optional[int]): The session to resume, defaults to the last session.
+        executor (Optional[Callable]): Runs confirmed exec commands, defaults to a local shell.
     """
     db = Database(args)
     if session:
-        session = db.session(session)
+        session = db.session(session, messages=False)
     else:
-        session = db.last_session()
+        session = db.last_session(messages=False)
 
     if session:
         args = smah.args.merge_args(args, session['args'])
-        settings = Settings(config=args.config)
-
-        # If settings are not configured, ask user to provide necessary information
-        if not settings.is_configured() or args.configure:
-            settings = configurator(settings, gui=args.gui)
-            settings.log(print=True, format=True)
-        else:
-            settings.log(print=(args.verbose >= 3), format=True)
-        runner = Runner(args, settings)
-        runner.resume(id=session['id'], title=session['title'], plan=session['plan'], pipe=session['pipe'], messages=session['messages'])
+        settings = load_settings(args)
+        runner = Runner(args, settings, executor=executor)
+        runner.resume(id=session['id'], title=session['title'], plan=session['plan'], pipe=session['pipe'])
     else:
         print("No previous session found.")
         exit(1)
 
+def load_settings(args) -> Settings:
+    """
+    Loads settings for the invocation, running the configurator when settings are incomplete or
+    `--configure` was requested.
+
+    Args:
+        args (argparse.Namespace): The parsed command-line arguments.
+
+    Returns:
+        Settings: The loaded settings.
+    """
+    from smah.settings import configurator
+
+    settings = Settings.cached(config=args.config)
+
+    # If settings are not configured, ask user to provide necessary information
+    if not settings.is_configured() or args.configure:
+        settings = configurator(settings, gui=args.gui)
+        settings.log(print=True, format=True)
+    else:
+        settings.log(print=(args.verbose >= 3), format=True)
+    return settings
+
 def init_database(args):
     """
     Initializes the database connection.
+    Migrations are only checked once per database file for the life of the process.
 
     Args:
         args (argparse.Namespace): The parsed command-line arguments.
     """
+    file = args.database or Database.default_database()
+    if file in INITIALIZED_DATABASES:
+        return
     try:
         db = Database(args)
-        outcome, outcome_details = Migration.migrate(db, SimpleNamespace(silent=True, count=None, to=None), silent=True, exit_on_finish=False)
+        with db.lock:
+            outcome, outcome_details = Migration.migrate(db, SimpleNamespace(silent=True, count=None, to=None), silent=True, exit_on_finish=False)
 
         if outcome == "success":
             logging.warning(f"[DB INIT (migrations applied)]: \"{outcome_details}\"")
@@ -118,13 +205,36 @@ def init_database(args):
         else:
             # Ignore no migrations were pending.
             pass
+        INITIALIZED_DATABASES.add(file)
+        maintain_database(db)
     except Exception as e:
         logging.error(f"\n[DB INIT (exception)] - Failed to initialize database: {str(e)}\n---------- trace -------------\n{traceback.format_exc()}\n")
         if args.rich:
+            from rich.traceback import Traceback
             t = Traceback()
             err_console.print(t)
         exit(1)
 
+def maintain_database(db: Database) -> None:
+    """
+    Advances pending migration backfills and applies the database's automatic retention policy, if one
+    is set and due, on a background thread. Each batch commits on its own (with its checkpoint), so being
+    cut short by process exit loses nothing.
+    """
+    def work():
+        retention = Retention(db)
+        try:
+            # Pending data backfills advance a little on every run.
+            Migration.backfill(db, seconds=BACKFILL_SECONDS)
+            outcome = retention.maintain()
+            if outcome:
+                logging.info(f"[DB MAINTENANCE] {outcome}")
+        except Exception as e:
+            logging.error(f"[DB MAINTENANCE] failed: {str(e)}\n---------- trace -------------\n{traceback.format_exc()}\n")
+        finally:
+            retention.close()
+    threading.Thread(target=work, name="smah-db-maintenance", daemon=True).start()
+
 def main():
     """
     The primary function that sets up application configuration and executes user-specified queries.
@@ -142,39 +252,59 @@ def main():
     try:
         args, pipe = smah.args.extract_args()
 
-        init_database(args)
-
-        if args.resume:
-            resume_session(args)
-        elif args.session:
-            resume_session(args, session=args.session)
-        elif args.history:
-            session = pick_session(args)
-            resume_session(args, session=session)
+        if args.daemon:
+            Daemon(args).serve()
         else:
-            settings = Settings(config=args.config)
+            dispatch(args, pipe)
+    except Exception as e:
+        logging.error("An unexpected error occurred in main: %s", str(e), exc_info=True)
 
-            # If settings are not configured, ask user to provide necessary information
-            if not settings.is_configured() or args.configure:
-                settings = configurator(settings, gui=args.gui)
-                settings.log(print=True, format=True)
-            else:
-                settings.log(print=(args.verbose >= 3), format=True)
-            runner = Runner(args, settings)
+def dispatch(args, pipe: Optional[str], executor: Optional[Callable[[dict], None]] = None) -> None:
+    """
+    Executes a single smah invocation for already parsed arguments.
+    Shared by the command line entry point and the daemon.
 
+    Args:
+        args (argparse.Namespace): The parsed command-line arguments.
+        pipe (Optional[str]): Content read from standard input, if any.
+        executor (Optional[Callable]): Runs confirmed exec commands, defaults to a local shell.
+    """
+    # Rich output unless told otherwise or stdout is not a terminal (e.g. smah in a pipeline).
+    if args.rich is None:
+        args.rich = RawOutput.interactive()
+
+    init_database(args)
+
+    if args.resume:
+        resume_session(args, executor=executor)
+    elif args.session:
+        resume_session(args, session=args.session, executor=executor)
+    elif args.fork:
+        session = Database(args).fork(args.fork)
+        if session is None:
+            print(f"Session {args.fork} not found.")
+            exit(1)
+        resume_session(args, session=session, executor=executor)
+    elif args.history:
+        session = pick_session(args)
+        resume_session(args, session=session, executor=executor)
+    elif args.search:
+        session = search_session(args)
+        resume_session(args, session=session, executor=executor)
+    else:
+        settings = load_settings(args)
+        runner = Runner(args, settings, executor=executor)
 
-            query = __with_query(args)
 
-            if args.interactive or not query:
-                runner.interactive(query=query, pipe=pipe)
-            else:
-                if pipe:
-                    runner.pipe(query=query, pipe=pipe)
-                else:
-                    runner.query(query=query)
-    except Exception as e:
-        logging.error("An unexpected error occurred in main: %s", str(e), exc_info=True)
+        query = __with_query(args)
 
+        if args.interactive or not query:
+            runner.interactive(query=query, pipe=pipe)
+        else:
+            if pipe:
+                runner.pipe(query=query, pipe=pipe)
+            else:
+                runner.query(query=query)
 
 def __with_query(args) -> Optional[str]:
     """
@@ -1,5 +1,7 @@
-from smah.database import Database, Migration
+from smah.database import Database, Migration, Retention, Exporter, Importer
 import argparse
+import sys
+from types import SimpleNamespace
 
 
 def parse_arguments():
@@ -16,6 +18,10 @@ def parse_arguments():
                                 action=argparse.BooleanOptionalAction,
                                 help="Reset migration checksums on mismatch",
                                 default=False)
+    migrate_parser.add_argument("--backfill",
+                                action=argparse.BooleanOptionalAction,
+                                help="Run data backfills after applying migrations",
+                                default=True)
 
     # Rollback command
     rollback_parser = subparsers.add_parser("rollback", help="Rollback migrations")
@@ -34,23 +40,119 @@ def parse_arguments():
     create_migration_parser = subparsers.add_parser("create", help="Show the current migration status")
     create_migration_parser.add_argument(dest="name", type=str, help="Name of the migration")
 
+    # Backfill command
+    backfill_parser = subparsers.add_parser("backfill", help="Run pending data backfills of applied migrations")
+    backfill_parser.add_argument("--migration", type=str, help="Only backfill this migration")
+    backfill_parser.add_argument("--batch-size", type=int, default=Migration.BACKFILL_BATCH_SIZE, help="Rows per batch")
+    backfill_parser.add_argument("--seconds", type=float, help="Stop after this many seconds, the backfill resumes on the next run")
+
+    # Compaction command
+    compact_parser = subparsers.add_parser("compact", help="Archive old sessions and vacuum the database")
+    compact_parser.add_argument("--max-age-days", type=float, help="Archive sessions with no activity for this many days")
+    compact_parser.add_argument("--max-size-mb", type=float, help="Archive the oldest sessions while the database is larger than this")
+    compact_parser.add_argument("--archive", type=str, help="Path to the archive database")
+    compact_parser.add_argument("--vacuum-seconds", type=float, help="Time budget for incremental vacuum")
+    compact_parser.add_argument("--convert",
+                                action=argparse.BooleanOptionalAction,
+                                default=False,
+                                help="Enable incremental vacuum on a database created without it (one full VACUUM, locks the database while it runs)")
+    compact_parser.add_argument("--save-policy",
+                                action=argparse.BooleanOptionalAction,
+                                help="Store the given limits as the retention policy",
+                                default=False)
+    compact_parser.add_argument("--auto",
+                                action=argparse.BooleanOptionalAction,
+                                help="Apply the stored policy automatically (with --save-policy)",
+                                default=None)
+
+    # Export command
+    export_parser = subparsers.add_parser("export", help="Stream chat history to JSONL, Parquet or Arrow")
+    export_parser.add_argument(dest="out", type=str, help="Output file (JSONL, '-' for stdout, '.gz' to compress) or directory (parquet, arrow)")
+    export_parser.add_argument("--format", type=str, choices=Exporter.FORMATS, default="jsonl", help="Export format")
+
+    # Import command
+    import_parser = subparsers.add_parser("import", help="Stream exported chat history into the database")
+    import_parser.add_argument(dest="file", type=str, help="Input file (JSONL, '-' for stdin) or directory (parquet, arrow)")
+    import_parser.add_argument("--format", type=str, choices=Exporter.FORMATS, default="jsonl", help="Import format")
+
     # database argument
     parser.add_argument("--database", type=str, help="Path to the database file")
 
     return parser.parse_args()
 
+def backfill(database: Database, args) -> None:
+    processed = Migration.backfill(
+        database,
+        migration=args.migration,
+        batch_size=args.batch_size,
+        seconds=args.seconds,
+        progress=lambda state: print(f"{state['migration']} {Migration.backfill_status(state)}")
+    )
+    if processed:
+        print(f"Backfill Complete: {sum(processed.values())} rows processed")
+
 def main():
     args = parse_arguments()
     database = Database(args)
 
     if args.command == "migrate":
         Migration.migrate(database, args)
+        if args.backfill:
+            backfill(database, SimpleNamespace(migration=None, batch_size=None, seconds=None))
     elif args.command == "rollback":
         Migration.rollback(database, args)
     elif args.command == "status":
         Migration.status(database)
     elif args.command == "create":
         Migration.create(args.name)
+    elif args.command == "backfill":
+        backfill(database, args)
+    elif args.command == "export":
+        exporter = Exporter(database)
+        try:
+            # Progress goes to stderr, stdout may be the export itself.
+            counts = exporter.export(
+                args.out,
+                format=args.format,
+                progress=lambda counts: print(f"exported {counts}", file=sys.stderr)
+            )
+        finally:
+            exporter.close()
+        print(f"Export Complete: {counts}", file=sys.stderr)
+    elif args.command == "import":
+        counts = Importer(database).load(
+            args.file,
+            format=args.format,
+            progress=lambda counts: print(f"imported {counts}", file=sys.stderr)
+        )
+        print(f"Import Complete: {counts}", file=sys.stderr)
+    elif args.command == "compact":
+        retention = Retention(database)
+        if args.save_policy:
+            policy = retention.save_policy(
+                max_age_days=args.max_age_days,
+                max_size_mb=args.max_size_mb,
+                archive=args.archive,
+                auto=args.auto
+            )
+            print(f"Retention Policy: {policy}")
+        if not retention.incremental():
+            if args.convert:
+                print("Converting database to incremental vacuum, this rewrites the database once and locks it until done...")
+                retention.convert()
+            else:
+                print("Incremental vacuum is off for this database: freed space is not released. Run with --convert to enable it (one full VACUUM).")
+        outcome = retention.compact(
+            max_age_days=args.max_age_days,
+            max_size_mb=args.max_size_mb,
+            archive=args.archive,
+            vacuum_seconds=args.vacuum_seconds,
+            progress=lambda archived, size: print(f"archived {archived} sessions, database {size // 1024} KiB")
+        )
+        print(
+            f"Compaction Complete: {outcome['archived']} sessions archived, {outcome['released']} pages released, "
+            f"{outcome['before'] // 1024} KiB -> {outcome['after'] // 1024} KiB"
+        )
 
 
 
@@ -0,0 +1,141 @@
+import gc
+import threading
+import time
+
+from openai import NOT_GIVEN
+
+from smah.runner.coalescer import Coalescer, Flight, fingerprint
+
+
+def test_fingerprint_ignores_unset_options():
+    a = fingerprint({'model': 'gpt-4o', 'messages': [{'role': 'user', 'content': 'hi'}], 'tools': NOT_GIVEN})
+    b = fingerprint({'messages': [{'role': 'user', 'content': 'hi'}], 'model': 'gpt-4o'})
+    c = fingerprint({'model': 'gpt-4o', 'messages': [{'role': 'user', 'content': 'hello'}]})
+    assert a == b
+    assert a != c
+
+
+def test_concurrent_calls_share_upstream():
+    coalescer = Coalescer()
+    calls = []
+    release = threading.Event()
+
+    def upstream():
+        calls.append(1)
+        release.wait()
+        return "response"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(coalescer.call("key", upstream))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert results == ["response"] * 5
+    assert coalescer.flights == {}
+
+
+def test_concurrent_streams_share_upstream():
+    coalescer = Coalescer()
+    calls = []
+    release = threading.Event()
+
+    def upstream():
+        calls.append(1)
+        release.wait()
+        return iter(["a", "b", "c"])
+
+    results = []
+    def consume():
+        results.append(list(coalescer.stream("key", upstream)))
+
+    threads = [threading.Thread(target=consume) for _ in range(3)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert results == [["a", "b", "c"]] * 3
+
+
+def test_unconsumed_stream_cancels_upstream():
+    coalescer = Coalescer()
+    cancelled = threading.Event()
+
+    def upstream():
+        try:
+            while True:
+                time.sleep(0.01)
+                yield "chunk"
+        finally:
+            cancelled.set()
+
+    stream = coalescer.stream("key", upstream)
+    # Dropped without ever being iterated.
+    del stream
+    gc.collect()
+    assert cancelled.wait(2)
+    assert coalescer.flights == {}
+
+
+def test_stream_reads_upstream_no_faster_than_fastest_subscriber():
+    coalescer = Coalescer()
+    produced = []
+
+    def upstream():
+        for i in range(10 * Flight.BUFFER):
+            produced.append(i)
+            yield i
+
+    slow = coalescer.stream("key", upstream)
+    idle = coalescer.stream("key", upstream)
+    assert next(slow) == 0
+    time.sleep(0.2)
+    # Both subscribers lag, the pump waits with at most BUFFER chunks ahead of the furthest one.
+    assert len(produced) <= Flight.BUFFER + 2
+    # One subscriber keeping up is enough for the stream to go on, the idle one does not stall it.
+    assert list(slow) == list(range(1, 10 * Flight.BUFFER))
+    assert list(idle) == list(range(10 * Flight.BUFFER))
+    assert coalescer.flights == {}
+
+
+def test_runner_coalesces_separately_built_threads(tmp_path):
+    from types import SimpleNamespace
+    from smah.runner import Runner
+    from smah.runner.prompts import Prompts
+    from smah.settings.system.system import System
+    from smah.settings.user.user import User
+
+    settings = SimpleNamespace(user=User({}), system=System({}))
+    model = SimpleNamespace(provider="openai", model="gpt-4o", context={'out': 64}, settings={}, to_yaml=lambda: {})
+    release = threading.Event()
+    calls = []
+
+    def create(**request):
+        calls.append(request)
+        release.wait()
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="shared"))])
+
+    r = Runner(SimpleNamespace(database=str(tmp_path / "smah.db"), transport=None), settings=settings)
+    r.openai_client = lambda: SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    r.log_openai_completion_response = lambda response, show=False: None
+
+    results = []
+    # Each caller builds its own thread, with its own live system readings.
+    threads = [
+        threading.Thread(target=lambda: results.append(r.run(model, [Prompts.system_settings(settings), Prompts.query_prompt("hi")])))
+        for _ in range(3)
+    ]
+    for t in threads:
+        t.start()
+    time.sleep(0.2)
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert [result.choices[0].message.content for result in results] == ["shared"] * 3
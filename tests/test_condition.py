@@ -0,0 +1,53 @@
+import pytest
+
+from smah.runner.condition import Condition
+from smah.runner.response_parser import ResponseParser
+
+
+def test_condition_evaluates_allowlisted_expressions():
+    conditions = {'apple': 5, 'os': "linux", 'system': {'os': "darwin"}, 'tags': ["a", "b"]}
+    assert Condition.compile("apple==5").evaluate(conditions)
+    assert Condition.compile("apple > 3 and os in ('linux', 'darwin')").evaluate(conditions)
+    assert Condition.compile("1 < apple <= 5 or missing").evaluate(conditions)
+    assert Condition.compile("system.os == 'darwin' and tags[1] == 'b'").evaluate(conditions)
+    assert Condition.compile("len(tags) * 2 == 4").evaluate(conditions)
+    assert Condition.compile("len('ab' * 2048) == 4096 and apple % 2 == 1").evaluate(conditions)
+    assert Condition.compile("str(apple) == '5' and str(os) == 'linux'").evaluate(conditions)
+    # Unset names are None rather than errors.
+    assert not Condition.compile("missing == 5").evaluate(conditions)
+    assert Condition.compile("missing is None").evaluate({})
+
+
+def test_condition_rejects_code():
+    for source in [
+        "__import__('os').system('true')",
+        "().__class__.__bases__",
+        "open('/etc/passwd')",
+        "[x for x in range(3)]",
+        "lambda: 1",
+        "apple := 3",
+        "2 ** 999999",
+        "'a' * 10**9",
+        "'a' * 100000000",
+        "len('a' * 4096 * 4096)",
+        "'a' * 4096 * 4096 * 4096",
+        "4096 * ['a'] * 4096",
+        "('a' * 4096 + 'a') * 2",
+        "'a' * 4096 + 'a' * 4096",
+        "len(str([('a' * 4096,) * 4096] * 4))",
+        "str(('a' * 4096,) * 4096)",
+        "'%0200000000d' % 1",
+        "'%.200000000f' % apple",
+        "apple ==",
+    ]:
+        with pytest.raises(ValueError):
+            Condition.compile(source).evaluate({})
+
+
+def test_condition_compiles_once():
+    assert Condition.compile("apple == 7") is Condition.compile("apple == 7")
+
+
+def test_unsafe_exec_if_skips_command():
+    message = '<exec shell="bash" exec-if="__import__(\'os\').getpid()"><title>t</title><command>ls</command></exec>'
+    assert ResponseParser.extract_commands(message) == []
@@ -0,0 +1,20 @@
+import io
+import subprocess
+import sys
+
+from smah.console import RawOutput
+
+
+def test_raw_output_writes_text_unchanged():
+    buffer = io.BytesIO()
+    stream = io.TextIOWrapper(buffer, encoding="utf-8")
+    stream.write("first ")
+    RawOutput.write("[bold]not markup[/bold] é\n", stream)
+    RawOutput.flush(stream)
+    assert buffer.getvalue().decode("utf-8") == "first [bold]not markup[/bold] é\n"
+    assert not RawOutput.interactive(stream)
+
+
+def test_cli_import_does_not_load_rich():
+    code = "import sys, smah.smah; sys.exit(1 if 'rich' in sys.modules else 0)"
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0
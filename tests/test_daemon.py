@@ -0,0 +1,95 @@
+import io
+import os
+import socket
+import sys
+import threading
+from types import SimpleNamespace
+
+import smah.smah
+from smah.console import std_console
+from smah.daemon import Daemon
+from smah.daemon.environ import RoutedEnviron
+from smah.daemon.protocol import send, receive
+from smah.daemon.streams import RoutedStream
+
+
+def test_protocol_round_trip():
+    a, b = socket.socketpair()
+    with a, b, a.makefile("wb") as wfile, b.makefile("rb") as rfile:
+        frames = [
+            {"type": "request", "argv": ["-q", "héllo"], "cwd": "/tmp", "env": {"TERM": "xterm"}, "stdin": "a\nb\n", "tty": {"stdout": True}},
+            {"type": "stdout", "data": "line\n\x1b[1mbold\x1b[0m"},
+            {"type": "exit", "code": 3},
+        ]
+        for frame in frames:
+            send(wfile, frame)
+        assert [receive(rfile) for _ in frames] == frames
+        wfile.close()
+        a.shutdown(socket.SHUT_WR)
+        assert receive(rfile) is None
+
+
+def test_routed_stream_routes_per_thread():
+    default = io.StringIO()
+    stream = RoutedStream(default)
+    outputs = [io.StringIO() for _ in range(4)]
+    barrier = threading.Barrier(len(outputs))
+
+    def client(output, i):
+        with stream.route(output):
+            barrier.wait()
+            for n in range(100):
+                stream.write(f"{i}:{n}\n")
+
+    threads = [threading.Thread(target=client, args=(output, i)) for i, output in enumerate(outputs)]
+    for t in threads:
+        t.start()
+    stream.write("daemon\n")
+    for t in threads:
+        t.join()
+    for i, output in enumerate(outputs):
+        assert output.getvalue() == "".join(f"{i}:{n}\n" for n in range(100))
+    assert default.getvalue() == "daemon\n"
+
+
+def test_requests_run_with_client_environment(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-daemon")
+    for name in ("environ", "stdin", "stdout", "stderr"):
+        module = os if name == "environ" else sys
+        monkeypatch.setattr(module, name, getattr(module, name))
+    daemon = Daemon(SimpleNamespace(daemon_socket="unused"))
+    daemon.environ = RoutedEnviron.install()
+    daemon.stdin, daemon.stdout, daemon.stderr = (RoutedStream.install(name) for name in ("stdin", "stdout", "stderr"))
+
+    def dispatch(args, pipe, executor=None):
+        print(f"{os.getenv('OPENAI_API_KEY')} {std_console.width} {std_console.no_color} {pipe!r}")
+
+    monkeypatch.setattr(smah.smah, "dispatch", dispatch)
+
+    def request(env: dict) -> list:
+        a, b = socket.socketpair()
+        with a, b, a.makefile("rb") as rfile, a.makefile("wb") as wfile:
+            server = threading.Thread(target=lambda: daemon.handle(b.makefile("rb"), b.makefile("wb")))
+            server.start()
+            send(wfile, {"type": "request", "argv": ["-q", "hi"], "cwd": "/", "env": env, "stdin": "piped", "tty": {"stdout": True}})
+            frames = []
+            while not frames or frames[-1]["type"] != "exit":
+                frames.append(receive(rfile))
+            server.join()
+        return frames
+
+    results = {}
+    clients = [
+        threading.Thread(target=lambda: results.setdefault("a", request({"OPENAI_API_KEY": "sk-a", "COLUMNS": "123"}))),
+        threading.Thread(target=lambda: results.setdefault("b", request({"OPENAI_API_KEY": "sk-b", "COLUMNS": "77", "NO_COLOR": "1"}))),
+    ]
+    for t in clients:
+        t.start()
+    for t in clients:
+        t.join()
+    assert "".join(f["data"] for f in results["a"] if f["type"] == "stdout") == "sk-a 123 False 'piped'\n"
+    assert "".join(f["data"] for f in results["b"] if f["type"] == "stdout") == "sk-b 77 True 'piped'\n"
+    assert results["a"][-1] == results["b"][-1] == {"type": "exit", "code": 0}
+    # The daemon's own environment and consoles are untouched.
+    assert os.environ["OPENAI_API_KEY"] == "sk-daemon"
+    assert os.environ is daemon.environ and "OPENAI_API_KEY" in os.environ.copy()
@@ -0,0 +1,405 @@
+import json
+import logging
+import multiprocessing
+import sqlite3
+import threading
+import time
+
+import pytest
+from types import SimpleNamespace
+
+from smah.database import Database, Migration, Retention, Exporter, Importer
+from smah.database.blob_store import BlobStore
+from smah.database.writer import Writer
+
+
+def database(path) -> Database:
+    db = Database(SimpleNamespace(database=str(path)))
+    Migration.migrate(db, SimpleNamespace(count=None, to=None, reset_checksums=False), silent=True, exit_on_finish=False)
+    return db
+
+
+def save_chats(path: str, writer: int, count: int) -> None:
+    db = Database(SimpleNamespace(database=path))
+    for i in range(count):
+        db.save_chat(
+            f"writer {writer} chat {i}",
+            SimpleNamespace(query="benchmark"),
+            {'model': 'openai.gpt-4o'},
+            [{'role': 'user', 'content': f"question {i}"}, {'role': 'assistant', 'content': f"answer {i}"}]
+        )
+    db.flush()
+
+
+def test_connection_is_shared_and_tuned(tmp_path):
+    a = database(tmp_path / "smah.db")
+    b = Database(SimpleNamespace(database=str(tmp_path / "smah.db")))
+    assert a.connection is b.connection
+    assert a.connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert a.connection.execute("PRAGMA synchronous").fetchone()[0] == 1
+
+
+def test_concurrent_writers(tmp_path):
+    path = str(tmp_path / "smah.db")
+    db = database(path)
+    writers, count = 8, 25
+
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=save_chats, args=(path, w, count)) for w in range(writers)]
+    start = time.monotonic()
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+    elapsed = time.monotonic() - start
+
+    assert all(p.exitcode == 0 for p in processes)
+    (sessions,) = db.connection.execute("SELECT COUNT(*) FROM chat_history").fetchone()
+    (messages,) = db.connection.execute("SELECT COUNT(*) FROM chat_history_message").fetchone()
+    assert sessions == writers * count
+    assert messages == writers * count * 2
+    logging.info(f"{writers} writers: {sessions} sessions in {elapsed:.2f}s ({sessions / elapsed:.0f} sessions/s)")
+
+
+def test_search_ranks_and_highlights(tmp_path):
+    db = database(tmp_path / "smah.db")
+    save_chats(str(tmp_path / "smah.db"), 0, 3)
+    db.save_chat(
+        "Configure nginx proxy",
+        SimpleNamespace(query="nginx"),
+        {'model': 'openai.gpt-4o'},
+        [{'role': 'user', 'content': "How do I set up a reverse proxy?"}, {'role': 'assistant', 'content': "Install nginx and add a proxy_pass block."}],
+        pipe="server { listen 80; }"
+    )
+    results = db.search("nginx proxy")
+    assert len(results) == 1
+    assert results[0]['title'] == "Configure nginx proxy"
+    assert Database.MATCH_START in results[0]['snippet']
+    assert db.search("listen")[0]['source'] == 'pipe'
+    assert db.search('"unbalanced') == []
+
+
+def test_search_pages_until_limit_and_indexes_previews(tmp_path):
+    db = database(tmp_path / "smah.db")
+    # One session matching in many rows ranks ahead of the others, filling a whole page of matches.
+    db.save_chat("busy", SimpleNamespace(), {}, [{'role': 'user', 'content': "widget widget widget"}] * 40)
+    for i in range(3):
+        db.save_chat(f"quiet {i}", SimpleNamespace(), {}, [{'role': 'user', 'content': f"a widget and {'filler ' * 50}"}])
+    assert len(db.search("widget", limit=3)) == 3
+    assert len(db.search("widget", limit=10)) == 4
+
+    # Large pipe input is indexed by its inline preview.
+    pipe = "needle " + "x" * BlobStore.THRESHOLD + " haystack"
+    db.save_chat("large", SimpleNamespace(), {}, [{'role': 'user', 'content': "summarize"}], pipe=pipe)
+    assert db.search("needle")[0]['title'] == "large"
+    assert db.search("haystack") == []
+    assert db.session(db.search("needle")[0]['id'])['pipe'] == pipe
+
+
+def test_history_keyset_pagination(tmp_path):
+    db = database(tmp_path / "smah.db")
+    save_chats(str(tmp_path / "smah.db"), 0, 7)
+    latest = db.history(limit=3)
+    assert [s['title'] for s in latest] == ["writer 0 chat 4", "writer 0 chat 5", "writer 0 chat 6"]
+    older = db.history(limit=3, before=latest[0]['id'])
+    assert [s['title'] for s in older] == ["writer 0 chat 1", "writer 0 chat 2", "writer 0 chat 3"]
+    oldest = db.history(limit=3, before=older[0]['id'])
+    assert [s['title'] for s in oldest] == ["writer 0 chat 0"]
+    newer = db.history(limit=3, after=oldest[-1]['id'])
+    assert newer == older
+    plan = db.connection.execute("EXPLAIN QUERY PLAN SELECT message FROM chat_history_message WHERE chat_history_id = ? ORDER BY id ASC", (1,)).fetchall()
+    assert "chat_history_message_chat_history_id" in str(plan)
+
+
+def test_blob_store_deduplicates_and_compresses(tmp_path):
+    db = database(tmp_path / "smah.db")
+    pipe = "\n".join(f"Dec 25 10:00:{i % 60:02d} host sshd[123]: Failed password for root" for i in range(2000))
+    answer = {'role': 'assistant', 'content': "analysis " * 5000}
+    for _ in range(3):
+        db.save_chat("audit", SimpleNamespace(query="audit"), {'model': 'openai.gpt-4o'}, [{'role': 'user', 'content': 'audit'}, answer], pipe=pipe)
+    db.flush()
+    (blobs, size) = db.connection.execute("SELECT COUNT(*), SUM(length(data)) FROM blob").fetchone()
+    assert blobs == 2
+    assert size < len(pipe) // 10
+    session = db.last_session()
+    assert session['pipe'] == pipe
+    assert session['messages'][1] == answer
+    assert db.search("sshd")[0]['source'] == 'pipe'
+
+
+def test_blob_backfill(tmp_path):
+    db = database(tmp_path / "smah.db")
+    pipe = "x" * 20000
+    db.connection.execute("INSERT INTO chat_history (id, title) VALUES (1, 'legacy')")
+    db.connection.execute("INSERT INTO chat_history_details (chat_history_id, args, plan, pipe_input) VALUES (1, '{}', '{}', ?)", (pipe,))
+    db.connection.execute("INSERT INTO chat_history_message (chat_history_id, message) VALUES (1, ?)", (json.dumps({'role': 'user', 'content': 'y' * 20000}),))
+    processed = Migration.backfill(db, migration="1735603200_blob_backfill.py", batch_size=1)
+    assert processed == {"1735603200_blob_backfill.py": 2}
+    status = Migration.get_schema_migrations(db)
+    state = next(m for m in status if m['migration'] == "1735603200_blob_backfill.py")
+    assert state['backfill_done'] and state['backfill_rows'] == 2 and state['backfill_total'] == 2
+    assert Migration.backfill(db, migration="1735603200_blob_backfill.py") == {}
+    (inline,) = db.connection.execute("SELECT pipe_input FROM chat_history_details").fetchone()
+    assert len(inline) == BlobStore.PREVIEW
+    session = db.session(1)
+    assert session['pipe'] == pipe
+    assert session['messages'][0]['content'] == 'y' * 20000
+
+
+def test_write_behind_group_commit(tmp_path):
+    db = database(tmp_path / "smah.db")
+    save_chats(str(tmp_path / "smah.db"), 0, 1)
+    session = db.last_session()
+    Database.group_commit(True)
+    try:
+        for i in range(500):
+            db.append_to_chat(session['id'], [{'role': 'user', 'content': f"follow up {i}"}])
+    finally:
+        Database.group_commit(False)
+    assert len(db.session(session['id'])['messages']) == 502
+
+
+def test_writer_retries_then_reports_failed_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(Writer, "BACKOFF", 0.01)
+    db = database(tmp_path / "smah.db")
+    save_chats(str(tmp_path / "smah.db"), 0, 1)
+    session = db.last_session()
+    attempts = []
+
+    def locked_twice(cursor, blobs):
+        attempts.append(1)
+        if len(attempts) <= 2:
+            raise sqlite3.OperationalError("database is locked")
+        cursor.execute("UPDATE chat_history SET title = 'retried' WHERE id = ?", (session['id'],))
+
+    db.writer.submit(locked_twice)
+    db.flush()
+    assert len(attempts) == 3
+    assert db.session(session['id'])['title'] == 'retried'
+
+    def broken(cursor, blobs):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    db.writer.submit(broken)
+    db.append_to_chat(session['id'], [{'role': 'user', 'content': "kept"}])
+    with pytest.raises(RuntimeError, match="disk I/O error"):
+        db.flush()
+    # Only the failing write is dropped, and it is reported once.
+    db.flush()
+    assert db.session(session['id'])['messages'][-1]['content'] == "kept"
+
+
+def test_reads_wait_for_maintenance_transactions(tmp_path):
+    db = database(tmp_path / "smah.db")
+    save_chats(str(tmp_path / "smah.db"), 0, 1)
+    session = db.last_session(messages=False)
+    started, release = threading.Event(), threading.Event()
+
+    def maintenance():
+        with db.lock:
+            db.connection.execute("BEGIN IMMEDIATE TRANSACTION")
+            db.connection.execute("INSERT INTO chat_history_message (chat_history_id, role, content) VALUES (?, 'user', 'ghost')", (session['id'],))
+            started.set()
+            release.wait()
+            db.connection.execute("ROLLBACK")
+
+    writer = threading.Thread(target=maintenance)
+    writer.start()
+    started.wait()
+    reads = []
+    reader = threading.Thread(target=lambda: reads.append([m['content'] for _, m in db.messages(session['id'], batch_size=1)]))
+    reader.start()
+    reader.join(0.2)
+    try:
+        # The shared connection is mid transaction, reading now would see its uncommitted rows.
+        assert reads == []
+    finally:
+        release.set()
+        writer.join()
+        reader.join()
+    assert reads == [["question 0", "answer 0"]]
+    assert [id for id, _ in db.messages(session['id'], newest_first=True, limit=1, batch_size=1)] == [2]
+
+
+def test_compact_archives_old_sessions(tmp_path):
+    path = str(tmp_path / "smah.db")
+    db = database(path)
+    blob = "y" * (BlobStore.THRESHOLD * 2)
+    for i in range(6):
+        db.save_chat(f"chat {i}", SimpleNamespace(), {}, [{'role': 'user', 'content': f"question {i}"}, {'role': 'assistant', 'content': blob}])
+    db.flush()
+    db.connection.execute("UPDATE chat_history SET created_on = datetime('now', '-100 days') WHERE id <= 3")
+    db.connection.execute("UPDATE chat_history_message SET created_on = datetime('now', '-100 days') WHERE chat_history_id <= 3")
+
+    retention = Retention(db)
+    outcome = retention.compact(max_age_days=30, archive=str(tmp_path / "archive.db"))
+    retention.close()
+    assert outcome['archived'] == 3
+    assert [s['id'] for s in db.history(limit=10)] == [4, 5, 6]
+    assert db.search("question")[0]['id'] in (4, 5, 6)
+    # Blob shared with the hot sessions is kept.
+    assert db.session(4)['messages'][1]['content'] == blob
+    assert db.connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+    archive = sqlite3.connect(str(tmp_path / "archive.db"))
+    assert archive.execute("SELECT COUNT(*) FROM chat_history").fetchone()[0] == 3
+    assert archive.execute("SELECT COUNT(*) FROM chat_history_message").fetchone()[0] == 6
+    assert archive.execute("SELECT COUNT(*) FROM blob").fetchone()[0] == 1
+
+
+def test_compact_never_converts_without_asking(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    # A database created before incremental auto vacuum was enabled.
+    legacy = sqlite3.connect(path)
+    legacy.execute("CREATE TABLE legacy (id INTEGER)")
+    legacy.close()
+    db = database(path)
+    assert db.connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+
+    retention = Retention(db)
+    retention.save_policy(max_age_days=30, auto=True)
+    assert retention.maintain()['released'] == 0
+    assert not retention.incremental()
+    retention.convert()
+    assert retention.incremental()
+    retention.close()
+
+
+def test_export_import_round_trip(tmp_path):
+    source = database(tmp_path / "source.db")
+    large = "z" * (BlobStore.THRESHOLD * 2)
+    source.save_chat("first", SimpleNamespace(query="a"), {'model': 'openai.gpt-4o'}, [{'role': 'user', 'content': "hello"}, {'role': 'assistant', 'content': large}], pipe=large)
+    source.save_chat("second", SimpleNamespace(query="b"), {'model': 'openai.gpt-4o'}, [{'role': 'user', 'content': "again"}])
+    source.save_summary(1, 1, 2, "greeting", "openai.gpt-4o-mini")
+    source.flush()
+
+    exporter = Exporter(source)
+    Exporter.BATCH_SIZE, batch_size = 2, Exporter.BATCH_SIZE
+    try:
+        counts = exporter.export(str(tmp_path / "history.jsonl.gz"))
+    finally:
+        Exporter.BATCH_SIZE = batch_size
+        exporter.close()
+    assert counts == {"session": 2, "message": 3, "summary": 1}
+
+    target = database(tmp_path / "target.db")
+    target.save_chat("existing", SimpleNamespace(), {}, [{'role': 'user', 'content': "kept"}])
+    target.flush()
+    assert Importer(target).load(str(tmp_path / "history.jsonl.gz")) == counts
+
+    assert [s['title'] for s in target.history(limit=10)] == ["existing", "first", "second"]
+    imported = target.session(2)
+    assert imported['plan'] == {'model': 'openai.gpt-4o'}
+    assert imported['pipe'] == large
+    assert [m['content'] for m in imported['messages']] == ["hello", large]
+    assert target.summary(2)['to_message_id'] == 3
+    assert target.search("again")[0]['id'] == 3
+
+
+def test_import_skips_archived_ids(tmp_path):
+    source = database(tmp_path / "source.db")
+    source.save_chat("imported", SimpleNamespace(), {}, [{'role': 'user', 'content': "imported"}])
+    source.flush()
+    Exporter(source).export(str(tmp_path / "history.jsonl"))
+
+    target = database(tmp_path / "target.db")
+    for i in range(3):
+        target.save_chat(f"chat {i}", SimpleNamespace(), {}, [{'role': 'user', 'content': f"question {i}"}])
+    target.flush()
+    target.connection.execute("UPDATE chat_history SET created_on = datetime('now', '-100 days') WHERE id >= 2")
+    target.connection.execute("UPDATE chat_history_message SET created_on = datetime('now', '-100 days') WHERE chat_history_id >= 2")
+    retention = Retention(target)
+    # The session being continued is never archived.
+    retention.set_setting("last_session", "1")
+    assert retention.compact(max_age_days=30, archive=str(tmp_path / "archive.db"))['archived'] == 2
+    retention.close()
+
+    Importer(target).load(str(tmp_path / "history.jsonl"))
+    # Ids 2 and 3 belong to archived sessions.
+    assert [(s['id'], s['title']) for s in target.history(limit=10)] == [(1, "chat 0"), (4, "imported")]
+
+
+def test_export_import_parquet(tmp_path):
+    pytest.importorskip("pyarrow")
+    source = database(tmp_path / "source.db")
+    source.save_chat("first", SimpleNamespace(), {}, [{'role': 'user', 'content': "hello"}])
+    source.flush()
+    exporter = Exporter(source)
+    try:
+        exporter.export(str(tmp_path / "history"), format="parquet")
+    finally:
+        exporter.close()
+    target = database(tmp_path / "target.db")
+    Importer(target).load(str(tmp_path / "history"), format="parquet")
+    assert target.session(1)['messages'] == [{'role': 'user', 'content': "hello"}]
+
+
+def test_message_columns_and_backfill(tmp_path):
+    db = database(tmp_path / "smah.db")
+    db.save_chat("typed", SimpleNamespace(), {'model': 'openai.gpt-4o'}, [{'role': 'user', 'content': "hi"}, {'role': 'assistant', 'content': "hello"}])
+    db.flush()
+    row = db.connection.execute("SELECT role, content, token_count, byte_len, model, message FROM chat_history_message WHERE id = 2").fetchone()
+    assert row == ('assistant', "hello", 5, 5, 'openai.gpt-4o', None)
+
+    # Rows written before the typed columns existed.
+    db.connection.executemany(
+        "INSERT INTO chat_history_message (chat_history_id, message) VALUES (1, ?)",
+        [(json.dumps({'role': 'user', 'content': "x" * 40}),), (json.dumps({'role': 'assistant', 'content': "y" * 40}),)]
+    )
+    assert [m['content'][0] for _, m in db.messages(1)] == ["h", "h", "x", "y"]
+    assert [id for id, _ in db.context_messages(1, budget=28)] == [3, 4]
+
+    # Resumes from its checkpoint across runs.
+    checkpoints = []
+    name = "1735603260_message_columns_backfill.py"
+    assert Migration.backfill(db, migration=name, batch_size=1, seconds=0) == {name: 0}
+    Migration.backfill(db, migration=name, batch_size=1, progress=lambda state: state['backfill_done'] or checkpoints.append(state['backfill_checkpoint']))
+    assert checkpoints == [3, 4]
+    assert db.connection.execute("SELECT COUNT(*) FROM chat_history_message WHERE role IS NULL OR message IS NOT NULL").fetchone()[0] == 0
+    assert db.connection.execute("SELECT model FROM chat_history_message WHERE id = 4").fetchone()[0] == 'openai.gpt-4o'
+    assert [id for id, _ in db.context_messages(1, budget=36)] == [2, 3, 4]
+    assert db.search("hello")[0]['id'] == 1
+
+
+def test_message_extra_keys_survive(tmp_path):
+    db = database(tmp_path / "smah.db")
+    call = {'role': 'assistant', 'content': None, 'tool_calls': [{'id': "call_1", 'type': "function"}]}
+    tool = {'role': 'tool', 'content': "42", 'name': "answer", 'tool_call_id': "call_1"}
+    db.save_chat("tools", SimpleNamespace(), {'model': 'openai.gpt-4o'}, [{'role': 'user', 'content': "hi"}, call])
+    db.flush()
+    db.connection.executemany(
+        "INSERT INTO chat_history_message (chat_history_id, message) VALUES (1, ?)",
+        [(json.dumps(tool),), (json.dumps({'role': 'user', 'content': "thanks"}),)]
+    )
+    Migration.backfill(db, migration="1735603260_message_columns_backfill.py")
+    assert [m for _, m in db.messages(1)] == [{'role': 'user', 'content': "hi"}, call, tool, {'role': 'user', 'content': "thanks"}]
+    rows = db.connection.execute("SELECT role, message IS NULL FROM chat_history_message ORDER BY id").fetchall()
+    assert rows == [('user', 1), ('assistant', 0), ('tool', 0), ('user', 1)]
+
+    # A row with neither typed columns nor JSON reads as empty instead of failing.
+    db.connection.execute("INSERT INTO chat_history_message (chat_history_id, role, message) VALUES (1, NULL, NULL)")
+    Migration.backfill(db, migration="1735603260_message_columns_backfill.py")
+    assert [m for _, m in db.messages(1)][-1] == {'role': None, 'content': None}
+
+
+def test_fork_shares_messages(tmp_path):
+    db = database(tmp_path / "smah.db")
+    db.save_chat("root", SimpleNamespace(), {}, [{'role': 'user', 'content': f"root {i}"} for i in range(3)], pipe="input")
+    db.flush()
+    fork = db.fork(1)
+    db.append_to_chat(1, [{'role': 'user', 'content': "root only"}])
+    db.append_to_chat(fork, [{'role': 'user', 'content': "fork 0"}])
+    nested = db.fork(fork, title="nested")
+    db.append_to_chat(fork, [{'role': 'user', 'content': "fork only"}])
+    db.append_to_chat(nested, [{'role': 'user', 'content': "nested 0"}])
+    # Appends are queued in the write-behind writer, the raw count below does not flush on its own.
+    db.flush()
+
+    assert db.connection.execute("SELECT COUNT(*) FROM chat_history_message").fetchone()[0] == 7
+    session = db.session(nested)
+    assert (session['title'], session['parent_id'], session['pipe']) == ("nested", fork, "input")
+    assert [m['content'] for m in session['messages']] == ["root 0", "root 1", "root 2", "fork 0", "nested 0"]
+    assert [m['content'] for m in db.session(fork)['messages']] == ["root 0", "root 1", "root 2", "fork 0", "fork only"]
+    assert [m['content'] for _, m in db.context_messages(nested, budget=11)] == ["fork 0", "nested 0"]
+    assert db.last_session(messages=False)['id'] == nested
+    assert db.fork(99) is None
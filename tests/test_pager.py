@@ -0,0 +1,113 @@
+import time
+
+from prompt_toolkit.input import create_pipe_input
+from prompt_toolkit.output import DummyOutput
+
+from smah.console.pager import Pager
+
+EXEC = '<exec shell="bash"><title>List</title><purpose>Show files</purpose><command>ls -la</command></exec>'
+
+
+def long_response(paragraphs: int = 500) -> str:
+    text = [f"Paragraph {i} of a long response." for i in range(paragraphs)]
+    text.insert(paragraphs // 2, f"Run this:\n{EXEC}")
+    return "\n\n".join(text) + "\n\nDone."
+
+
+def paged(response: str, step: int = 37) -> Pager:
+    pager = Pager(title="test", color_system=None)
+    for i in range(0, len(response), step):
+        pager.feed(response[i:i + step])
+    pager.close()
+    pager.resize(60, 10)
+    return pager
+
+
+def test_pager_renders_lazily_with_bounded_cache():
+    pager = paged(long_response())
+    assert pager.response == long_response()
+    assert len(pager.blocks) > 500
+
+    view = pager.view()
+    assert len(view) == 10
+    assert view[0].startswith("Paragraph 0")
+    # Only what is on screen has been rendered.
+    assert len(pager.cache) <= 10
+
+    for _ in range(300):
+        pager.scroll(pager.height)
+    assert len(pager.cache) <= Pager.CACHE_BLOCKS
+    pager.jump(True)
+    assert "Done." in "\n".join(pager.view())
+    assert len(pager.cache) <= Pager.CACHE_BLOCKS
+
+
+def test_pager_search_and_exec_jump():
+    pager = paged(long_response())
+    assert pager.search("paragraph 250")
+    assert pager.view()[0].startswith("Paragraph 250")
+    assert pager.search(forward=False) is False
+    assert pager.message == "Pattern not found: paragraph 250"
+
+    pager.jump(False)
+    assert pager.jump_exec()
+    exec_block = pager.top[0]
+    assert pager.blocks[exec_block]['exec']
+    assert "ls -la" in "\n".join(pager.view())
+    assert pager.jump_exec() is False
+    pager.jump(True)
+    assert pager.jump_exec(forward=False)
+    assert pager.top == (exec_block, 0)
+
+
+def test_pager_shows_response_while_streaming():
+    pager = Pager(color_system=None)
+    pager.resize(60, 10)
+    pager.feed("First paragraph.\n\nSecond, still stream")
+    assert [line.strip() for line in pager.view()[:3]] == ["First paragraph.", "", "Second, still stream"]
+
+    # An unfinished exec block is shown raw until it closes, then rendered and marked.
+    pager.feed('ing.\n\n<exec shell="bash"><title>List')
+    assert '<exec shell="bash"><title>List' in pager.view()
+    pager.feed('</title><command>ls</command></exec>\n\nAfter.')
+    assert any(block['exec'] for block in pager.blocks)
+
+    # Following the end keeps the newest text on screen.
+    pager.jump(True)
+    for i in range(50):
+        pager.feed(f"\n\nMore {i}.")
+    assert "More 48." in "\n".join(pager.view())
+    pager.close()
+    assert pager.done and "More 49." in "\n".join(pager.view())
+
+
+def test_pager_keys():
+    pager = paged(long_response())
+    with create_pipe_input() as input:
+        input.send_text("jjj/paragraph 40\rnGEq")
+        pager.run(input=input, output=DummyOutput())
+    assert pager.term == "paragraph 40"
+    assert pager.blocks[pager.top[0]]['exec'] or pager.top == pager.end()
+    assert pager.app is None
+
+
+def test_pager_splits_incrementally():
+    response = "Intro\n\n```bash\necho 1\n\n\necho 2\n```\n\nMiddle `code` text\n \n\n````\nx\n\ny\n```\n\nEnd"
+    whole = paged(response, step=len(response))
+    for step in (1, 2, 3, 5):
+        # Blocks only differ in the blank lines they end with, depending on where deltas split a break.
+        blocks = [b['markdown'].strip() for b in paged(response, step=step).blocks]
+        assert blocks == [b['markdown'].strip() for b in whole.blocks]
+    assert any("echo 1\n\n\necho 2" in b['markdown'] for b in whole.blocks)
+
+    # A long fence with blank lines is never split, each delta only scans the new text.
+    pager = Pager(color_system=None)
+    pager.feed("```text\n")
+    start = time.perf_counter()
+    for i in range(20000):
+        pager.feed(f"line {i}\n\n")
+    assert time.perf_counter() - start < 5
+    assert pager.blocks == []
+    pager.feed("```\n\nAfter.")
+    pager.close()
+    assert len(pager.blocks) == 2
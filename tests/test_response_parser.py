@@ -1,12 +1,13 @@
 import textwrap
 import difflib
+import time
 from typing import Optional
 
 import rich
 from rich.markdown import Markdown
 
 from smah.console import std_console
-from smah.runner.response_parser import ResponseParser
+from smah.runner.response_parser import ResponseParser, ParsedResponse, StreamingParser, ThoughtType
 
 def sut(scenario: str = "default", options: Optional[dict] = None):
     if scenario == "cot":
@@ -179,4 +180,100 @@ def test_escape_response():
     escaped = ResponseParser.escape_response(message)
     assert escaped == "SECTION\n===\n<div><b>Some text</b> Hey :_smah_lt_: There</div>"
     m = ResponseParser.to_markdown(message)
-    assert m == "SECTION\n===\n<div><b>Some text</b> Hey < There</div>"
\ No newline at end of file
+    assert m == "SECTION\n===\n<div><b>Some text</b> Hey < There</div>"
+
+
+def test_parsed_response_single_pass():
+    message = sut("mixed")
+    parsed = ParsedResponse.parse(message)
+    assert ParsedResponse.parse(message) is parsed
+    assert parsed.thoughts == [{'type': ThoughtType.THINKING, 'thought': "I wonder if this is all there is"}]
+    assert parsed.exec_tags[0]['exec_if'] == "apple==5"
+    assert ResponseParser.to_markdown(message) == parsed.markdown(strip_cot=True)
+    assert "`Thinking:" in parsed.markdown(strip_cot=False)
+    assert "`Thinking:" not in parsed.markdown(strip_cot=True)
+    assert ResponseParser.to_markdown("é <b>ü</b>") == "é <b>ü</b>"
+
+def test_escape_single_scan():
+    # Output matches the replace cascade it replaced: only stray `<` and `&` are escaped.
+    assert ResponseParser.escape_response("a < b && <b>c</b> <cot>d</cot> &amp;") == \
+        "a :_smah_lt_: b :_smah_amp_::_smah_amp_: <b>c</b> <cot>d</cot> :_smah_amp_amp_:"
+    assert ResponseParser.escape_response("no markup") == "no markup"
+    # Text without markup never reaches lxml.
+    parsed = ParsedResponse("a > b && c")
+    assert parsed.root is None
+    assert parsed.markdown(strip_cot=True) == "a > b && c"
+    assert parsed.commands({}) == []
+    # Characters lxml escapes on serialization come back unchanged.
+    assert ResponseParser.to_markdown("<b>x</b> a > b") == "<b>x</b> a > b"
+    message = '<exec shell="bash"><title>t</title><command>make && ls < in > out</command></exec>'
+    assert "make && ls < in > out" in ResponseParser.to_markdown(message)
+
+
+def test_entities_in_commands_are_kept():
+    # Entities the model wrote are part of the command: extracted, confirmed and shown as written.
+    message = '<exec shell="bash"><title>a &amp; b</title><command>echo \'a &amp; b\' &lt;x&gt; && cat < in</command></exec>'
+    command = ResponseParser.extract_commands(message)[0]
+    assert command['command'] == "echo 'a &amp; b' &lt;x&gt; && cat < in"
+    assert command['title'] == "a &amp; b"
+    assert command['command'] in ResponseParser.to_markdown(message)
+
+def test_streaming_parser():
+    message = sut("mixed") + "\n\nTail <exec shell=\"bash\"><title>Two</title><command>echo 2</command></exec>\nend"
+    parser = StreamingParser(conditions={'apple': 5})
+    events = []
+    for i in range(0, len(message), 7):
+        chunk = parser.feed(message[i:i + 7])
+        # A command is emitted as soon as its closing tag has arrived.
+        for event in chunk:
+            if event['type'] == 'command':
+                assert message[:i + 7].count("</exec>") == len(parser.commands)
+        events.extend(chunk)
+    events.extend(parser.close())
+
+    assert parser.response == message
+    markdown = "".join(e['content'] for e in events if e['type'] == 'markdown')
+    assert markdown == ResponseParser.to_markdown(message)
+    assert [e['command'] for e in events if e['type'] == 'command'] == ResponseParser.extract_commands(message, {'conditions': {'apple': 5}})
+    assert [e['thought'] for e in events if e['type'] == 'thought'] == ParsedResponse.parse(message).thoughts
+    # Only a fragment that may still open a block is held back.
+    parser = StreamingParser()
+    assert parser.feed("First paragraph.\n\nSecond <ex") == [{'type': 'markdown', 'content': "First paragraph.\n\n"}]
+    assert parser.buffer == "Second <ex"
+
+def test_extract_conditions():
+    message = textwrap.dedent(
+        """\
+        Pick one
+        <set-condition name="color">
+        <prompt>Favorite color?</prompt>
+        <choices>
+        <choice value="red">Red</choice>
+        <choice value="other" data-user="true" data-required="true">Other</choice>
+        </choices>
+        </set-condition>
+        """
+    )
+    conditions = ResponseParser.extract_conditions(message)
+    assert conditions == [{
+        'name': "color",
+        'prompt': "Favorite color?",
+        'choices': [
+            {'value': "red", 'label': "Red", 'prompt': None},
+            {'value': "other", 'label': "Other", 'prompt': {'prompt': "Enter Other", 'required': True, 'check': None}},
+        ]
+    }]
+
+
+def test_streaming_parser_scans_long_fences_once():
+    # Breaks inside an open fence never release text, each delta only scans what it added.
+    parser = StreamingParser()
+    events = parser.feed("Intro\n\n```text\n")
+    start = time.perf_counter()
+    for i in range(20000):
+        events.extend(parser.feed(f"line {i}\n\n"))
+    assert time.perf_counter() - start < 5
+    assert "".join(e['content'] for e in events) == "Intro\n\n"
+    events.extend(parser.feed("```\n\nAfter"))
+    events.extend(parser.close())
+    assert "".join(e['content'] for e in events) == parser.response
@@ -0,0 +1,165 @@
+import random
+import time
+import tracemalloc
+
+from smah.runner.response_parser import ResponseParser, ParsedResponse, StreamingParser
+
+# Throughput floors (MB/s) and peak allocation ceilings (multiples of the input size). Set well under
+# what a laptop measures so only real regressions (e.g. a quadratic pass) fail the run.
+BUDGETS = {
+    'escape_response': {'mb_s': 1.0, 'alloc': 24},
+    'to_markdown': {'mb_s': 0.5, 'alloc': 32},
+    'extract_commands': {'mb_s': 0.5, 'alloc': 32},
+    'extract_conditions': {'mb_s': 0.5, 'alloc': 32},
+}
+
+PROSE = [
+    "The quick brown fox jumps over the lazy dog.",
+    "Use `a < b && b > c` to compare & combine.",
+    "Compare x<y, 1<2 and a&b; escape &amp; &lt;tag&gt; entities.",
+    "Some <b>bold</b> and <i>italic</i> text with a <a href=\"https://example.com?a=1&b=2\">link</a>.",
+    "- list item\n- another item",
+    "```bash\nfind . -name '*.py' | xargs grep -n 'x' > out.txt 2>&1\n```",
+    "# Heading",
+    "<div><span>nested <em>html</em></span></div>",
+    "é ü ñ 漢字 emoji 🚀",
+]
+
+
+def exec_block(rng: random.Random, i: int) -> str:
+    command = rng.choice([
+        "ls -la",
+        "make && make test",
+        "sort < in > out",
+        "echo \"$HOME\" | tr a-z A-Z",
+        # Entities written by the model are part of the command, not markup to decode.
+        "echo 'a &amp; b' &lt;x&gt;",
+        "grep '&lt;exec' log &gt; out && cat out",
+    ])
+    title = rng.choice([f"Step {i}", f"Step {i} &amp; check", f"Step {i} &lt;a&gt;"])
+    return (
+        f'<exec shell="bash"><title>{title}</title><purpose>Purpose {i}</purpose>'
+        f'<command>{command}</command></exec>'
+    )
+
+
+def condition_block(i: int) -> str:
+    return (
+        f'<set-condition name="c{i}"><prompt>Pick {i}</prompt><choices>'
+        f'<choice value="a">A</choice><choice value="b" data-user="true">B</choice>'
+        f'</choices></set-condition>'
+    )
+
+
+def thought_block(rng: random.Random) -> str:
+    return f'<cot type="{rng.choice(["thinking", "question", "tangent"])}">{rng.choice(PROSE[:3])}</cot>'
+
+
+def realistic(rng: random.Random, size: int) -> str:
+    parts, length, i = [], 0, 0
+    while length < size:
+        roll = rng.random()
+        if roll < 0.05:
+            part = exec_block(rng, i)
+        elif roll < 0.07:
+            part = condition_block(i)
+        elif roll < 0.1:
+            part = thought_block(rng)
+        else:
+            part = rng.choice(PROSE)
+        parts.append(part)
+        length += len(part) + 2
+        i += 1
+    return "\n\n".join(parts)
+
+
+def corpus() -> dict:
+    rng = random.Random(46)
+    return {
+        'realistic': realistic(rng, 128 * 1024),
+        'html_like': "".join(rng.choice(["<b>", "</b>", "a < b ", "<<>> ", "&& ", "<notatag x=1> ", "text "]) for _ in range(40000)),
+        'many_exec': "\n".join(exec_block(rng, i) for i in range(300)),
+        'plain': "Plain prose without markup. " * 20000,
+        'unclosed': "<exec shell=\"bash\"><title>open" + " <cot>" * 2000 + "x" * 100000,
+        'stray_close': "</b> " + "\n".join(exec_block(rng, i) for i in range(50)),
+    }
+
+
+def measure(function, response: str) -> tuple:
+    """
+    Returns (seconds, peak bytes allocated) for one uncached call. Timed separately from the
+    allocation trace, which slows allocation heavy code.
+    """
+    ParsedResponse.CACHE.clear()
+    tracemalloc.start()
+    function(response)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    ParsedResponse.CACHE.clear()
+    start = time.perf_counter()
+    function(response)
+    return time.perf_counter() - start, peak
+
+
+def test_parser_throughput_budgets():
+    functions = {
+        'escape_response': ResponseParser.escape_response,
+        'to_markdown': ResponseParser.to_markdown,
+        'extract_commands': lambda r: ResponseParser.extract_commands(r),
+        'extract_conditions': ResponseParser.extract_conditions,
+    }
+    report = []
+    for name, response in corpus().items():
+        size = len(response.encode("utf-8"))
+        for function, budget in BUDGETS.items():
+            elapsed, peak = measure(functions[function], response)
+            mb_s = size / (1024 * 1024) / max(elapsed, 1e-9)
+            report.append(f"{name:>10} {function:<18} {mb_s:8.1f} MB/s {peak / size:6.1f}x alloc")
+            assert mb_s >= budget['mb_s'], f"{function} on {name}: {mb_s:.1f} MB/s\n" + "\n".join(report)
+            assert peak <= budget['alloc'] * size, f"{function} on {name}: {peak / size:.1f}x alloc\n" + "\n".join(report)
+
+    # Adversarial input is still parsed completely.
+    responses = corpus()
+    assert len(ResponseParser.extract_commands(responses['many_exec'])) == 300
+    assert len(ResponseParser.extract_commands(responses['stray_close'])) == 50
+
+
+def test_parser_fuzz_round_trip():
+    rng = random.Random(4600)
+    alphabet = PROSE + ["<", ">", "&", "&amp;", "&lt;", "\n", "\n\n", " ", "<b>", "</b>", "<exec", "</cot>", "<br/>"]
+    # Fragments that leave markup unbalanced: lxml repairs them when parsing the whole response,
+    # streamed text is passed through as written.
+    unbalanced = ["<b>", "</b>", "<exec", "</cot>", "<br/>"]
+    for _ in range(300):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        blocks = [exec_block(rng, i) for i in range(rng.randint(0, 3))]
+        response = text + "".join(f"\n{block}\n{rng.choice(PROSE)}" for block in blocks)
+
+        # Escaping is lossless.
+        assert ResponseParser.unescape_response(ResponseParser.escape_response(response)) == response
+
+        # Output is stable: a fresh parse renders and extracts the same.
+        markdown = ParsedResponse(response).markdown()
+        assert ParsedResponse(response).markdown() == markdown
+        assert ResponseParser.to_markdown(response) == markdown
+
+        if "<exec" not in text and "</cot>" not in text:
+            # Every exec block is found, commands come back exactly as written.
+            commands = ResponseParser.extract_commands(response)
+            assert [c['command'] for c in commands] == [b.split("<command>")[1].split("</command>")[0] for b in blocks]
+            assert [c['title'] for c in commands] == [b.split("<title>")[1].split("</title>")[0] for b in blocks]
+
+        if "<" not in response:
+            assert markdown == response
+
+        # Streaming in random chunks renders the same as parsing the whole response.
+        parser = StreamingParser()
+        events, offset = [], 0
+        while offset < len(response):
+            step = rng.randint(1, 64)
+            events.extend(parser.feed(response[offset:offset + step]))
+            offset += step
+        events.extend(parser.close())
+        assert parser.response == response
+        if not any(fragment in text for fragment in unbalanced):
+            assert "".join(e['content'] for e in events if e['type'] == 'markdown') == markdown, response
@@ -0,0 +1,161 @@
+import io
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from smah.console import std_console
+from smah.runner import Runner
+from tests.test_database import database
+
+
+def runner(path) -> Runner:
+    return Runner(SimpleNamespace(database=str(path), transport=None), settings=None)
+
+
+def test_history_thread_respects_token_budget(tmp_path):
+    db = database(tmp_path / "smah.db")
+    db.save_chat("long", SimpleNamespace(), {}, [{'role': 'user', 'content': f"{i}" + "x" * 99} for i in range(10)])
+    session = db.last_session(messages=False)
+    assert session['messages'] is None
+
+    model = SimpleNamespace(context={'window': 100, 'out': 20})
+    history = runner(tmp_path / "smah.db").history_thread(session['id'], model, prefix=[])
+    assert [m['content'][0] for _, m in history] == ["8", "9"]
+
+
+def test_compact_folds_older_turns_into_summary(tmp_path):
+    db = database(tmp_path / "smah.db")
+    db.save_chat("long", SimpleNamespace(), {}, [{'role': 'user', 'content': f"{i}" + "x" * 99} for i in range(10)])
+    session = db.last_session(messages=False)
+
+    r = runner(tmp_path / "smah.db")
+    r.settings = SimpleNamespace(inference=SimpleNamespace(
+        compaction={'enabled': True, 'threshold': 100, 'keep_turns': 1, 'model': None},
+        models={}
+    ))
+    requests = []
+
+    def run(model, thread, **kwargs):
+        requests.append(thread)
+        content = "summary" if len(requests) == 1 else "summary 2"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+    r.run = run
+
+    model = SimpleNamespace(provider="openai", model="test", context={'window': 100000, 'out': 20})
+    assert r.compact(session['id'], model)
+    summary = db.summary(session['id'])
+    assert summary['summary'] == "summary"
+
+    thread, history = r.session_thread(session['id'], model, prefix=[])
+    assert "summary" in thread[0]['content']
+    assert [m['content'][0] for _, m in history] == ["8", "9"]
+
+    # Nothing new past the summary: below threshold, no further request.
+    assert not r.compact(session['id'], model)
+    assert len(requests) == 1
+
+
+def test_compaction_defaults_are_opt_in_and_validated():
+    from smah.settings.inference.configurator import load_defaults
+    from smah.settings.inference.inference import Inference
+
+    assert Inference({}).compaction == Inference.default_compaction()
+    assert Inference.default_compaction()['enabled'] is False
+    assert load_defaults().compaction == Inference.default_compaction()
+    assert Inference({'compaction': {'enabled': True}}).compaction['keep_turns'] == 4
+    for keep_turns in (0, -1, "2"):
+        with pytest.raises(ValueError, match="keep_turns"):
+            Inference({'compaction': {'keep_turns': keep_turns}})
+
+
+def test_stream_response_confirms_commands_while_streaming(tmp_path, monkeypatch):
+    r = runner(tmp_path / "smah.db")
+    r.args.rich = False
+    content = 'Run it:\n\n<exec shell="bash"><title>One</title><command>echo 1</command></exec>\nmore text'
+    streamed = []
+
+    def run(model, thread, stream=False, **kwargs):
+        assert stream
+        for i in range(0, len(content), 5):
+            streamed.append(i + 5)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content[i:i + 5]))])
+    r.run = run
+    confirmed = []
+    r.confirm_command = lambda command: confirmed.append((command['command'], streamed[-1]))
+
+    assert r.stream_response(None, []) == content
+    # Confirmed once the exec block closed, before the rest of the response arrived.
+    assert confirmed[0][0] == "echo 1"
+    assert confirmed[0][1] < len(content)
+
+    # Resumed sessions stream the same way.
+    from rich.prompt import Prompt
+    from smah.settings.inference.inference import Inference
+    from smah.settings.system.system import System
+    from smah.settings.user.user import User
+
+    database(tmp_path / "smah.db").save_chat("resumed", SimpleNamespace(), {}, [{'role': 'user', 'content': "hi"}, {'role': 'assistant', 'content': "hello"}])
+    model = SimpleNamespace(provider="openai", model="test", context={'window': 100000, 'out': 20})
+    r.settings = SimpleNamespace(user=User({}), system=System({}), inference=SimpleNamespace(models={'openai.test': model}, compaction=Inference.default_compaction()))
+    r.args.model, r.args.resume_turns, r.args.pager = None, None, None
+    confirmed.clear()
+    replies = iter(["run it", "exit"])
+    monkeypatch.setattr(Prompt, "ask", lambda *args, **kwargs: next(replies))
+    with pytest.raises(SystemExit):
+        r.resume(1, "resumed", {'model': 'openai.test', 'include_settings': False}, None)
+    assert confirmed[0][0] == "echo 1"
+    assert confirmed[0][1] < len(content)
+    r.db.flush()
+    assert [m['content'] for _, m in r.db.messages(1)][-2:] == ["run it", content]
+
+
+def test_print_history_replays_cached_renders(tmp_path):
+    r = runner(tmp_path / "smah.db")
+    r.args.rich = True
+    database(tmp_path / "smah.db")
+    messages = [{'role': 'user', 'content': "hello"}, {'role': 'assistant', 'content': "# Title\n\n```bash\nls\n```"}]
+    rendered = []
+    print_message = Runner.print_message
+    r.print_message = lambda message, **kwargs: (rendered.append(message), print_message(message, **kwargs))
+
+    r.print_history(messages)
+    assert len(rendered) == 2
+    r.db.flush()
+    keys = [Runner.render_key(m) for m in messages]
+    cached = r.db.rendered(keys, std_console.width)
+    assert set(cached) == set(keys)
+    assert "Title" in cached[keys[1]]
+
+    # Replayed without rendering; a new width renders again.
+    r.print_history(messages)
+    assert len(rendered) == 2
+    assert r.db.rendered(keys, std_console.width + 1) == {}
+
+
+def test_stream_pipe_cancels_when_consumer_exits(tmp_path, monkeypatch):
+    r = runner(tmp_path / "smah.db")
+    closed = []
+
+    def run(model, thread, stream=False, **kwargs):
+        try:
+            for i in range(100):
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=f"line {i}\n"))])
+        finally:
+            closed.append(True)
+    r.run = run
+
+    class Consumer(io.StringIO):
+        # Reads three writes, then goes away like `| head -3`.
+        def write(self, s):
+            if self.getvalue().count("\n") >= 3:
+                raise BrokenPipeError()
+            return super().write(s)
+    consumer = Consumer()
+    monkeypatch.setattr(sys, "stdout", consumer)
+
+    content, complete = r.stream_pipe(None, [])
+    assert not complete
+    assert closed == [True]
+    assert consumer.getvalue() == "line 0\nline 1\nline 2\n"
+    assert content == consumer.getvalue()
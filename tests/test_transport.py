@@ -0,0 +1,105 @@
+from types import SimpleNamespace
+
+from smah.runner.coalescer import fingerprint
+from smah.runner.transport import Cassette, RecordTransport, ReplayTransport, Transport
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+
+def completion(content: str) -> ChatCompletion:
+    return ChatCompletion.model_validate({
+        'id': 'cmpl-1',
+        'object': 'chat.completion',
+        'created': 0,
+        'model': 'gpt-4o',
+        'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}]
+    })
+
+
+def chunk(content: str) -> ChatCompletionChunk:
+    return ChatCompletionChunk.model_validate({
+        'id': 'cmpl-1',
+        'object': 'chat.completion.chunk',
+        'created': 0,
+        'model': 'gpt-4o',
+        'choices': [{'index': 0, 'delta': {'content': content}}]
+    })
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, stream: bool = False, **request):
+        self.calls += 1
+        if stream:
+            return iter([chunk("Hello"), chunk(" World")])
+        return completion("Hello World")
+
+
+def fake_client():
+    completions = FakeCompletions()
+    return completions, lambda: SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+
+def test_record_then_replay(tmp_path):
+    request = {'model': 'gpt-4o', 'messages': [{'role': 'user', 'content': 'hi'}]}
+    key = fingerprint(request)
+    stream_key = fingerprint(request, stream=True)
+    assert stream_key != key
+    completions, client = fake_client()
+
+    recorder = RecordTransport(Cassette(str(tmp_path / "cassette.db")))
+    recorded = recorder.complete(client, request, key)
+    streamed = list(recorder.stream(client, request, stream_key))
+    assert completions.calls == 2
+
+    replayer = ReplayTransport(Cassette(str(tmp_path / "cassette.db")), speed=0)
+    replayed = replayer.complete(client, request, key)
+    assert replayed.choices[0].message.content == recorded.choices[0].message.content
+    chunks = list(replayer.stream(client, request, stream_key))
+    assert [c.choices[0].delta.content for c in chunks] == [c.choices[0].delta.content for c in streamed]
+    assert completions.calls == 2
+
+
+def test_replay_miss(tmp_path):
+    replayer = ReplayTransport(Cassette(str(tmp_path / "cassette.db")), speed=0)
+    try:
+        replayer.complete(None, {}, "missing")
+        assert False, "expected replay miss"
+    except RuntimeError:
+        pass
+
+
+def test_factory_defaults_to_passthrough():
+    transport = Transport.factory(SimpleNamespace(transport=None, cassette=None))
+    assert type(transport) is Transport
+
+
+def test_runner_replays_threads_built_separately(tmp_path):
+    from smah.runner import Runner
+    from smah.runner.prompts import Prompts
+    from smah.settings.system.system import System
+    from smah.settings.user.user import User
+
+    settings = SimpleNamespace(user=User({}), system=System({}))
+    model = SimpleNamespace(provider="openai", model="gpt-4o", context={'out': 64}, settings={}, to_yaml=lambda: {})
+
+    def thread() -> list:
+        # System settings carry live cpu, memory and disk readings, different on every build.
+        return [Prompts.system_settings(settings), Prompts.ack(), Prompts.query_prompt("hi")]
+
+    def runner(mode: str) -> Runner:
+        args = SimpleNamespace(database=str(tmp_path / "smah.db"), transport=mode, cassette=str(tmp_path / "cassette.db"))
+        r = Runner(args, settings=settings)
+        r.completions, r.openai_client = fake_client()
+        return r
+
+    recorder = runner("record")
+    recorded = recorder.run(model, thread())
+    assert recorder.completions.calls == 1
+
+    first, second = thread(), thread()
+    assert first != second
+    replayer = runner("replay")
+    assert replayer.run(model, second).choices[0].message.content == recorded.choices[0].message.content
+    assert replayer.completions.calls == 0